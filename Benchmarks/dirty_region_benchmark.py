@@ -0,0 +1,69 @@
+# Frame time of dragging one shape in a crowded scene, before and after dirty-region invalidation.
+#
+#   python -m Benchmarks.dirty_region_benchmark --items 20000 --frames 200
+#
+# "full" repeats the old behaviour of updating every viewport on each move,
+# "dirty" relies on the damage tracker repainting only the moved shape's bounds.
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import argparse
+import math
+import sys
+import time
+
+from GUI.GridScene import GridScene
+from GUI.GridView import GridView
+from Shapes.Rectangle import Rectangle
+
+def build_scene(count):
+    scene = GridScene()
+    columns = int(math.sqrt(count)) or 1
+    for i in range(count):
+        item = Rectangle(0, 0, 40, 40)
+        item.setPos((i % columns) * 60, (i // columns) * 60)
+        scene.addItem(item)
+    return scene
+
+def run(app, view, item, frames, full_repaint):
+    start_pos = item.pos()
+    timings = []
+    for frame in range(frames):
+        started = time.perf_counter()
+        item.setPos(start_pos + QPointF(10 * (frame % 20), 10 * (frame % 7)))
+        if full_repaint:
+            for v in item.scene().views():
+                v.viewport().update()
+        # Two passes: one flushes the damage tracker, one delivers the paint
+        app.processEvents()
+        app.processEvents()
+        timings.append((time.perf_counter() - started) * 1000)
+    item.setPos(start_pos)
+    timings.sort()
+    return sum(timings) / len(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame time of dragging one shape in a crowded scene.")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    scene = build_scene(args.items)
+    view = GridView()
+    view.setScene(scene)
+    view.resize(1200, 800)
+    view.show()
+    view.fitInView(scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+    app.processEvents()
+
+    items = scene.items()
+    item = items[len(items) // 2]
+    print(f"{args.items} items, {args.frames} frames")
+    print(f"{'mode':<8}{'mean ms':>10}{'median ms':>12}{'p95 ms':>10}")
+    for name, full_repaint in (("full", True), ("dirty", False)):
+        mean, median, p95 = run(app, view, item, args.frames, full_repaint)
+        print(f"{name:<8}{mean:>10.2f}{median:>12.2f}{p95:>10.2f}")
+
+if __name__ == "__main__":
+    main()
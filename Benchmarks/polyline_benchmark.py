@@ -0,0 +1,73 @@
+# Simplification, paint and hit-test times of a Polyline holding a long random track.
+#
+#   python -m Benchmarks.polyline_benchmark --vertices 10000 100000 300000
+#
+# "simplify" runs Douglas-Peucker once for all LOD levels, "paint" renders a view-sized
+# part of the track at each view scale from the cached simplification, next to the
+# vertex count of that level, and "click" tests random points near the track against
+# its segment index.
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from array import array
+import argparse
+import random
+import sys
+import time
+
+from Shapes.Polyline import Polyline, vertex_importance
+
+SCALES = (0.01, 0.1, 1.0, 4.0)
+
+def random_track(count, rng):
+    points = array("d")
+    x = y = 0.0
+    for _ in range(count):
+        x += rng.uniform(-1, 1) + 0.5
+        y += rng.uniform(-1, 1)
+        points.append(x)
+        points.append(y)
+    return points
+
+def main():
+    parser = argparse.ArgumentParser(description="Simplification, paint and hit-test times of long polylines.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    rng = random.Random(1)
+    image = QImage(1600, 1000, QImage.Format.Format_ARGB32_Premultiplied)
+    header = "".join(f"{f'paint {scale}':>16}" for scale in SCALES)
+    print(f"{'vertices':>10}{'simplify ms':>14}{header}{'click ms':>10}")
+    for count in args.vertices:
+        points = random_track(count, rng)
+        item = Polyline(points)
+        started = time.perf_counter()
+        item.importance = vertex_importance(item.points)
+        simplify = (time.perf_counter() - started) * 1000
+
+        paints = []
+        for scale in SCALES:
+            painter = QPainter(image)
+            painter.scale(scale, scale)
+            option = QStyleOptionGraphicsItem()
+            # A view of the image's size at the start of the track
+            option.exposedRect = QRectF(0, -image.height() / scale / 2, image.width() / scale, image.height() / scale)
+            item.paint(painter, option)  # Builds the polygon of the level once
+            started = time.perf_counter()
+            item.paint(painter, option)
+            painter.end()
+            drawn = len(item.lod(item.lod_level(scale))[0])
+            paints.append(f"{(time.perf_counter() - started) * 1000:>9.2f}/{drawn:<6}")
+
+        queries = [QPointF(points[2 * i], points[2 * i + 1] + rng.uniform(-5, 5))
+                   for i in (rng.randrange(count) for _ in range(args.queries))]
+        started = time.perf_counter()
+        for point in queries:
+            item.contains(point)
+        click = (time.perf_counter() - started) * 1000 / len(queries)
+        print(f"{count:>10}{simplify:>14.1f}{''.join(paints)}{click:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Save and load throughput of the shape registry, per shape type and file format.
+#
+#   python -m Benchmarks.serializer_benchmark --count 20000
+#
+# "to_dict" and "from_dict" time the batched registry calls on their own, "json"
+# and "binary" add encoding and writing the file, or reading and decoding it.
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from GUI.BinaryFormat import iter_binary, write_binary
+from Shapes.Registry import SHAPE_TYPES, deserialize_records, load_builtin_shapes, serialize_items
+
+def make_items(tag, count, image_path):
+    cls = SHAPE_TYPES[tag].cls
+    items = []
+    for i in range(count):
+        x, y = (i % 200) * 60, (i // 200) * 60
+        if tag == "line":
+            item = cls(0, 0, 40, 40)
+        elif tag == "text":
+            item = cls(0, 0)
+        elif tag == "image":
+            item = cls(0, 0, 40, 40, image_path)
+        else:
+            item = cls(0, 0, 40, 40)
+        item.setPos(x, y)
+        items.append(item)
+    return items
+
+def per_second(count, started):
+    elapsed = time.perf_counter() - started
+    return count / elapsed if elapsed else float("inf")
+
+def main():
+    parser = argparse.ArgumentParser(description="Save and load throughput per shape type.")
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    load_builtin_shapes()
+    with tempfile.TemporaryDirectory() as folder:
+        image_path = os.path.join(folder, "image.png")
+        image = QImage(64, 64, QImage.Format.Format_ARGB32)
+        image.fill(QColor("#2a82da"))
+        image.save(image_path)
+        json_path = os.path.join(folder, "diagram.json")
+        binary_path = os.path.join(folder, "diagram.dgb")
+
+        print(f"Shapes per second, {args.count} shapes per type")
+        print(f"{'type':<10}{'to_dict':>11}{'json save':>11}{'dgb save':>11}{'from_dict':>11}{'json load':>11}{'dgb load':>11}")
+        for tag in sorted(SHAPE_TYPES):
+            items = make_items(tag, args.count, image_path)
+
+            started = time.perf_counter()
+            records = serialize_items(items)
+            to_dict = per_second(args.count, started)
+
+            started = time.perf_counter()
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(serialize_items(items), f, indent=2)
+            json_save = per_second(args.count, started)
+
+            started = time.perf_counter()
+            write_binary(binary_path, serialize_items(items))
+            binary_save = per_second(args.count, started)
+
+            started = time.perf_counter()
+            deserialize_records(records)
+            from_dict = per_second(args.count, started)
+
+            started = time.perf_counter()
+            with open(json_path, encoding="utf-8") as f:
+                deserialize_records(json.load(f))
+            json_load = per_second(args.count, started)
+
+            started = time.perf_counter()
+            for batch, _ in iter_binary(binary_path):
+                deserialize_records(batch)
+            binary_load = per_second(args.count, started)
+
+            print(f"{tag:<10}{to_dict:>11.0f}{json_save:>11.0f}{binary_save:>11.0f}"
+                  f"{from_dict:>11.0f}{json_load:>11.0f}{binary_load:>11.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Click, rubber-band and items(rect) query times for each GridScene index strategy,
+# and the view paths that go through Qt's own index.
+#
+#   python -m Benchmarks.spatial_index_benchmark --sizes 1000 10000 100000
+#
+# "click" finds the items under a point, "band" selects the items in a viewport-sized
+# rect, "rect" collects the items in a small rect and "move" moves one item and
+# queries its new location, which includes the cost of keeping the index current.
+# "paint" repaints a GridView's viewport at a random place, "press" sends a real
+# mouse press and release to the view, and "drag" presses on a shape, drags it
+# over 5 mouse moves and releases it.
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import argparse
+import math
+import random
+import sys
+import time
+
+from GUI.GridScene import GridScene, INDEX_STRATEGIES
+from GUI.GridView import GridView
+from Shapes.Rectangle import Rectangle
+
+SPACING = 60
+VIEW_SIZE = QSize(1200, 800)
+DRAG_STEPS = 5
+
+def build_scene(count, strategy):
+    scene = GridScene()
+    scene.set_index_strategy(strategy)
+    columns = int(math.sqrt(count)) or 1
+    with scene.bulk_update():
+        for i in range(count):
+            item = Rectangle(0, 0, 40, 40)
+            item.setPos((i % columns) * SPACING, (i // columns) * SPACING)
+            scene.addItem(item)
+    return scene, columns * SPACING
+
+def time_queries(query, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        query(*args)
+    return (time.perf_counter() - started) * 1000 / len(args_list)
+
+def send_mouse(view, kind, pos, buttons):
+    event = QMouseEvent(kind, QPointF(pos), QPointF(view.viewport().mapToGlobal(pos)), Qt.MouseButton.LeftButton,
+                        buttons, Qt.KeyboardModifier.NoModifier)
+    QApplication.sendEvent(view.viewport(), event)
+
+def click_view(view, pos):
+    send_mouse(view, QEvent.Type.MouseButtonPress, pos, Qt.MouseButton.LeftButton)
+    send_mouse(view, QEvent.Type.MouseButtonRelease, pos, Qt.MouseButton.NoButton)
+
+def drag_view(view, item):
+    pos = view.mapFromScene(item.sceneBoundingRect().center())
+    send_mouse(view, QEvent.Type.MouseButtonPress, pos, Qt.MouseButton.LeftButton)
+    for step in range(1, DRAG_STEPS + 1):
+        send_mouse(view, QEvent.Type.MouseMove, pos + QPoint(step * 7, step * 5), Qt.MouseButton.LeftButton)
+    send_mouse(view, QEvent.Type.MouseButtonRelease, pos + QPoint(DRAG_STEPS * 7, DRAG_STEPS * 5),
+               Qt.MouseButton.NoButton)
+    QApplication.processEvents()
+
+def paint_view(view, center):
+    view.centerOn(center)
+    view.viewport().repaint()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query times for each GridScene index strategy.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    rng = random.Random(1)
+    print(f"{'items':>8} {'index':<6}{'build ms':>10}{'click ms':>10}{'band ms':>10}{'rect ms':>10}{'move ms':>10}"
+          f"{'paint ms':>10}{'press ms':>10}{'drag ms':>10}")
+    for size in args.sizes:
+        for strategy in INDEX_STRATEGIES:
+            started = time.perf_counter()
+            scene, extent = build_scene(size, strategy)
+            # Qt moves new items into its BSP tree from the event loop, and the
+            # first query pays for any lazily built index
+            app.processEvents()
+            scene.items_at(QPointF(0, 0))
+            build = (time.perf_counter() - started) * 1000
+
+            points = [(QPointF(rng.uniform(0, extent), rng.uniform(0, extent)),) for _ in range(args.queries)]
+            click = time_queries(scene.items_at, points)
+
+            bands = [QRectF(rng.uniform(0, extent), rng.uniform(0, extent), 1200, 800) for _ in range(20)]
+            band = time_queries(lambda rect: scene.select_items(
+                scene.items_in_rect(rect, Qt.ItemSelectionMode.IntersectsItemShape)), [(r,) for r in bands])
+
+            rects = [(QRectF(rng.uniform(0, extent), rng.uniform(0, extent), 200, 200),) for _ in range(args.queries)]
+            rect = time_queries(scene.items_in_rect, rects)
+
+            items = list(scene.item_order)
+            def move_and_query(item, pos):
+                item.setPos(pos)
+                app.processEvents()
+                scene.items_at(pos + QPointF(20, 20))
+            moves = [(rng.choice(items), QPointF(rng.uniform(0, extent), rng.uniform(0, extent)))
+                     for _ in range(args.queries)]
+            move = time_queries(move_and_query, moves)
+
+            view = GridView()
+            view.setScene(scene)
+            view.resize(VIEW_SIZE)
+            view.show()
+            app.processEvents()
+            views = max(5, args.queries // 10)
+            centers = [(QPointF(rng.uniform(0, extent), rng.uniform(0, extent)),) for _ in range(views)]
+            paint = time_queries(lambda center: paint_view(view, center), centers)
+            presses = [(QPoint(rng.randrange(VIEW_SIZE.width()), rng.randrange(VIEW_SIZE.height())),)
+                       for _ in range(args.queries)]
+            press = time_queries(lambda pos: click_view(view, pos), presses)
+            def drag(item):
+                view.centerOn(item)
+                drag_view(view, item)
+            drag_ms = time_queries(drag, [(rng.choice(items),) for _ in range(views)])
+            print(f"{size:>8} {strategy:<6}{build:>10.1f}{click:>10.3f}{band:>10.3f}{rect:>10.3f}{move:>10.3f}"
+                  f"{paint:>10.3f}{press:>10.3f}{drag_ms:>10.3f}")
+            view.close()
+            view.setScene(None)
+            scene.clear()
+
+if __name__ == "__main__":
+    main()
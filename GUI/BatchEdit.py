@@ -0,0 +1,308 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from GUI.GridScene import GridScene
+from GUI.Damage import damage_tracker
+from GUI.SceneLoader import FRAME_BUDGET_MS
+from collections import deque
+import math
+import time
+
+MERGE_WINDOW_MS = 1000  # Edits of the same property and items this close together are one undo step
+EDIT_CHUNK = 50  # Targets written between two checks of the frame budget
+VIEW_MARGIN = 2  # Viewport pixels a view repaints around a changed rect, for antialiasing
+
+def undo_stack(scene):
+    """
+    Returns the undo stack of the given scene, creating it on first use.
+    """
+    stack = getattr(scene, "undo_stack", None)
+    if stack is None:
+        stack = QUndoStack(scene)
+        scene.undo_stack = stack
+    return stack
+
+def batch_writer(scene):
+    """
+    Returns the BatchWriter of the given scene, creating it on first use.
+    """
+    writer = getattr(scene, "batch_writer", None)
+    if writer is None:
+        writer = BatchWriter(scene)
+        scene.batch_writer = writer
+    return writer
+
+def shown_rects(scene):
+    # The scene rects shown in the views of a scene, with the margin they repaint around changes
+    rects = []
+    for view in scene.views():
+        rect = view.viewport().rect().adjusted(-VIEW_MARGIN, -VIEW_MARGIN, VIEW_MARGIN, VIEW_MARGIN)
+        rects.append(view.mapToScene(rect).boundingRect())
+    return rects
+
+class BatchPass:
+    """
+    One direction of a PropertyBatch: function(item, value_of(target)) for each of
+    its targets, a chunk at a time. The targets shown in the scene's views come
+    first. With read, the old value of each target is taken when the pass first
+    reaches it, without read only the targets an earlier pass reached are written.
+    """
+    def __init__(self, command, function, value_of, read=None):
+        # The frame budget of the first step includes ordering the targets
+        self.clock = QElapsedTimer()
+        self.clock.start()
+        self.command = command
+        self.function = function
+        self.value_of = value_of
+        self.read = read
+        targets = command.targets
+        if read is None:
+            # Shapes the edit never reached keep their values
+            targets = [target for target in targets if target in command.old_values]
+        self.targets, self.shown = command.shown_first(targets)
+        self.done = 0
+        self.written = []
+
+    def shown_left(self):
+        return self.done < self.shown
+
+    def step(self, clock, budget_ms):
+        """
+        Writes chunks of targets until the budget is spent. Returns True once all are written.
+        """
+        targets = self.targets
+        while self.done < len(targets):
+            if clock.elapsed() >= budget_ms:
+                return False
+            chunk = targets[self.done:self.done + EDIT_CHUNK]
+            self.done += len(chunk)
+            self.written.extend(self.command.write_chunk(chunk, self.function, self.value_of, self.read))
+        return True
+
+    def close(self):
+        # The journal records the targets written by the pass as one batch, also when it was canceled
+        scene = self.command.scene
+        if self.written and isinstance(scene, GridScene):
+            scene.items_changed(self.written)
+        self.written = []
+
+class BatchWriter(QObject):
+    """
+    Writes the passes of a scene's batch edits in order. Each call writes until the
+    frame budget is spent and a zero timer continues with the rest, so an edit of
+    many shapes does not hold the GUI thread for longer than a frame. The views
+    do not repaint until the shown targets are written, which puts each edit on
+    screen in one repaint.
+    """
+    applied = pyqtSignal()  # Every pending pass is written
+
+    def __init__(self, scene):
+        super().__init__(scene)
+        self.scene = scene
+        self.passes = deque()
+        self.frozen = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.step)
+
+    def run(self, batch_pass):
+        # A new pass of a command replaces its unfinished one
+        self.drop(batch_pass.command)
+        self.passes.append(batch_pass)
+        self.step(clock=batch_pass.clock)
+
+    def pending(self):
+        return bool(self.passes)
+
+    def finish(self):
+        # Writes every pending pass at once, e.g. before the scene is saved
+        if self.passes:
+            self.step(math.inf)
+
+    def cancel(self):
+        # Leaves the pending passes unwritten, e.g. when the document is replaced
+        self.drop(None)
+        self.step()
+
+    def drop(self, command):
+        for batch_pass in [batch_pass for batch_pass in self.passes if command in (None, batch_pass.command)]:
+            batch_pass.close()
+            self.passes.remove(batch_pass)
+
+    def step(self, budget_ms=FRAME_BUDGET_MS, clock=None):
+        if clock is None:
+            clock = QElapsedTimer()
+            clock.start()
+        passes = self.passes
+        # The views thaw a step after the shown targets are written, once their updates are queued
+        self.freeze(any(batch_pass.shown_left() for batch_pass in passes))
+        while passes and passes[0].step(clock, budget_ms):
+            passes.popleft().close()
+        if any(batch_pass.shown_left() for batch_pass in passes):
+            self.freeze(True)
+        if passes or self.frozen:
+            if not self.timer.isActive():
+                self.timer.start(0)
+            return
+        self.timer.stop()
+        self.applied.emit()
+
+    def freeze(self, frozen):
+        # Re-enabling updates repaints the whole viewport once
+        if frozen != self.frozen:
+            self.frozen = frozen
+            for view in self.scene.views():
+                view.viewport().setUpdatesEnabled(not frozen)
+
+class PropertyBatch(QUndoCommand):
+    """
+    One property edit of many items. read(item) takes an item's old value,
+    write(item, value) sets the new value and restore(item, old value) undoes it.
+    Each direction runs as one BatchPass over the items: only the items whose
+    bounds changed are re-indexed, their damage is published per chunk and the
+    journal records the pass as one edit. A virtualized scene recycles items for
+    other shapes, so there the edit targets entry ids, and the shapes that are
+    not materialized are edited by their records.
+    """
+    def __init__(self, scene, text, items, read, write, value, restore=None, geometry=False, entry_ids=()):
+        super().__init__(text)
+        self.scene = scene
+        self.items = items
+        self.entry_ids = entry_ids
+        self.read = read
+        self.write = write
+        self.restore = restore or write
+        self.value = value
+        self.geometry = geometry
+        self.virtualizer = virtualizer = getattr(scene, "virtualizer", None)
+        if virtualizer is not None:
+            ids = virtualizer.ids
+            self.targets = list(dict.fromkeys([ids.get(item, item) for item in items] + list(entry_ids)))
+        else:
+            self.targets = items
+        self.old_values = {}  # Target -> its value before the edit, taken when the edit first writes it
+        self.amended_at = time.monotonic()
+
+    def continues(self, text, items, entry_ids=()):
+        # Slider drags amend the last step instead of pushing one per value
+        return (text == self.text() and items == self.items and list(entry_ids) == list(self.entry_ids)
+                and (time.monotonic() - self.amended_at) * 1000 < MERGE_WINDOW_MS)
+
+    def amend(self, value):
+        self.value = value
+        self.amended_at = time.monotonic()
+        self.redo()
+
+    def live_virtualizer(self):
+        # Entry ids lose their meaning once the scene shows another document
+        virtualizer = self.virtualizer
+        return virtualizer if virtualizer is not None and self.scene.virtualizer is virtualizer else None
+
+    def shown_first(self, targets):
+        """
+        Orders the targets shown in a view of the scene first. Returns the targets
+        and how many of them are shown.
+        """
+        scene = self.scene
+        if len(targets) <= EDIT_CHUNK or not scene.views():
+            return targets, len(targets)
+        shown_items = set()
+        for rect in shown_rects(scene):
+            shown_items.update(scene.items(rect, Qt.ItemSelectionMode.IntersectsItemBoundingRect))
+        virtualizer = self.live_virtualizer()
+        if virtualizer is not None:
+            ids = virtualizer.ids
+            shown_items = {ids.get(item, item) for item in shown_items}
+        shown = [target for target in targets if target in shown_items]
+        hidden = [target for target in targets if target not in shown_items]
+        return shown + hidden, len(shown)
+
+    def resolve(self, targets):
+        """
+        The targets still in the scene: (target, item) pairs for the items and the
+        entry ids of shapes that are not materialized. Items removed since the
+        edit are left alone.
+        """
+        scene = self.scene
+        virtualizer = self.live_virtualizer()
+        item_order = getattr(scene, "item_order", None)
+        items, entry_ids = [], []
+        for target in targets:
+            if isinstance(target, int):
+                if virtualizer is None or target >= len(virtualizer.document) \
+                        or virtualizer.document.entries[target] is None:
+                    continue
+                item = virtualizer.items.get(target)
+                if item is None:
+                    entry_ids.append(target)
+                    continue
+            else:
+                item = target
+                if not (item in item_order if item_order is not None else item.scene() is scene):
+                    continue
+            items.append((target, item))
+        return items, entry_ids
+
+    def write_chunk(self, targets, function, value_of, read=None):
+        """
+        Writes one chunk of a pass. Returns the written items and entry ids.
+        """
+        items, entry_ids = self.resolve(targets)
+        old_values = self.old_values
+        if read is not None:
+            for target, item in items:
+                if target not in old_values:
+                    old_values[target] = read(item)
+        written = [item for _, item in items]
+        if written:
+            self.write_items(written, function, [value_of(target) for target, _ in items])
+        if entry_ids:
+            edited = self.virtualizer.edit_records(entry_ids, function, map(value_of, entry_ids), read)
+            for entry_id, old_value in zip(entry_ids, edited):
+                old_values.setdefault(entry_id, old_value)
+        return written + entry_ids
+
+    def write_items(self, items, function, values):
+        if not self.geometry:
+            for item, value in zip(items, values):
+                function(item, value)
+            return
+        scene = self.scene
+        old_rects = list(map(QGraphicsItem.sceneBoundingRect, items))
+        for item, value in zip(items, values):
+            function(item, value)
+        # The items repaint themselves, the damage covers the area the resized ones left. Only
+        # the shown part counts, a union with shapes outside the views would repaint them whole.
+        shown = shown_rects(scene)
+        resized, damage = [], QRectF()
+        for item, old_rect in zip(items, old_rects):
+            rect = item.sceneBoundingRect()
+            if rect != old_rect:
+                resized.append(item)
+                rect = rect.united(old_rect)
+                if any(rect.intersects(view_rect) for view_rect in shown):
+                    damage = damage.united(rect)
+        if isinstance(scene, GridScene):
+            scene.items_resized(resized)
+        if not damage.isEmpty():
+            damage_tracker(scene).add(damage)
+
+    def redo(self):
+        batch_writer(self.scene).run(BatchPass(self, self.write, lambda target: self.value, self.read))
+
+    def undo(self):
+        batch_writer(self.scene).run(BatchPass(self, self.restore, self.old_values.__getitem__))
+
+def edit_items(scene, text, items, read, write, value, restore=None, geometry=False, entry_ids=()):
+    """
+    Sets a property of every item as one undoable step of the scene's undo stack.
+    entry_ids adds shapes of a virtualized scene that may not be materialized.
+    """
+    items = list(items)
+    stack = undo_stack(scene)
+    top = stack.command(stack.count() - 1) if stack.count() and stack.index() == stack.count() else None
+    if isinstance(top, PropertyBatch) and top.continues(text, items, entry_ids):
+        top.amend(value)
+        return top
+    command = PropertyBatch(scene, text, items, read, write, value, restore, geometry, entry_ids)
+    stack.push(command)
+    return command
@@ -0,0 +1,303 @@
+from array import array
+import json
+import mmap
+import struct
+import sys
+
+BINARY_EXTENSION = ".dgb"
+MAGIC = b"DGB\x00"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<4sII")  # Magic, format version, header length
+ALIGNMENT = 8
+BATCH_SIZE = 500  # Records decoded per batch when streaming a document
+
+# Column kinds
+KIND_F64 = "f64"
+KIND_I64 = "i64"
+KIND_STR = "str"  # Dictionary-encoded strings, colors and paths
+KIND_JSON = "json"  # Dictionary-encoded JSON text for anything else
+TYPECODES = {KIND_F64: "d", KIND_I64: "q", KIND_STR: "i", KIND_JSON: "i"}
+
+def is_binary_path(path):
+    return path.lower().endswith(BINARY_EXTENSION)
+
+def column_kind(values):
+    """
+    Picks the narrowest column kind that holds every present value.
+    """
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool) or value is None:
+            return KIND_JSON
+        if isinstance(value, int):
+            kinds.add(KIND_I64 if -(1 << 63) <= value < (1 << 63) else KIND_JSON)
+        elif isinstance(value, float):
+            kinds.add(KIND_F64)
+        elif isinstance(value, str):
+            kinds.add(KIND_STR)
+        else:
+            return KIND_JSON
+    if kinds <= {KIND_I64}:
+        return KIND_I64
+    if kinds == {KIND_F64, KIND_I64} or kinds == {KIND_F64}:
+        return KIND_F64
+    if kinds == {KIND_STR}:
+        return KIND_STR
+    return KIND_JSON
+
+def _aligned(offset):
+    return offset + (-offset % ALIGNMENT)
+
+def write_binary(path, records):
+    """
+    Writes shape records column by column: numbers as fixed-width arrays,
+    strings as indices into one shared string table.
+    """
+    count = len(records)
+    names = {}
+    for record in records:
+        for name in record:
+            names.setdefault(name, None)
+
+    strings = {}
+    columns = []
+    sections = []
+    for name in names:
+        present = [name in record for record in records]
+        kind = column_kind(record[name] for record in records if name in record)
+        if kind == KIND_F64:
+            values = array("d", (float(record.get(name, 0.0)) for record in records))
+        elif kind == KIND_I64:
+            values = array("q", (record.get(name, 0) for record in records))
+        else:
+            values = array("i")
+            for record in records:
+                if name not in record:
+                    values.append(-1)
+                    continue
+                value = record[name]
+                if kind == KIND_JSON:
+                    value = json.dumps(value)
+                index = strings.get(value)
+                if index is None:
+                    index = strings[value] = len(strings)
+                values.append(index)
+        column = {"name": name, "kind": kind}
+        sections.append((column, "values", values))
+        if not all(present):
+            sections.append((column, "mask", array("b", present)))
+        if kind == KIND_F64:
+            # Ints stored next to floats are flagged, so they come back as ints
+            ints = array("b", (isinstance(record.get(name), int) for record in records))
+            if any(ints):
+                sections.append((column, "ints", ints))
+        columns.append(column)
+
+    # String table: end offsets followed by one UTF-8 blob
+    blob = bytearray()
+    ends = array("q")
+    for value in strings:
+        blob += value.encode("utf-8")
+        ends.append(len(blob))
+    table = {"count": len(strings), "size": len(blob)}
+    sections.append((table, "ends", ends))
+
+    # Lay the sections out 8-byte aligned, relative to the start of the data
+    offset = 0
+    for owner, key, values in sections:
+        offset = _aligned(offset)
+        owner[key] = offset
+        offset += len(values) * values.itemsize
+    table["blob"] = offset
+
+    header = json.dumps({"version": FORMAT_VERSION, "count": count, "columns": columns, "strings": table}).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * (-f.tell() % ALIGNMENT))
+        base = f.tell()
+        for _, _, values in sections:
+            f.write(b"\0" * (-(f.tell() - base) % ALIGNMENT))
+            # Arrays are stored little-endian so they can be cast in place when mapped
+            if sys.byteorder != "little":
+                values = array(values.typecode, values)
+                values.byteswap()
+            values.tofile(f)
+        f.write(blob)
+
+class BinaryDocument:
+    """
+    A binary diagram opened by memory-mapping the file. Only the header is parsed
+    up front, records are decoded from the mapped columns when they are asked for.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("The binary diagram file is empty")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        view = self.view = memoryview(self.map)
+        if len(view) < PREFIX.size:
+            raise ValueError("Not a binary diagram file")
+        magic, version, header_size = PREFIX.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a binary diagram file")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Binary diagram format version {version} is not supported")
+        header = json.loads(bytes(view[PREFIX.size:PREFIX.size + header_size]))
+        base = PREFIX.size + header_size
+        base += -base % ALIGNMENT
+        self.count = header["count"]
+        self.columns = []
+        for column in header["columns"]:
+            values = self._array(view, base + column["values"], TYPECODES[column["kind"]])
+            mask = ints = None
+            if "mask" in column:
+                mask = self._array(view, base + column["mask"], "b")
+            if "ints" in column:
+                ints = self._array(view, base + column["ints"], "b")
+            self.columns.append((column["name"], column["kind"], values, mask, ints))
+        self.column_map = {name: (kind, values, mask, ints) for name, kind, values, mask, ints in self.columns}
+        table = header["strings"]
+        self.string_ends = self._array(view, base + table["ends"], "q", table["count"])
+        blob_start = base + table["blob"]
+        self.string_blob = view[blob_start:blob_start + table["size"]]
+        self.strings = [None] * table["count"]
+
+    def _array(self, view, offset, typecode, count=None):
+        if count is None:
+            count = self.count
+        size = array(typecode).itemsize
+        section = view[offset:offset + count * size]
+        if len(section) != count * size:
+            raise ValueError("The binary diagram file is truncated")
+        if sys.byteorder != "little":
+            values = array(typecode, section.tobytes())
+            values.byteswap()
+            return values
+        return section.cast(typecode)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Memoryviews into the map must be released before the map can close
+        for _, _, values, mask, ints in getattr(self, "columns", ()):
+            for section in (values, mask, ints):
+                if isinstance(section, memoryview):
+                    section.release()
+        self.columns = []
+        self.column_map = {}
+        for name in ("string_ends", "string_blob", "view"):
+            section = getattr(self, name, None)
+            if isinstance(section, memoryview):
+                section.release()
+            setattr(self, name, None)
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def string(self, index):
+        value = self.strings[index]
+        if value is None:
+            start = self.string_ends[index - 1] if index else 0
+            value = self.strings[index] = str(self.string_blob[start:self.string_ends[index]], "utf-8")
+        return value
+
+    def value(self, name, index, default=None):
+        """
+        One field of one record, read straight from its column.
+        """
+        column = self.column_map.get(name)
+        if column is None:
+            return default
+        kind, values, mask, ints = column
+        if mask is not None and not mask[index]:
+            return default
+        value = values[index]
+        if kind == KIND_STR:
+            return self.string(value)
+        if kind == KIND_JSON:
+            return json.loads(self.string(value))
+        if ints is not None and ints[index]:
+            return int(value)
+        return value
+
+    def _decode(self, kind, values, ints=None):
+        if ints is not None:
+            return [int(value) if is_int else value for value, is_int in zip(values, ints)]
+        if kind == KIND_STR:
+            return [self.string(index) if index >= 0 else None for index in values]
+        if kind == KIND_JSON:
+            return [json.loads(self.string(index)) if index >= 0 else None for index in values]
+        return values
+
+    def records(self, start, stop):
+        """
+        Decodes records [start, stop) one column at a time.
+        """
+        stop = min(stop, self.count)
+        records = [{} for _ in range(max(0, stop - start))]
+        for name, kind, values, mask, ints in self.columns:
+            column = self._decode(kind, values[start:stop].tolist(), ints[start:stop].tolist() if ints is not None else None)
+            if mask is None:
+                for record, value in zip(records, column):
+                    record[name] = value
+            else:
+                for record, value, present in zip(records, column, mask[start:stop].tolist()):
+                    if present:
+                        record[name] = value
+        return records
+
+    def record(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("record index out of range")
+        return self.records(index, index + 1)[0]
+
+    def iter_batches(self, batch_size=BATCH_SIZE):
+        """
+        Yields (records, records_read) batches, in the shape the scene loader expects.
+        """
+        for start in range(0, self.count, batch_size):
+            batch = self.records(start, start + batch_size)
+            yield batch, start + len(batch)
+
+class RecordView:
+    """
+    Dict-like read access to one record of a BinaryDocument without decoding it,
+    for code that only calls get(), like the shapes' record_bounds().
+    """
+    __slots__ = ("document", "index")
+
+    def __init__(self, document, index=0):
+        self.document = document
+        self.index = index
+
+    def get(self, name, default=None):
+        return self.document.value(name, self.index, default)
+
+    def record(self):
+        return self.document.record(self.index)
+
+def iter_binary(path, batch_size=BATCH_SIZE):
+    """
+    Streams the records of a binary diagram file, closing the mapping when done.
+    """
+    with BinaryDocument(path) as document:
+        yield from document.iter_batches(batch_size)
@@ -0,0 +1,229 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from GUI.BinaryFormat import BATCH_SIZE
+import GUI.Grid
+
+BUNDLE_EXTENSION = ".dgz"
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DOCUMENT_NAME = "document.json"
+THUMBNAIL_NAME = "thumbnail.png"
+IMAGE_FOLDER = "images/"
+RENDITION_FOLDER = "renditions/"
+THUMBNAIL_SIZE = 256  # Longest side of the document preview in pixels
+HASH_CHUNK_SIZE = 1 << 20
+HASH_CACHE_SIZE = 4096  # File hashes remembered, the least recently used go first
+RENDITION_CACHE_SIZE = 4096  # Renditions of opened bundles remembered, likewise
+
+# Both are filled and read by pool workers as well as the GUI thread
+_cache_lock = threading.Lock()
+_hashes = OrderedDict()  # (path, mtime_ns, size) -> SHA-256 of the file
+_renditions = OrderedDict()  # (image path, width, height) -> path of the image pre-scaled to that size
+
+def _recall(cache, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _remember(cache, key, value, size):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+def is_bundle_path(path):
+    return path.lower().endswith(BUNDLE_EXTENSION)
+
+def bundle_cache_folder():
+    # Images of opened bundles are extracted here once, named by their content hash
+    folder = os.path.join(QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation), "bundle-images")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def file_hash(path):
+    """
+    Returns the SHA-256 of a file, memoized per path, modification time and size.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _recall(_hashes, key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _remember(_hashes, key, digest, HASH_CACHE_SIZE)
+    return digest
+
+def rendition_for(image_path, width, height):
+    """
+    Returns a file holding image_path already scaled to width x height, if an
+    opened bundle provided one.
+    """
+    return _recall(_renditions, (image_path, int(width), int(height)))
+
+def drop_renditions(image_path):
+    # A rendition shows the old content of a file that changed on disk
+    with _cache_lock:
+        for key in [key for key in _renditions if key[0] == image_path]:
+            del _renditions[key]
+
+def _image_sizes(records):
+    # Sizes each image is shown at, keyed by the image's path
+    sizes = {}
+    for record in records:
+        path = record.get("image_path") if record.get("type") == "image" else None
+        if path and os.path.isfile(path):
+            sizes.setdefault(path, set()).add((int(record.get("width", 100)), int(record.get("height", 100))))
+    return sizes
+
+def _png_bytes(image):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    buffer.close()
+    return bytes(data)
+
+def render_thumbnail(scene, size=THUMBNAIL_SIZE):
+    """
+    Renders the scene's items without the grid into a PNG of at most size pixels
+    on its longest side. Runs on the GUI thread, as it paints the items.
+    """
+    source = scene.itemsBoundingRect()
+    if source.isEmpty():
+        return None
+    scale = size / max(source.width(), source.height())
+    image = QImage(max(1, round(source.width() * scale)), max(1, round(source.height() * scale)),
+                   QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    grid_enabled = GUI.Grid.IS_GRID_ENABLED
+    GUI.Grid.IS_GRID_ENABLED = False
+    painter = QPainter(image)
+    try:
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        scene.render(painter, QRectF(image.rect()), source)
+    finally:
+        painter.end()
+        GUI.Grid.IS_GRID_ENABLED = grid_enabled
+    return _png_bytes(image)
+
+def write_bundle(path, records, thumbnail=None):
+    """
+    Writes records into a zip bundle together with the images they reference.
+    Each image is stored once under its content hash, along with a rendition for
+    every other size the document shows it at. Image records point at the stored
+    image instead of the original file.
+    """
+    members = {}  # Original path -> member name of the stored image
+    manifest_images = {}
+    with zipfile.ZipFile(path, "w") as bundle:
+        for image_path, sizes in _image_sizes(records).items():
+            digest = file_hash(image_path)
+            name = IMAGE_FOLDER + digest + os.path.splitext(image_path)[1].lower()
+            members[image_path] = name
+            if name in manifest_images:
+                # The same content under another path
+                entry = manifest_images[name]
+            else:
+                # Images are compressed already, so they are stored as they are
+                bundle.write(image_path, name, zipfile.ZIP_STORED)
+                entry = manifest_images[name] = {"sha256": digest, "renditions": []}
+            source_size = QImageReader(image_path).size()
+            for width, height in sorted(sizes):
+                rendition = f"{RENDITION_FOLDER}{digest}-{width}x{height}.png"
+                if any(existing[2] == rendition for existing in entry["renditions"]):
+                    continue
+                if not source_size.isValid() or (source_size.width() <= width and source_size.height() <= height):
+                    continue
+                # Decode straight at the rendition size, which also keeps huge scans out of memory
+                reader = QImageReader(image_path)
+                reader.setScaledSize(source_size.scaled(QSize(width, height), Qt.AspectRatioMode.KeepAspectRatio))
+                scaled = reader.read()
+                if scaled.isNull():
+                    break
+                bundle.writestr(rendition, _png_bytes(scaled), zipfile.ZIP_STORED)
+                entry["renditions"].append([width, height, rendition])
+        document = []
+        for record in records:
+            name = members.get(record.get("image_path")) if record.get("type") == "image" else None
+            if name is not None:
+                record = dict(record, image_path=name)
+            document.append(record)
+        bundle.writestr(DOCUMENT_NAME, json.dumps(document, separators=(",", ":")), zipfile.ZIP_DEFLATED)
+        if thumbnail is not None:
+            bundle.writestr(THUMBNAIL_NAME, thumbnail, zipfile.ZIP_STORED)
+        manifest = {"version": BUNDLE_VERSION, "count": len(document), "images": manifest_images,
+                    "thumbnail": THUMBNAIL_NAME if thumbnail is not None else None}
+        bundle.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+
+def read_manifest(bundle):
+    manifest = json.loads(bundle.read(MANIFEST_NAME))
+    if manifest.get("version", 1) > BUNDLE_VERSION:
+        raise ValueError("The bundle was written by a newer version of the editor")
+    return manifest
+
+def bundle_record_count(path):
+    with zipfile.ZipFile(path) as bundle:
+        return read_manifest(bundle)["count"]
+
+def read_thumbnail(path):
+    """
+    Returns the document preview of a bundle as a QImage, or None.
+    """
+    with zipfile.ZipFile(path) as bundle:
+        name = read_manifest(bundle).get("thumbnail")
+        if not name:
+            return None
+        image = QImage.fromData(bundle.read(name), "PNG")
+    return None if image.isNull() else image
+
+def _extract(bundle, name, folder):
+    # Content-addressed names never change meaning, so an existing file is reused as it is
+    target = os.path.join(folder, os.path.basename(name))
+    if not os.path.exists(target) or os.path.getsize(target) != bundle.getinfo(name).file_size:
+        temp_path = target + ".tmp"
+        with bundle.open(name) as source, open(temp_path, "wb") as f:
+            while chunk := source.read(HASH_CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(temp_path, target)
+    return target
+
+def iter_bundle(path, batch_size=BATCH_SIZE):
+    """
+    Streams the records of a bundle as (records, records_read) batches. The bundle's
+    images are extracted to the cache folder first and image records are pointed
+    at them, with their renditions registered for rendition_for().
+    """
+    folder = bundle_cache_folder()
+    with zipfile.ZipFile(path) as bundle:
+        manifest = read_manifest(bundle)
+        paths = {}
+        for name, entry in manifest.get("images", {}).items():
+            image_path = _extract(bundle, name, folder)
+            paths[name] = image_path
+            stat = os.stat(image_path)
+            _remember(_hashes, (image_path, stat.st_mtime_ns, stat.st_size), entry["sha256"], HASH_CACHE_SIZE)
+            for width, height, rendition in entry.get("renditions", ()):
+                _remember(_renditions, (image_path, width, height), _extract(bundle, rendition, folder),
+                          RENDITION_CACHE_SIZE)
+        records = json.loads(bundle.read(DOCUMENT_NAME))
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        for record in batch:
+            image_path = paths.get(record.get("image_path")) if record.get("type") == "image" else None
+            if image_path is not None:
+                record["image_path"] = image_path
+        yield batch, start + len(batch)
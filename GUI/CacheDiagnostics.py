@@ -0,0 +1,84 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from Shapes.Animation import FRAME_CACHE
+from Shapes.CachePolicy import CACHE_MODE_NAMES, render_cache_policy
+from Shapes.ImageCache import PIXMAP_CACHE
+from Shapes.TilePyramid import TILE_CACHE
+
+REFRESH_MS = 1000  # The dock refreshes this often while it is shown
+ITEM_COLUMNS = ("Shape", "Position", "Cache", "Paint ms", "Rebuilds", "Memory")
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+class CacheDiagnosticsDock(QDockWidget):
+    """
+    Lists the items the render cache policy of a scene has cached, with their
+    paint cost and cache memory, next to the shared image caches.
+    """
+    def __init__(self, parent=None, scene=None):
+        super().__init__("Render Cache", parent)
+        self.scene = scene
+        self.main_widget = QWidget()
+        self.layout = QVBoxLayout()
+
+        self.summary_label = QLabel()
+        self.layout.addWidget(self.summary_label)
+        self.item_table = QTableWidget(0, len(ITEM_COLUMNS))
+        self.item_table.setHorizontalHeaderLabels(ITEM_COLUMNS)
+        self.item_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.item_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.item_table.verticalHeader().setVisible(False)
+        self.item_table.horizontalHeader().setStretchLastSection(True)
+        self.layout.addWidget(self.item_table)
+
+        self.shared_label = QLabel()
+        self.layout.addWidget(self.shared_label)
+        self.main_widget.setLayout(self.layout)
+        self.setWidget(self.main_widget)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.visibility_changed)
+
+    def visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        policy = render_cache_policy(self.scene)
+        summary = policy.summary()
+        state = "on" if summary["enabled"] else "off"
+        self.summary_label.setText(
+            f"Adaptive caching {state}: {summary['cached']} of {summary['measured']} measured items cached, "
+            f"{format_bytes(summary['used'])} of {format_bytes(summary['budget'])}")
+
+        # Costliest caches first
+        cached = sorted(policy.cached_items(), key=lambda entry: entry[1].bytes, reverse=True)
+        self.item_table.setUpdatesEnabled(False)
+        self.item_table.setRowCount(len(cached))
+        for row, (item, stats) in enumerate(cached):
+            position = item.scenePos()
+            values = (getattr(item, "shape_tag", type(item).__name__), f"{position.x():.0f}, {position.y():.0f}",
+                      CACHE_MODE_NAMES[stats.mode], f"{stats.cost_ms:.2f}", str(len(stats.rebuilds)),
+                      format_bytes(stats.bytes))
+            for column, value in enumerate(values):
+                self.item_table.setItem(row, column, QTableWidgetItem(value))
+        self.item_table.setUpdatesEnabled(True)
+
+        lines = []
+        for name, cache in (("Images", PIXMAP_CACHE), ("Tiles", TILE_CACHE), ("Frames", FRAME_CACHE)):
+            stats = cache.stats()
+            lines.append(f"{name}: {stats['entries']} entries, {format_bytes(stats['used'])} of "
+                         f"{format_bytes(stats['budget'])}, {stats['hits']} hits, {stats['misses']} misses")
+        lines.append(f"Qt pixmap cache limit: {format_bytes(QPixmapCache.cacheLimit() * 1024)}")
+        self.shared_label.setText("\n".join(lines))
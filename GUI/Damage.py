@@ -0,0 +1,52 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+
+class DamageTracker(QObject):
+    """
+    Collects the scene rects that changed and hands them to the scene once per
+    event loop pass, so views repaint only the damaged areas instead of the whole viewport.
+    """
+    MAX_RECTS = 32  # Past this many rects a single bounding rect is cheaper to repaint
+
+    def __init__(self, scene):
+        super().__init__(scene)
+        self.scene = scene
+        self.rects = []
+        self._flush_pending = False
+
+    def add(self, rect):
+        if rect.isEmpty():
+            return
+        self.rects.append(QRectF(rect))
+        if not self._flush_pending:
+            self._flush_pending = True
+            QTimer.singleShot(0, self.flush)
+
+    def add_item(self, item, old_rect=None):
+        # Damage the union of where the item was and where it is now
+        rect = item.sceneBoundingRect()
+        if old_rect is not None:
+            rect = rect.united(old_rect)
+        self.add(rect)
+
+    def flush(self):
+        self._flush_pending = False
+        rects, self.rects = self.rects, []
+        if len(rects) > self.MAX_RECTS:
+            bounds = QRectF()
+            for rect in rects:
+                bounds = bounds.united(rect)
+            rects = [bounds]
+        for rect in rects:
+            self.scene.update(rect)
+
+def damage_tracker(scene):
+    """
+    Returns the damage tracker of the given scene, creating it on first use.
+    """
+    tracker = getattr(scene, "damage_tracker", None)
+    if tracker is None:
+        tracker = DamageTracker(scene)
+        scene.damage_tracker = tracker
+    return tracker
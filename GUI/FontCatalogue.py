@@ -0,0 +1,159 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import json
+import os
+
+FONT_CACHE_NAME = "font-families.json"
+FONT_CACHE_VERSION = 1
+
+def font_cache_path():
+    folder = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, FONT_CACHE_NAME)
+
+class FontScanSignals(QObject):
+    scanned = pyqtSignal(list)
+
+class FontScanTask(QRunnable):
+    """
+    Enumerates the font families of the system on a pool worker.
+    """
+    def __init__(self):
+        super().__init__()
+        self.signals = FontScanSignals()
+
+    def run(self):
+        self.signals.scanned.emit(sorted(QFontDatabase.families(), key=str.casefold))
+
+class FontCatalogue(QObject):
+    """
+    The font families of the system, read from a disk cache at startup and
+    refreshed by one background scan per run. Every font picker shares the
+    catalogue's model, so selecting a label never enumerates fonts.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.model = QStringListModel(self)
+        self.scanned = False
+        self.model.setStringList(self.read_cache())
+
+    def read_cache(self):
+        try:
+            with open(font_cache_path(), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if data.get("version") != FONT_CACHE_VERSION:
+            return []
+        return data.get("families", [])
+
+    def write_cache(self, families):
+        path = font_cache_path()
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": FONT_CACHE_VERSION, "families": families}, f)
+            os.replace(temp_path, path)
+        except OSError:
+            # Only costs a rescan next time
+            pass
+
+    def scan(self):
+        # Fonts may have been installed since the cache was written
+        if self.scanned:
+            return
+        self.scanned = True
+        task = FontScanTask()
+        task.signals.scanned.connect(self.families_scanned)
+        self.pool.start(task)
+
+    def families_scanned(self, families):
+        if families == self.model.stringList():
+            return
+        self.model.setStringList(families)
+        self.write_cache(families)
+        self.changed.emit()
+
+    def families(self):
+        return self.model.stringList()
+
+_catalogue = None
+
+def font_catalogue():
+    """
+    The process-wide FontCatalogue. The first call starts the background scan.
+    """
+    global _catalogue
+    if _catalogue is None:
+        _catalogue = FontCatalogue(QCoreApplication.instance())
+        _catalogue.scan()
+    return _catalogue
+
+class FontPicker(QComboBox):
+    """
+    An editable font family chooser on the shared catalogue model. Typing filters
+    the families by substring, and no font previews are rendered, which keeps it
+    cheap to create compared to QFontComboBox.
+    """
+    currentFontChanged = pyqtSignal(QFont)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        self.setMaxVisibleItems(20)
+        self.setModel(font_catalogue().model)
+        completer = QCompleter(font_catalogue().model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setFilterMode(Qt.MatchFlag.MatchContains)
+        completer.setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
+        self.setCompleter(completer)
+        self.family = ""
+        self.currentTextChanged.connect(self.family_chosen)
+        font_catalogue().model.modelAboutToBeReset.connect(self.catalogue_resetting)
+        font_catalogue().model.modelReset.connect(self.catalogue_reset)
+
+    def currentFont(self):
+        return QFont(self.family)
+
+    def setCurrentFont(self, font):
+        family = font.family()
+        index = self.findText(family, Qt.MatchFlag.MatchFixedString)
+        self.family = family
+        # Families missing from the catalogue, e.g. before the first scan, are shown as text
+        blocked = self.blockSignals(True)
+        if index >= 0:
+            self.setCurrentIndex(index)
+        else:
+            self.setEditText(family)
+        self.blockSignals(blocked)
+
+    def clearCurrentFont(self):
+        # Shown while the edited labels use different families
+        self.family = ""
+        blocked = self.blockSignals(True)
+        self.setCurrentIndex(-1)
+        self.setEditText("")
+        self.blockSignals(blocked)
+
+    def catalogue_resetting(self):
+        # A finished scan replaces the list, which must not read as a choice
+        self.blockSignals(True)
+
+    def catalogue_reset(self):
+        self.blockSignals(False)
+        if self.family:
+            self.setCurrentFont(QFont(self.family))
+        else:
+            self.clearCurrentFont()
+
+    def family_chosen(self, family):
+        # Partly typed names do not change the font, only known families do
+        if family == self.family or self.findText(family, Qt.MatchFlag.MatchFixedString) < 0:
+            return
+        self.family = self.itemText(self.findText(family, Qt.MatchFlag.MatchFixedString))
+        self.currentFontChanged.emit(self.currentFont())
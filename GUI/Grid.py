@@ -1,10 +1,15 @@
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
+import math
 
 GRID_SIZE = 10
 GRID_COLOR = QColor("#999999")
 IS_GRID_ENABLED = True
+MIN_GRID_SPACING = 8  # Minor lines closer than this many pixels are hidden
+MAJOR_GRID_EVERY = 5  # A major line is drawn every K cells of the visible level
+SNAP_SIZE = GRID_SIZE  # Snap granularity of the grid level visible in the view
+VIEW_SCALE = 1.0  # Zoom level of the view, used to size snapping tolerances
 
 def get_theme_background_color():
     """
@@ -17,40 +22,100 @@ def get_theme_background_color():
     # Fallback color if no app instance
     return QColor("#ffffff")
 
-def draw_grid_background(scene, painter, rect, grid_size=GRID_SIZE, grid_color=GRID_COLOR):
+def grid_step_for_scale(scale, grid_size=GRID_SIZE):
     """
-    Draws a grid background on the given QGraphicsScene using the provided painter and rect.
+    Returns the spacing of the finest grid level that is still at least
+    MIN_GRID_SPACING pixels apart at the given view scale.
     """
-    # Set background color based on theme
-    bg_color = get_theme_background_color()
-    painter.fillRect(rect, bg_color)
+    step = grid_size
+    if scale <= 0:
+        return step
+    while step * scale < MIN_GRID_SPACING:
+        step *= MAJOR_GRID_EVERY
+    return step
 
-    if not IS_GRID_ENABLED:
-        return
-    left = int(rect.left()) - (int(rect.left()) % grid_size)
-    top = int(rect.top()) - (int(rect.top()) % grid_size)
-    lines = []
-    for x in range(left, int(rect.right()), grid_size):
-        lines.append(QLineF(x, rect.top(), x, rect.bottom()))
-    for y in range(top, int(rect.bottom()), grid_size):
-        lines.append(QLineF(rect.left(), y, rect.right(), y))
-    painter.setPen(QPen(grid_color, 1))
-    painter.drawLines(lines)
+def set_view_scale(scale):
+    """
+    Makes snapping follow the grid level visible at the given view scale.
+    """
+    global SNAP_SIZE, VIEW_SCALE
+    VIEW_SCALE = scale
+    SNAP_SIZE = grid_step_for_scale(scale)
 
-def snap_to_grid(point, grid_size=GRID_SIZE):
+class GridRenderer:
     """
-    Snaps a point to the nearest grid line based on the specified grid size.
+    Draws the grid by filling the exposed rect with a pre-rasterized grid tile.
+    A tile spans MAJOR_GRID_EVERY cells of the level visible at the painter's scale,
+    so zoomed-out views never draw sub-pixel lines. Tiles are cached per (grid level,
+    grid color, background color, device pixel ratio, zoom bucket) and only rebuilt
+    after invalidate(), which the grid and theme toggles call.
     """
-    # Always return a QPointF for QPointF input
-    if hasattr(point, 'x') and hasattr(point, 'y'):
-        if not IS_GRID_ENABLED:
-            return point
-        x = round(point.x() / grid_size) * grid_size
-        y = round(point.y() / grid_size) * grid_size
-        return QPointF(x, y)
-    elif isinstance(point, (int, float)):
+    MAX_TILES = 64
+
+    def __init__(self):
+        self._tiles = {}
+        self._background_color = None
+
+    def invalidate(self):
+        self._tiles.clear()
+        self._background_color = None
+
+    def background_color(self):
+        # Resolve the palette color once per theme instead of on every expose
+        if self._background_color is None:
+            self._background_color = get_theme_background_color()
+        return self._background_color
+
+    def tile_brush(self, step, grid_color, bg_color, dpr, scale=1.0):
+        # Quantize the zoom to quarter octaves so continuous zooming reuses tiles
+        bucket = 2 ** (round(math.log2(scale) * 4) / 4)
+        key = (step, grid_color.rgba(), bg_color.rgba(), dpr, bucket)
+        brush = self._tiles.get(key)
+        if brush is None:
+            if len(self._tiles) >= self.MAX_TILES:
+                self._tiles.clear()
+            brush = self._build_tile(step, grid_color, bg_color, dpr, bucket)
+            self._tiles[key] = brush
+        return brush
+
+    def _build_tile(self, step, grid_color, bg_color, dpr, scale):
+        # Rasterize one major cell in device pixels, then map it back to scene units
+        span = step * MAJOR_GRID_EVERY
+        size = max(1, round(span * scale * dpr))
+        tile = QPixmap(size, size)
+        tile.fill(bg_color)
+        minor_color = QColor(grid_color)
+        minor_color.setAlphaF(grid_color.alphaF() * 0.55)
+        line_width = max(1, round(dpr))
+        painter = QPainter(tile)
+        for i in range(MAJOR_GRID_EVERY):
+            offset = round(i * size / MAJOR_GRID_EVERY)
+            color = grid_color if i == 0 else minor_color
+            painter.fillRect(0, offset, size, line_width, color)
+            painter.fillRect(offset, 0, line_width, size, color)
+        painter.end()
+        brush = QBrush(tile)
+        brush.setTransform(QTransform.fromScale(span / size, span / size))
+        return brush
+
+    def draw(self, painter, rect, grid_size=GRID_SIZE, grid_color=GRID_COLOR, bg_color=None):
+        if bg_color is None:
+            bg_color = self.background_color()
         if not IS_GRID_ENABLED:
-            return point
-        return round(point / grid_size) * grid_size
-    else:
-        raise TypeError("snap_to_grid expects QPointF, QPoint, int, or float")
\ No newline at end of file
+            painter.fillRect(rect, bg_color)
+            return
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if scale <= 0:
+            scale = 1.0
+        dpr = painter.device().devicePixelRatioF()
+        step = grid_step_for_scale(scale, grid_size)
+        # The brush origin stays at the scene origin, so tiles line up across exposes
+        painter.fillRect(rect, self.tile_brush(step, grid_color, bg_color, dpr, scale))
+
+GRID_RENDERER = GridRenderer()
+
+def draw_grid_background(scene, painter, rect, grid_size=GRID_SIZE, grid_color=GRID_COLOR):
+    """
+    Draws a grid background on the given QGraphicsScene using the provided painter and rect.
+    """
+    GRID_RENDERER.draw(painter, rect, grid_size, grid_color)
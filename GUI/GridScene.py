@@ -1,28 +1,342 @@
 from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
 from PyQt6.QtCore import *
+from GUI.Grid import GRID_RENDERER
+from GUI.Damage import damage_tracker
+from GUI.Snapping import SnapEngine, snap_point
+from GUI.SpatialIndex import UniformGridIndex
+from contextlib import contextmanager
+
+INDEX_BSP = "bsp"  # Qt's BSP tree
+INDEX_NONE = "none"  # No index, every query scans all items
+INDEX_GRID = "grid"  # Uniform grid index for the editor's own queries, updated incrementally from itemChange
+INDEX_STRATEGIES = (INDEX_BSP, INDEX_NONE, INDEX_GRID)
+
+class DragTransaction:
+    """
+    Moves a multi-selection as one unit. The group delta is snapped once, the items'
+    geometry-change notifications are suspended for the duration of the drag and the
+    damage of the whole group is published as one rect. In a virtualized scene the
+    band-selected shapes that are not materialized move by their records when the
+    drag ends.
+    """
+    def __init__(self, scene, origin):
+        self.scene = scene
+        self.origin = origin
+        self.delta = QPointF(0, 0)
+        self.items = [item for item in scene.selectedItems()
+                      if item.flags() & QGraphicsItem.GraphicsItemFlag.ItemIsMovable]
+        self.start_positions = [item.pos() for item in self.items]
+        self.saved_flags = [item.flags() for item in self.items]
+        self.item_set = set(self.items)
+        virtualizer = scene.virtualizer
+        self.entry_ids = virtualizer.unmaterialized_selection() if virtualizer is not None else []
+        self.bounds = QRectF()
+        # Large selections also switch the scene to its cheapest index while they move
+        self.bulk = len(self.items) >= scene.BULK_MOVE_MIN_ITEMS
+        if self.bulk:
+            scene.begin_bulk_update()
+        for item in self.items:
+            self.bounds = self.bounds.united(item.sceneBoundingRect())
+            # Skip the per-item itemChange round trip into Python while dragging
+            item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, False)
+
+    def move_to(self, scene_pos):
+        raw_delta = scene_pos - self.origin
+        delta = snap_point(raw_delta)
+        # Align the group's bounds with the other shapes when one is within reach
+        dx, dy = self.scene.snap_engine.snap_rect(self.bounds.translated(raw_delta), self.item_set)
+        if dx is not None:
+            delta.setX(raw_delta.x() + dx)
+        if dy is not None:
+            delta.setY(raw_delta.y() + dy)
+        if delta == self.delta:
+            return
+        old_bounds = self.bounds.translated(self.delta)
+        self.delta = delta
+        for item, start in zip(self.items, self.start_positions):
+            item.setPos(start + delta)
+        damage_tracker(self.scene).add(old_bounds.united(self.bounds.translated(delta)))
+
+    def finish(self):
+        for item, flags in zip(self.items, self.saved_flags):
+            item.setFlags(flags)
+        if self.bulk:
+            self.scene.end_bulk_update(self.items)
+        else:
+            for item in self.items:
+                self.scene.item_geometry_changed(item)
+        virtualizer = self.scene.virtualizer
+        if virtualizer is not None:
+            if self.entry_ids and not self.delta.isNull():
+                virtualizer.move_records(self.entry_ids, self.delta)
+                self.scene.items_changed(self.entry_ids)
+            virtualizer.schedule_refresh()
 
 class GridScene(QGraphicsScene):
     GRID_SIZE = 10
+    GRID_COLOR = QColor(60, 60, 60)
+    GROUP_DRAG_MIN_ITEMS = 2  # Selections of at least this many items move as one transaction
+    BULK_MOVE_MIN_ITEMS = 64  # Group drags of at least this many items run as a bulk update
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.drag_transaction = None
+        self.snap_engine = SnapEngine(self)
+        self.index_strategy = INDEX_BSP
+        self.spatial_index = None
+        self.item_order = {}  # Insertion order of the top-level items
+        self.next_order = 0
+        self.bulk_depth = 0
+        self.pending_items = []
+        self.bulk_removed = False
+        self.journal = None  # Set by a Journal that records the edits of this scene
+        self.virtualizer = None  # Set by a SceneVirtualizer that materializes a large document
+        self.animation_clock = None  # AnimationClock of the animated images, created on first use
+        self.cache_policy = None  # RenderCachePolicy of the painted shapes, created on first paint
+
+    def addItem(self, item):
+        super().addItem(item)
+        self.item_order[item] = self.next_order
+        self.next_order += 1
+        self.item_geometry_changed(item)
+        if self.virtualizer is not None:
+            self.virtualizer.item_added(item)
+        if self.journal is not None:
+            self.journal.item_added(item)
+
+    def removeItem(self, item):
+        if self.journal is not None and item in self.item_order:
+            self.journal.item_removed(item)
+        if self.virtualizer is not None:
+            self.virtualizer.item_removed(item)
+        self.item_order.pop(item, None)
+        if self.cache_policy is not None:
+            self.cache_policy.untrack(item)
+        if self.bulk_depth:
+            # The indices are rebuilt once when the bulk update ends
+            self.bulk_removed = True
+        else:
+            self.snap_engine.remove_item(item)
+            if self.spatial_index is not None:
+                self.spatial_index.remove(item)
+        super().removeItem(item)
+
+    def top_level_items(self):
+        # Insertion order, without the z-order sort of items()
+        return list(self.item_order)
+
+    def clear(self):
+        self.snap_engine.clear()
+        if self.spatial_index is not None:
+            self.spatial_index.clear()
+        self.item_order.clear()
+        if self.cache_policy is not None:
+            self.cache_policy.clear()
+        self.pending_items = []
+        self.bulk_removed = False
+        super().clear()
+
+    def item_geometry_changed(self, item):
+        # Keep the snapping and spatial indices in step with moved or resized items
+        if item not in self.item_order:
+            return
+        if self.journal is not None:
+            self.journal.item_moved(item)
+        if self.bulk_depth:
+            self.pending_items.append(item)
+            return
+        self.snap_engine.update_item(item)
+        if self.spatial_index is not None:
+            self.spatial_index.update(item, item.sceneBoundingRect())
+
+    def item_changed(self, item):
+        # A property other than the position changed, e.g. from the properties dock
+        if self.journal is not None and item in self.item_order:
+            self.journal.item_changed(item)
+
+    def items_resized(self, items):
+        # Property edits changed the bounds of these items. The journal records them as changes,
+        # not as moves, so only the snapping and spatial indices are updated.
+        items = [item for item in items if item in self.item_order]
+        if self.bulk_depth:
+            self.pending_items.extend(items)
+            return
+        self.snap_engine.update_items(items)
+        if self.spatial_index is not None:
+            for item in items:
+                self.spatial_index.update(item, item.sceneBoundingRect())
+
+    def items_changed(self, items):
+        # The same for a batch edit of many items, items the journal does not know are skipped when it flushes.
+        # A virtualized scene also passes the entry ids of the shapes it edited by their records.
+        if self.journal is not None:
+            self.journal.items_changed(items)
+
+    # Indexing strategy
+    def set_index_strategy(self, strategy):
+        if strategy not in INDEX_STRATEGIES:
+            raise ValueError(f"Unknown index strategy: {strategy}")
+        self.index_strategy = strategy
+        self.apply_qt_index_method()
+        if strategy == INDEX_GRID:
+            self.spatial_index = UniformGridIndex()
+            for item in self.item_order:
+                self.spatial_index.insert(item, item.sceneBoundingRect())
+        else:
+            self.spatial_index = None
+
+    def apply_qt_index_method(self):
+        # Qt paints and dispatches clicks through its own index, so its BSP tree stays next
+        # to the uniform grid as well. It is only dropped for "none" and during bulk updates.
+        if self.index_strategy != INDEX_NONE and not self.bulk_depth:
+            method = QGraphicsScene.ItemIndexMethod.BspTreeIndex
+        else:
+            method = QGraphicsScene.ItemIndexMethod.NoIndex
+        if self.itemIndexMethod() != method:
+            self.setItemIndexMethod(method)
+
+    def begin_bulk_update(self):
+        """
+        Switches to the cheapest index maintenance for bulk moves and loads. Index
+        updates are deferred until the matching end_bulk_update().
+        """
+        self.bulk_depth += 1
+        if self.bulk_depth == 1:
+            self.apply_qt_index_method()
+
+    def end_bulk_update(self, changed_items=()):
+        if self.journal is not None:
+            for item in changed_items:
+                self.journal.item_moved(item)
+        self.pending_items.extend(changed_items)
+        self.bulk_depth -= 1
+        if self.bulk_depth:
+            return
+        pending = [item for item in dict.fromkeys(self.pending_items) if item in self.item_order]
+        self.pending_items = []
+        if self.bulk_removed:
+            self.bulk_removed = False
+            self.snap_engine.reset(self.item_order)
+            if self.spatial_index is not None:
+                self.spatial_index.clear()
+                pending = self.item_order
+        else:
+            self.snap_engine.update_items(pending)
+        if self.spatial_index is not None:
+            for item in pending:
+                self.spatial_index.update(item, item.sceneBoundingRect())
+        self.apply_qt_index_method()
+
+    @contextmanager
+    def bulk_update(self):
+        self.begin_bulk_update()
+        try:
+            yield self
+        finally:
+            self.end_bulk_update()
+
+    # Queries that go through the selected index
+    def items_in_rect(self, rect, mode=Qt.ItemSelectionMode.IntersectsItemBoundingRect):
+        if self.virtualizer is not None:
+            self.virtualizer.materialize_rect(rect)
+        if self.spatial_index is None:
+            return self.items(rect, mode)
+        found = self.spatial_index.candidates(rect)
+        if mode == Qt.ItemSelectionMode.ContainsItemBoundingRect:
+            found = [item for item in found if rect.contains(item.sceneBoundingRect())]
+        elif mode != Qt.ItemSelectionMode.IntersectsItemBoundingRect:
+            path = QPainterPath()
+            path.addRect(rect)
+            found = [item for item in found if item.collidesWithPath(item.mapFromScene(path), mode)]
+        return self.stacking_sorted(found)
+
+    def items_at(self, pos):
+        if self.virtualizer is not None:
+            self.virtualizer.materialize_rect(QRectF(pos, QSizeF(0.001, 0.001)))
+        if self.spatial_index is None:
+            return self.items(pos)
+        found = [item for item in self.spatial_index.candidates_at(pos)
+                 if item.contains(item.mapFromScene(pos))]
+        return self.stacking_sorted(found)
+
+    def stacking_sorted(self, items):
+        # Topmost first, like QGraphicsScene.items()
+        order = self.item_order
+        return sorted(items, key=lambda item: (item.zValue(), order.get(item, -1)), reverse=True)
+
+    def select_items(self, items, extend=False):
+        # Emit one selectionChanged for the whole batch instead of one per item
+        blocked = self.blockSignals(True)
+        try:
+            if not extend:
+                self.clearSelection()
+            for item in items:
+                if item.flags() & QGraphicsItem.GraphicsItemFlag.ItemIsSelectable:
+                    item.setSelected(True)
+        finally:
+            self.blockSignals(blocked)
+        self.selectionChanged.emit()
 
     def drawBackground(self, painter, rect):
-        painter.save()
-        painter.setPen(QPen(QColor(60, 60, 60), 1))
-        left = int(rect.left()) - (int(rect.left()) % self.GRID_SIZE)
-        top = int(rect.top()) - (int(rect.top()) % self.GRID_SIZE)
-        right = int(rect.right())
-        bottom = int(rect.bottom())
-        x = left
-        while x <= right:
-            painter.drawLine(x, top, x, bottom)
-            x += self.GRID_SIZE
-        y = top
-        while y <= bottom:
-            painter.drawLine(left, y, right, y)
-            y += self.GRID_SIZE
-        painter.restore()
+        # The scene leaves its background untouched and only lays the grid over it
+        GRID_RENDERER.draw(painter, rect, self.GRID_SIZE, self.GRID_COLOR, QColor(Qt.GlobalColor.transparent))
+        if self.virtualizer is not None:
+            self.virtualizer.draw_proxies(painter, rect)
+
+    def drawForeground(self, painter, rect):
+        self.snap_engine.draw_guides(painter)
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        grabber = self.mouseGrabberItem()
+        if (event.button() == Qt.MouseButton.LeftButton and grabber is not None and grabber.isSelected()
+                and grabber.flags() & QGraphicsItem.GraphicsItemFlag.ItemIsMovable
+                and not self.drags_itself(grabber)
+                and self.selection_size() >= self.GROUP_DRAG_MIN_ITEMS):
+            self.drag_transaction = DragTransaction(self, event.scenePos())
+
+    def mouseMoveEvent(self, event):
+        if self.drag_transaction is not None:
+            self.drag_transaction.move_to(event.scenePos())
+            event.accept()
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_transaction is not None:
+            self.drag_transaction.move_to(event.scenePos())
+            self.drag_transaction.finish()
+            self.drag_transaction = None
+        self.snap_engine.clear_guides()
+        super().mouseReleaseEvent(event)
+
+    def selection_size(self):
+        # Band-selected shapes of a virtualized scene count whether they are materialized or not
+        size = len(self.selectedItems())
+        if self.virtualizer is not None:
+            size += len(self.virtualizer.unmaterialized_selection())
+        return size
 
     @staticmethod
-    def snap_to_grid(x, y):
-        grid = GridScene.GRID_SIZE
-        return round(x / grid) * grid, round(y / grid) * grid
\ No newline at end of file
+    def drags_itself(item):
+        # Line endpoint drags and text selection inside a label are not group moves
+        if getattr(item, "_dragging_point", None) is not None:
+            return True
+        return isinstance(item, QGraphicsTextItem) and item.hasFocus()
+
+def notify_geometry_changed(item):
+    """
+    Tells the item's scene that the item moved or changed size.
+    """
+    scene = item.scene()
+    if isinstance(scene, GridScene):
+        scene.item_geometry_changed(item)
+
+def notify_item_changed(item):
+    """
+    Tells the item's scene that a property of the item changed.
+    """
+    scene = item.scene()
+    if isinstance(scene, GridScene):
+        scene.item_changed(item)
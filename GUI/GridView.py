@@ -1,16 +1,109 @@
-from PyQt6.QtWidgets import QGraphicsView
+from PyQt6.QtWidgets import QGraphicsView, QStyleOptionGraphicsItem, QRubberBand
 from PyQt6.QtGui import QPainter
-from PyQt6.QtCore import QRectF
-from .Grid import draw_grid_background
+from PyQt6.QtCore import QRectF, QRect, QSize, Qt, pyqtSignal
+from .Grid import draw_grid_background, set_view_scale
+from .GridScene import GridScene
 
 class GridView(QGraphicsView):
+    ZOOM_STEP = 1.25
+    MIN_ZOOM = 0.02
+    MAX_ZOOM = 8.0
+
+    viewport_changed = pyqtSignal()  # The visible part of the scene scrolled, zoomed or resized
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setRenderHint(QPainter.RenderHint.Antialiasing)
         self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
         self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+        self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+        # Rubber band used when the scene answers selection queries from its own index
+        self.band = QRubberBand(QRubberBand.Shape.Rectangle, self.viewport())
+        self.band_origin = None
+        self.band_extend = False
 
     # Called automatically by the Qt framework whenever the background needs to be redrawn
     def drawBackground(self, painter: QPainter, rect: QRectF):
-        if self.scene():
-            draw_grid_background(self.scene(), painter, rect)
\ No newline at end of file
+        scene = self.scene()
+        if scene:
+            draw_grid_background(scene, painter, rect)
+            # The view replaces GridScene.drawBackground, so it draws the proxies of a virtualized scene itself
+            if isinstance(scene, GridScene) and scene.virtualizer is not None:
+                scene.virtualizer.draw_proxies(painter, rect)
+
+    def zoom_level(self):
+        return QStyleOptionGraphicsItem.levelOfDetailFromTransform(self.transform())
+
+    def set_zoom(self, level):
+        level = max(self.MIN_ZOOM, min(self.MAX_ZOOM, level))
+        current = self.zoom_level()
+        if current > 0:
+            self.scale(level / current, level / current)
+        # Snap to the grid level that is visible at the new zoom
+        set_view_scale(self.zoom_level())
+        self.viewport_changed.emit()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.viewport_changed.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.viewport_changed.emit()
+
+    def wheelEvent(self, event):
+        # Ctrl + wheel zooms around the cursor, the plain wheel keeps scrolling
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            factor = self.ZOOM_STEP if event.angleDelta().y() > 0 else 1 / self.ZOOM_STEP
+            self.set_zoom(self.zoom_level() * factor)
+            event.accept()
+            return
+        super().wheelEvent(event)
+
+    def uses_scene_index(self):
+        scene = self.scene()
+        # A virtualized scene has to materialize the shapes under the band first
+        return (isinstance(scene, GridScene) and (scene.spatial_index is not None or scene.virtualizer is not None)
+                and self.dragMode() == QGraphicsView.DragMode.RubberBandDrag)
+
+    def mousePressEvent(self, event):
+        # Qt's own rubber band queries Qt's index, so run it against the scene's index instead
+        pos = event.position().toPoint()
+        if (event.button() == Qt.MouseButton.LeftButton and self.uses_scene_index()
+                and not self.scene().items_at(self.mapToScene(pos))):
+            self.band_origin = pos
+            self.band_extend = bool(event.modifiers() & Qt.KeyboardModifier.ControlModifier)
+            self.band.setGeometry(QRect(pos, QSize()))
+            self.band.show()
+            virtualizer = self.scene().virtualizer
+            if virtualizer is not None:
+                virtualizer.begin_band(self.band_extend)
+            if not self.band_extend:
+                self.scene().clearSelection()
+            event.accept()
+            return
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self.band_origin is not None:
+            rect = QRect(self.band_origin, event.position().toPoint()).normalized()
+            self.band.setGeometry(rect)
+            scene_rect = self.mapToScene(rect).boundingRect()
+            if self.scene().virtualizer is not None:
+                # Selects from the document's records instead of materializing every shape under the band
+                self.scene().virtualizer.select_rect(scene_rect, self.rubberBandSelectionMode())
+                event.accept()
+                return
+            self.scene().select_items(self.scene().items_in_rect(scene_rect, self.rubberBandSelectionMode()),
+                                      self.band_extend)
+            event.accept()
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.band_origin is not None:
+            self.band.hide()
+            self.band_origin = None
+            event.accept()
+            return
+        super().mouseReleaseEvent(event)
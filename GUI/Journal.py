@@ -0,0 +1,461 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import json
+import math
+import os
+import queue
+from GUI.BinaryFormat import is_binary_path, iter_binary
+from GUI.Bundle import is_bundle_path, iter_bundle
+from GUI.SceneLoader import PARSE_BATCH_SIZE, iter_json_array
+from Shapes.Registry import record_shape_type, records_from_snapshot, scene_shapes, serialize_item, shape_type_for_item
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_VERSION = 1
+FLUSH_INTERVAL_MS = 250  # Operations are handed to the writer at most this often
+FSYNC_BATCH = 256  # Most operations written between two fsyncs
+IDLE_COMPACT_MS = 30000  # Idle time after which the journal is compacted
+COMPACT_MIN_OPS = 200  # Journals with fewer operations than this are not worth compacting
+SERIALIZE_BUDGET_MS = 8  # GUI thread time a timed flush spends on serializing batch edits per pass
+SERIALIZE_CHUNK = 100  # Items serialized between two checks of the budget
+SETTINGS_ORGANIZATION = "Shape-Editors"
+SETTINGS_APPLICATION = "Diagram Editor"
+SETTINGS_JOURNAL_KEY = "journal/path"
+
+def journal_path_for(document):
+    """
+    Returns the journal path of a document, or the untitled journal for None.
+    """
+    if document:
+        return document + JOURNAL_SUFFIX
+    folder = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, "untitled" + JOURNAL_SUFFIX)
+
+def journal_settings():
+    return QSettings(SETTINGS_ORGANIZATION, SETTINGS_APPLICATION)
+
+def read_journal(path):
+    """
+    Reads a journal file into its header and operations. A torn last line left
+    by a crash ends the journal instead of failing it.
+    """
+    header = None
+    ops = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if header is None:
+                if op.get("op") != "base":
+                    raise ValueError("Not a diagram journal")
+                header = op
+            else:
+                ops.append(op)
+    if header is None:
+        raise ValueError("The journal is empty")
+    return header, ops
+
+def recoverable_journal():
+    """
+    Returns (journal path, document) of the last session when its journal holds
+    changes that were never saved, otherwise None.
+    """
+    path = journal_settings().value(SETTINGS_JOURNAL_KEY, "")
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        header, ops = read_journal(path)
+    except (OSError, ValueError):
+        return None
+    if not ops:
+        return None
+    return path, header.get("document")
+
+def discard_journal(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def replay_journal(path):
+    """
+    Replays a journal onto the records of its base document and returns the
+    resulting records in document order. The document's records are numbered
+    like Journal.start() numbered its shapes: records that loading skips get no
+    id, and the ids in the header's holes belong to no record of the document.
+    """
+    header, ops = read_journal(path)
+    records = {}
+    document = header.get("document")
+    if document and os.path.exists(document):
+        if is_binary_path(document):
+            batches = iter_binary(document)
+        elif is_bundle_path(document):
+            batches = iter_bundle(document)
+        else:
+            batches = iter_json_array(document)
+        holes = set(header.get("holes", ()))
+        item_id = 0
+        for batch, _ in batches:
+            for record in batch:
+                if record_shape_type(record) is None:
+                    continue
+                while item_id in holes:
+                    item_id += 1
+                records[item_id] = record
+                item_id += 1
+    for op in ops:
+        kind = op["op"]
+        if kind == "snapshot":
+            records = dict(zip(op["ids"], op["records"]))
+        elif kind in ("add", "set"):
+            records[op["id"]] = op["record"]
+        elif kind == "remove":
+            records.pop(op["id"], None)
+        elif kind == "move":
+            record = records.get(op["id"])
+            if record is not None:
+                record["pos_x"] = op["x"]
+                record["pos_y"] = op["y"]
+    return list(records.values())
+
+def iter_recovered_records(path, batch_size=PARSE_BATCH_SIZE):
+    """
+    Yields the replayed records of a journal in (records, records_read) batches
+    for the scene loader.
+    """
+    records = replay_journal(path)
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        yield batch, start + len(batch)
+
+class JournalWriter(QThread):
+    """
+    Appends journal operations on a worker thread. Operations that arrive together
+    are written as one batch followed by one fsync.
+    """
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.commands = queue.Queue()
+        self.file = None
+
+    def append(self, ops):
+        self.commands.put(("append", ops))
+
+    def reset(self, path, ops):
+        # Replace the journal with the given operations
+        self.commands.put(("reset", path, ops))
+
+    def stop(self):
+        self.commands.put(("stop",))
+        self.wait()
+
+    def run(self):
+        running = True
+        while running:
+            commands = [self.commands.get()]
+            while len(commands) < FSYNC_BATCH:
+                try:
+                    commands.append(self.commands.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for command in commands:
+                    if command[0] == "append" and self.file is not None:
+                        self.file.write("".join(json.dumps(op, separators=(",", ":")) + "\n" for op in command[1]))
+                    elif command[0] == "reset":
+                        self._replace(command[1], command[2])
+                    elif command[0] == "stop":
+                        running = False
+                if self.file is not None:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+            except OSError as e:
+                self.failed.emit(str(e))
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _replace(self, path, ops):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.file = open(path, "a", encoding="utf-8")
+
+class Journal(QObject):
+    """
+    Records the edits made to a GridScene as an append-only journal next to the
+    document, so unsaved work survives a crash. Consecutive moves and property
+    changes of one item are coalesced before they reach the writer, and the
+    journal is compacted into a snapshot when the editor is idle.
+    """
+    failed = pyqtSignal(str)
+
+    def __init__(self, scene, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        self.document = None
+        self.path = None
+        self.recording = False
+        self.ids = {}
+        self.next_id = 0
+        self.pending = []
+        self.last_op = {}  # Item id -> index in pending of the item's latest operation
+        self.batches = []  # Pending batch edits, expanded into "set" operations when flushed
+        self.deferred = {}  # Item -> its latest pending batch
+        self.barrier = 0  # Operations in pending before this index are not coalesced, a batch follows them
+        self.ops_since_compaction = 0
+        self.revision = 0  # Counts every recorded edit, so callers can tell whether the scene changed
+        self.writer = JournalWriter(self)
+        self.writer.failed.connect(self.failed)
+        self.writer.start()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.timed_flush)
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.compact)
+        scene.journal = self
+        QApplication.instance().aboutToQuit.connect(self.close)
+
+    def start(self, document=None, snapshot=False):
+        """
+        Starts a fresh journal for the scene's current items, which match the saved
+        document. With snapshot the items are written into the journal as well,
+        for scenes that differ from their document.
+        """
+        old_path = self.path
+        self.document = document
+        self.path = journal_path_for(document)
+        base = {"op": "base", "version": JOURNAL_VERSION, "document": document}
+        virtualizer = self.scene.virtualizer
+        if virtualizer is not None:
+            # Ids of a virtualized scene are the positions of its shapes in the document,
+            # the positions of removed and unknown shapes are listed as holes
+            self.ids = virtualizer.item_ids()
+            self.next_id = len(virtualizer.document)
+            holes = virtualizer.document.holes()
+            if holes:
+                base["holes"] = holes
+        else:
+            # Items that are not shapes are not in the document either
+            self.ids = {}
+            self.next_id = 0
+            for item in scene_shapes(self.scene):
+                if shape_type_for_item(item) is not None:
+                    self.ids[item] = self.next_id
+                    self.next_id += 1
+        ops = [base]
+        if snapshot:
+            ops.append(self._snapshot())
+        self.pending = []
+        self.last_op = {}
+        self.batches = []
+        self.deferred = {}
+        self.barrier = 0
+        self.ops_since_compaction = 0
+        self.writer.reset(self.path, ops)
+        if old_path and old_path != self.path:
+            discard_journal(old_path)
+        journal_settings().setValue(SETTINGS_JOURNAL_KEY, self.path)
+        self.recording = True
+
+    def pause(self):
+        # Stop recording while the scene is replaced by a load or a clear
+        self.flush()
+        self.recording = False
+
+    def close(self):
+        if self.writer.isRunning():
+            self.flush()
+            self.writer.stop()
+        self.recording = False
+
+    def _snapshot(self):
+        virtualizer = self.scene.virtualizer
+        if virtualizer is not None:
+            ids, snapshot = virtualizer.snapshot_with_ids()
+            return {"op": "snapshot", "ids": ids, "records": records_from_snapshot(snapshot)}
+        records, ids = [], []
+        for item in scene_shapes(self.scene):
+            record = serialize_item(item)
+            if record is not None and item in self.ids:
+                records.append(record)
+                ids.append(self.ids[item])
+        return {"op": "snapshot", "ids": ids, "records": records}
+
+    def _record(self, op, coalesce=False):
+        self.revision += 1
+        item_id = op["id"]
+        index = self.last_op.get(item_id)
+        # A batch may serialize the item before a later change, which must then stay behind the batch
+        if coalesce and index is not None and index >= self.barrier and self.pending[index]["op"] == op["op"]:
+            # Only the latest state of a run of moves or property changes matters
+            self.pending[index] = op
+        else:
+            self.last_op[item_id] = len(self.pending)
+            self.pending.append(op)
+            self.ops_since_compaction += 1
+        if not self.flush_timer.isActive():
+            self.flush_timer.start(FLUSH_INTERVAL_MS)
+        self.idle_timer.start(IDLE_COMPACT_MS)
+
+    def item_added(self, item):
+        if not self.recording or item in self.ids:
+            return
+        record = serialize_item(item)
+        if record is None:
+            return
+        # A virtualized scene has already given the item its place in the document
+        virtualizer = self.scene.virtualizer
+        item_id = virtualizer.ids.get(item) if virtualizer is not None else None
+        if item_id is None:
+            item_id = self.next_id
+        self.ids[item] = item_id
+        self.next_id = max(self.next_id, item_id + 1)
+        self._record({"op": "add", "id": item_id, "record": record})
+
+    def bind(self, item, item_id):
+        # Materializing a shape of a virtualized scene is not an edit, only its id is tracked
+        self.ids[item] = item_id
+
+    def unbind(self, item):
+        item_id = self.ids.pop(item, None)
+        batch = self.deferred.pop(item, None)
+        if batch is not None and item_id is not None:
+            # A recycled item will show another shape, so its record is taken now
+            batch["records"][item] = (item_id, serialize_item(item))
+
+    def item_removed(self, item):
+        if not self.recording:
+            return
+        item_id = self.ids.pop(item, None)
+        if item_id is not None:
+            self._record({"op": "remove", "id": item_id})
+
+    def item_moved(self, item):
+        if not self.recording:
+            return
+        item_id = self.ids.get(item)
+        if item_id is not None:
+            pos = item.pos()
+            self._record({"op": "move", "id": item_id, "x": pos.x(), "y": pos.y()}, coalesce=True)
+
+    def item_changed(self, item):
+        if not self.recording:
+            return
+        item_id = self.ids.get(item)
+        if item_id is not None:
+            record = serialize_item(item)
+            if record is not None:
+                self._record({"op": "set", "id": item_id, "record": record}, coalesce=True)
+
+    def items_changed(self, items):
+        """
+        Records a property change of many items, e.g. a batch edit of a selection.
+        The batch stays one pending entry, its items are serialized by the timed
+        flushes a slice at a time and not while the edit runs. Entry ids stand for
+        shapes a virtualized scene edited by their records, which are read from
+        its document.
+        """
+        if not self.recording:
+            return
+        batch = {"op": "batch", "items": items, "records": {}, "done": 0}
+        self.pending.append(batch)
+        self.barrier = len(self.pending)
+        self.batches.append(batch)
+        self.deferred.update(dict.fromkeys(items, batch))
+        self.ops_since_compaction += len(items)
+        self.revision += 1
+        if not self.flush_timer.isActive():
+            self.flush_timer.start(FLUSH_INTERVAL_MS)
+        self.idle_timer.start(IDLE_COMPACT_MS)
+
+    def _serialize_batches(self, budget_ms):
+        """
+        Serializes the items of the pending batches, each in its latest batch only,
+        until budget_ms is spent. Returns True once all of them are serialized.
+        """
+        clock = QElapsedTimer()
+        clock.start()
+        deferred = self.deferred
+        for batch in self.batches:
+            items, records = batch["items"], batch["records"]
+            while batch["done"] < len(items):
+                if clock.elapsed() >= budget_ms:
+                    return False
+                start = batch["done"]
+                for item in items[start:start + SERIALIZE_CHUNK]:
+                    if item not in records and deferred.get(item) is batch:
+                        if isinstance(item, int):
+                            records[item] = (item, self._entry_record(item))
+                            continue
+                        item_id = self.ids.get(item)
+                        if item_id is not None:
+                            records[item] = (item_id, serialize_item(item))
+                batch["done"] = start + SERIALIZE_CHUNK
+        return True
+
+    def _entry_record(self, entry_id):
+        # None for shapes removed since the edit, their removal is journaled after it
+        virtualizer = self.scene.virtualizer
+        if virtualizer is None or virtualizer.document.entries[entry_id] is None:
+            return None
+        item = virtualizer.items.get(entry_id)
+        return serialize_item(item) if item is not None else virtualizer.document.record(entry_id)
+
+    def _expand_batches(self):
+        ops = []
+        for op in self.pending:
+            if op["op"] != "batch":
+                ops.append(op)
+                continue
+            records = op["records"]
+            # Items written by a later batch, or removed since the edit, have no record here
+            for item in op["items"]:
+                taken = records.get(item)
+                if taken is not None and taken[1] is not None:
+                    ops.append({"op": "set", "id": taken[0], "record": taken[1]})
+        self.pending = ops
+        self.batches = []
+        self.deferred = {}
+        self.barrier = 0
+
+    def timed_flush(self):
+        # Large batch edits are serialized over several event loop passes
+        if self.batches and not self._serialize_batches(SERIALIZE_BUDGET_MS):
+            self.flush_timer.start(0)
+            return
+        self.flush()
+
+    def flush(self):
+        self.flush_timer.stop()
+        if self.batches:
+            self._serialize_batches(math.inf)
+            self._expand_batches()
+        if self.pending:
+            self.writer.append(self.pending)
+            self.pending = []
+            self.last_op = {}
+
+    def compact(self):
+        # Rewrite the journal as one snapshot of the scene so recovery does not replay a long history
+        if not self.recording or self.ops_since_compaction < COMPACT_MIN_OPS:
+            return
+        self.flush()
+        ops = [{"op": "base", "version": JOURNAL_VERSION, "document": self.document},
+               self._snapshot()]
+        self.ops_since_compaction = 0
+        self.writer.reset(self.path, ops)
@@ -6,6 +6,7 @@ from Shapes.Rectangle import Rectangle
 from Shapes.Ellipse import Ellipse
 from Shapes.Triangle import Triangle
 from Shapes.Line import Line
+from Shapes.Polyline import Polyline
 from Shapes.Text import Text
 from Shapes.Image import Image
 
@@ -23,6 +24,7 @@ class LeftDock(QDockWidget):
         self.ellipse_button = QPushButton("Ellipse")
         self.triangle_button = QPushButton("Triangle")
         self.line_button = QPushButton("Line")
+        self.polyline_button = QPushButton("Polyline")
         self.text_button = QPushButton("Text")
         self.image_button = QPushButton("Image")
 
@@ -30,6 +32,7 @@ class LeftDock(QDockWidget):
         self.layout.addWidget(self.ellipse_button)
         self.layout.addWidget(self.triangle_button)
         self.layout.addWidget(self.line_button)
+        self.layout.addWidget(self.polyline_button)
         self.layout.addWidget(self.text_button)
         self.layout.addWidget(self.image_button)
         self.layout.addStretch()
@@ -41,6 +44,7 @@ class LeftDock(QDockWidget):
         self.ellipse_button.clicked.connect(lambda: self.add_shape("ellipse"))
         self.triangle_button.clicked.connect(lambda: self.add_shape("triangle"))
         self.line_button.clicked.connect(lambda: self.add_shape("line"))
+        self.polyline_button.clicked.connect(lambda: self.add_shape("polyline"))
         self.text_button.clicked.connect(lambda: self.add_shape("text"))
         self.image_button.clicked.connect(lambda: self.add_shape("image"))
 
@@ -53,6 +57,7 @@ class LeftDock(QDockWidget):
             "ellipse": (Ellipse, (100, 50, 100, 100)),
             "triangle": (Triangle, (100, 50, 100, 100)),
             "line": (Line, (50, 50, 100, 100)),
+            "polyline": (Polyline, ()),
             "text": (Text, (100, 100)),
             "image": (Image, (100, 50, 100, 100)),
         }
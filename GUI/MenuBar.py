@@ -3,13 +3,19 @@ from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 from GUI.GridScene import *
-from Shapes.Image import Image
-from Shapes.Rectangle import Rectangle
-from Shapes.Ellipse import Ellipse
-from Shapes.Triangle import Triangle
-from Shapes.Text import Text
-from Shapes.Line import Line
-import json
+from GUI.SceneLoader import ChunkedClear, ProgressiveLoader, iter_json_array
+from GUI.BinaryFormat import BinaryDocument, is_binary_path, iter_binary
+from GUI.Bundle import bundle_record_count, is_bundle_path, iter_bundle, render_thumbnail
+from GUI.Journal import Journal, discard_journal, iter_recovered_records, recoverable_journal
+from GUI.SceneSaver import SaveTask, discard_temp_document
+from GUI.Virtualizer import SceneVirtualizer, VirtualDocument, should_virtualize
+from Shapes.Registry import deserialize_records, scene_snapshot
+from Shapes.CachePolicy import render_cache_policy
+from GUI.BatchEdit import batch_writer, undo_stack
+import os
+import zipfile
+
+DIAGRAM_FILE_FILTER = "Diagram Files (*.json);;Binary Diagram Files (*.dgb);;Diagram Bundles (*.dgz);;All Files (*)"
 
 is_dark_mode = True
 rotation_snap_angle = 15
@@ -18,6 +24,12 @@ class MenuBar(QMenuBar):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.is_grid_enabled = True
+        self.loader = None
+        self.clearer = None
+        self.journal = None
+        self.save_signals = None
+        self.virtualize_large_documents = True
+        self.cache_diagnostics = None
 
         # File Menu
         file_menu = self.addMenu("File")
@@ -33,6 +45,15 @@ class MenuBar(QMenuBar):
         exit_action = file_menu.addAction("Exit")
         exit_action.triggered.connect(QApplication.instance().quit)
 
+        # Edit Menu
+        edit_menu = self.addMenu("Edit")
+        undo_action = edit_menu.addAction("Undo")
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        undo_action.triggered.connect(self.undo)
+        redo_action = edit_menu.addAction("Redo")
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        redo_action.triggered.connect(self.redo)
+
         # Settings Menu
         settings_menu = self.addMenu("Settings")
         toggle_grid_action = settings_menu.addAction("Toggle Grid")
@@ -41,6 +62,43 @@ class MenuBar(QMenuBar):
         toggle_theme_action.triggered.connect(self.toggle_theme)
         set_rotation_snap_action = settings_menu.addAction("Set Rotation Snap")
         set_rotation_snap_action.triggered.connect(self.set_rotation_snap)
+        virtualize_action = settings_menu.addAction("Virtualize Large Documents")
+        virtualize_action.setCheckable(True)
+        virtualize_action.setChecked(self.virtualize_large_documents)
+        virtualize_action.toggled.connect(self.set_virtualize_large_documents)
+        cache_action = settings_menu.addAction("Adaptive Render Caching")
+        cache_action.setCheckable(True)
+        cache_action.setChecked(True)
+        cache_action.toggled.connect(self.set_adaptive_caching)
+        diagnostics_action = settings_menu.addAction("Render Cache Diagnostics")
+        diagnostics_action.triggered.connect(self.show_cache_diagnostics)
+
+        # Scene index strategy
+        index_menu = settings_menu.addMenu("Scene Index")
+        index_group = QActionGroup(self)
+        for label, strategy in (("BSP Tree", INDEX_BSP), ("No Index", INDEX_NONE), ("Uniform Grid", INDEX_GRID)):
+            action = index_menu.addAction(label)
+            action.setCheckable(True)
+            action.setChecked(strategy == INDEX_BSP)
+            action.triggered.connect(lambda checked, strategy=strategy: self.set_index_strategy(strategy))
+            index_group.addAction(action)
+
+    def undo(self):
+        main_window = self.parent()
+        if hasattr(main_window, "scene"):
+            undo_stack(main_window.scene).undo()
+
+    def redo(self):
+        main_window = self.parent()
+        if hasattr(main_window, "scene"):
+            undo_stack(main_window.scene).redo()
+
+    def clear_undo(self):
+        # Property edits of a document that is being replaced cannot be undone, nor finish writing
+        main_window = self.parent()
+        if hasattr(main_window, "scene"):
+            batch_writer(main_window.scene).cancel()
+            undo_stack(main_window.scene).clear()
 
     def toggle_theme(self):
         global is_dark_mode
@@ -80,6 +138,7 @@ class MenuBar(QMenuBar):
         # Set canvas (scene/view) background to black
         import GUI.Grid
         GUI.Grid.GRID_BG_COLOR = Qt.GlobalColor.black
+        GUI.Grid.GRID_RENDERER.invalidate()
         main_window = self.parent()
         if hasattr(main_window, "scene"):
             main_window.scene.setBackgroundBrush(QBrush(Qt.GlobalColor.black))
@@ -104,6 +163,7 @@ class MenuBar(QMenuBar):
         # Set canvas (scene/view) background to white
         import GUI.Grid
         GUI.Grid.GRID_BG_COLOR = Qt.GlobalColor.white
+        GUI.Grid.GRID_RENDERER.invalidate()
         main_window = self.parent()
         if hasattr(main_window, "scene"):
             main_window.scene.setBackgroundBrush(QBrush(Qt.GlobalColor.white))
@@ -117,6 +177,7 @@ class MenuBar(QMenuBar):
         global rotation_snap_angle
 
         GUI.Grid.IS_GRID_ENABLED = not GUI.Grid.IS_GRID_ENABLED
+        GUI.Grid.GRID_RENDERER.invalidate()
 
         # Set rotation snap to 1 if grid is off, restore to default if grid is on
         if not GUI.Grid.IS_GRID_ENABLED:
@@ -126,6 +187,8 @@ class MenuBar(QMenuBar):
 
         # Optionally, update the view to refresh the grid
         main_window = self.parent()
+        if hasattr(main_window, "scene"):
+            main_window.scene.update()
         if hasattr(main_window, "view"):
             main_window.view.viewport().update()
 
@@ -142,10 +205,87 @@ class MenuBar(QMenuBar):
         if ok:
             rotation_snap_angle = angle
 
+    def set_index_strategy(self, strategy):
+        main_window = self.parent()
+        if isinstance(getattr(main_window, "scene", None), GridScene):
+            main_window.scene.set_index_strategy(strategy)
+
+    def set_virtualize_large_documents(self, enabled):
+        # Takes effect with the next document that is opened
+        self.virtualize_large_documents = enabled
+
+    def set_adaptive_caching(self, enabled):
+        main_window = self.parent()
+        if hasattr(main_window, "scene"):
+            render_cache_policy(main_window.scene).set_enabled(enabled)
+
+    def show_cache_diagnostics(self):
+        from GUI.CacheDiagnostics import CacheDiagnosticsDock
+        main_window = self.parent()
+        if self.cache_diagnostics is None:
+            self.cache_diagnostics = CacheDiagnosticsDock(main_window, main_window.scene)
+            main_window.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.cache_diagnostics)
+        self.cache_diagnostics.show()
+        self.cache_diagnostics.raise_()
+
+    def attach_virtualizer(self, document):
+        main_window = self.parent()
+        SceneVirtualizer(main_window.scene, main_window.view, document, self)
+
+    def detach_virtualizer(self):
+        main_window = self.parent()
+        virtualizer = getattr(getattr(main_window, "scene", None), "virtualizer", None)
+        if virtualizer is not None:
+            virtualizer.detach()
+            virtualizer.deleteLater()
+
+    def start_journal(self):
+        """
+        Records the scene's edits in a journal, after offering to recover the
+        changes the last session did not save.
+        """
+        main_window = self.parent()
+        if not isinstance(getattr(main_window, "scene", None), GridScene):
+            return
+        self.journal = Journal(main_window.scene, self)
+        self.journal.failed.connect(lambda message: QMessageBox.warning(self, "Autosave", f"Failed to write the journal:\n{message}"))
+        recovery = recoverable_journal()
+        if recovery is None:
+            self.journal.start()
+            return
+        path, document = recovery
+        answer = QMessageBox.question(self, "Recover", "The last session ended with unsaved changes.\nRecover them?")
+        if answer != QMessageBox.StandardButton.Yes:
+            discard_journal(path)
+            self.journal.start()
+            return
+        self.journal.pause()
+        self.loader = ProgressiveLoader(main_window.scene, lambda: iter_recovered_records(path), 0, deserialize_records, self)
+        # The recovered scene differs from its document, so its journal starts with a snapshot
+        self.loader.finished.connect(lambda: self.restart_journal(document, snapshot=True))
+        self.loader.canceled.connect(lambda: self.restart_journal(document, snapshot=True))
+        self.loader.failed.connect(lambda message: QMessageBox.warning(self, "Recover", f"Failed to recover changes:\n{message}"))
+        self.loader.start()
+
+    def restart_journal(self, document=None, snapshot=False):
+        if self.journal is not None:
+            self.journal.start(document, snapshot)
+
+    def pause_journal(self):
+        if self.journal is not None:
+            self.journal.pause()
+
     def new_file(self):
         main_window = self.parent()
         if hasattr(main_window, "scene"):
-            main_window.scene.clear()
+            self.cancel_load()
+            self.pause_journal()
+            self.clear_undo()
+            self.detach_virtualizer()
+            # Tear the old document down in chunks so the window stays responsive
+            self.clearer = ChunkedClear(main_window.scene, self)
+            self.clearer.finished.connect(self.restart_journal)
+            self.clearer.start()
         else:
             QMessageBox.information(self, "New", "Scene clearing is not implemented.")
 
@@ -154,68 +294,121 @@ class MenuBar(QMenuBar):
         if not hasattr(main_window, "scene"):
             QMessageBox.information(self, "Open", "Scene loading is not implemented.")
             return
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Diagram", "", "Diagram Files (*.json);;All Files (*)")
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Diagram", "", DIAGRAM_FILE_FILTER)
         if file_name:
+            mapped = None
             try:
-                with open(file_name, "r", encoding="utf-8") as f:
-                    items_data = json.load(f)
-                main_window.scene.clear()
-                for item_data in items_data:
-                    item = self.deserialize_item(item_data)
-                    if item:
-                        main_window.scene.addItem(item)
-            except Exception as e:
+                if is_binary_path(file_name):
+                    # Binary files are memory-mapped, progress counts records instead of bytes
+                    mapped = BinaryDocument(file_name)
+                    total = len(mapped)
+                    source = lambda: iter_binary(file_name)
+                    virtual = should_virtualize(record_count=total)
+                elif is_bundle_path(file_name):
+                    # Bundles extract their images on the worker, images then load from small renditions
+                    total = bundle_record_count(file_name)
+                    source = lambda: iter_bundle(file_name)
+                    virtual = should_virtualize(record_count=total)
+                else:
+                    total = os.path.getsize(file_name)
+                    source = lambda: iter_json_array(file_name)
+                    virtual = should_virtualize(byte_size=total)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
                 QMessageBox.warning(self, "Open", f"Failed to open file:\n{e}")
+                return
+            self.cancel_load()
+            build_items = deserialize_records
+            if virtual and self.virtualize_large_documents and hasattr(main_window, "view"):
+                # Large documents are kept as records, only the shapes near the viewport become items
+                virtual_document = VirtualDocument()
+                build_items = lambda records: virtual_document.extend(records) or []
+                if mapped is not None:
+                    # The records stay in the mapped file, loading only indexes their bounds
+                    virtual_document.map_binary(mapped)
+                    source = virtual_document.mapped_batches
+                    build_items = lambda entry_ids: virtual_document.index_mapped(entry_ids) or []
+                    mapped = None
+            if mapped is not None:
+                mapped.close()
+            # Parse on a worker thread and build the items a frame's worth at a time. The open
+            # document, its journal and its undo history stay untouched until the whole file is
+            # parsed, so a failed or canceled load leaves them as they were.
+            self.loader = ProgressiveLoader(main_window.scene, source, total, build_items, self)
+            self.loader.replacing.connect(self.replace_document)
+            if build_items is not deserialize_records:
+                # Attach before the journal restarts, so the journal picks up the document's ids
+                self.loader.finished.connect(lambda: self.attach_virtualizer(virtual_document))
+                if virtual_document.source is not None:
+                    self.loader.canceled.connect(virtual_document.source.close)
+            self.loader.finished.connect(lambda: self.restart_journal(file_name))
+            self.loader.failed.connect(lambda message: QMessageBox.warning(self, "Open", f"Failed to open file:\n{message}"))
+            self.loader.start()
+
+    def replace_document(self):
+        # The loaded file is about to replace the open document
+        self.pause_journal()
+        self.clear_undo()
+        self.detach_virtualizer()
+
+    def cancel_load(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
 
     def save_file(self):
         main_window = self.parent()
         if not hasattr(main_window, "scene"):
             QMessageBox.information(self, "Save", "Scene saving is not implemented.")
             return
-        file_name, _ = QFileDialog.getSaveFileName(self, "Save Diagram", "", "Diagram Files (*.json);;All Files (*)")
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Diagram", "", DIAGRAM_FILE_FILTER)
         if file_name:
-            try:
-                items_data = [self.serialize_item(item) for item in main_window.scene.items()]
-                # Remove None items (if any)
-                items_data = [item for item in items_data if item is not None]
-                with open(file_name, "w", encoding="utf-8") as f:
-                    json.dump(items_data, f, indent=2)
-            except Exception as e:
-                QMessageBox.warning(self, "Save", f"Failed to save file:\n{e}")
-
-    def serialize_item(self, item):
-        if isinstance(item, Rectangle):
-            return item.to_dict()
-        if isinstance(item, Ellipse):
-            return item.to_dict()
-        if isinstance(item, Triangle):
-            return item.to_dict()
-        if isinstance(item, Text):
-            return item.to_dict()
-        if isinstance(item, Image):
-            return item.to_dict()
-        if isinstance(item, Line):
-            return item.to_dict()
-        return None
-
-    def deserialize_item(self, data):
-        if not data:
-            return None
-        t = data.get("type", "")
-        if t == "rectangle":
-            return Rectangle.from_dict(data)
-        if t == "ellipse":
-            return Ellipse.from_dict(data)
-        if t == "triangle":
-            return Triangle.from_dict(data)
-        if t == "text":
-            return Text.from_dict(data)
-        if t == "image":
-            return Image.from_dict(data)
-        if t == "line":
-            return Line.from_dict(data)
-        return None
-    
+            if self.save_signals is not None:
+                QMessageBox.information(self, "Save", "The previous save is still being written.")
+                return
+            # Only the snapshot is taken on the GUI thread, in document order, skipping the
+            # z-order sort of scene.items(). Encoding and writing run on a worker.
+            # Batch edits still being written are completed first
+            batch_writer(main_window.scene).finish()
+            virtualizer = getattr(main_window.scene, "virtualizer", None)
+            mapped = virtualizer is not None and virtualizer.document.maps(file_name)
+            if mapped:
+                saved_ids, snapshot = virtualizer.snapshot_with_ids()
+            else:
+                snapshot = scene_snapshot(main_window.scene)
+            thumbnail = render_thumbnail(main_window.scene) if is_bundle_path(file_name) else None
+            revision = self.journal.revision if self.journal is not None else 0
+            # The open document's records are read from the file being saved over, so the
+            # GUI thread unmaps it before renaming the written copy over it
+            task = SaveTask(file_name, snapshot, thumbnail, replace=not mapped)
+            self.save_signals = task.signals
+            if mapped:
+                document = virtualizer.document
+                self.save_signals.written.connect(
+                    lambda temp_path: self.replace_mapped(document, temp_path, saved_ids, file_name, revision))
+            self.save_signals.finished.connect(lambda path: self.save_finished(path, revision))
+            self.save_signals.failed.connect(self.save_failed)
+            QThreadPool.globalInstance().start(task)
+
+    def replace_mapped(self, document, temp_path, saved_ids, file_name, revision):
+        try:
+            document.replace_source(temp_path, saved_ids)
+        except OSError as e:
+            discard_temp_document(temp_path)
+            self.save_failed(str(e))
+            return
+        self.save_finished(file_name, revision)
+
+    def save_finished(self, file_name, revision):
+        self.save_signals = None
+        # The saved file is the journal's new base. Edits made while it was written
+        # are not in the file, so the journal then starts from a snapshot of the scene.
+        if self.journal is not None:
+            self.restart_journal(file_name, snapshot=self.journal.revision != revision)
+
+    def save_failed(self, message):
+        self.save_signals = None
+        QMessageBox.warning(self, "Save", f"Failed to save file:\n{message}")
+
     def print_diagram(self):
         main_window = self.parent()
         if not hasattr(main_window, "view"):
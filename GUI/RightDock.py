@@ -4,45 +4,297 @@ from PyQt6.QtGui import *
 from GUI.Grid import *
 from GUI.MenuBar import rotation_snap_angle
 from GUI.GridScene import *
+from GUI.BatchEdit import EDIT_CHUNK, edit_items
+from GUI.SceneLoader import FRAME_BUDGET_MS
+from GUI.Snapping import snap_point
+from GUI.FontCatalogue import FontPicker, font_catalogue
 
 from Shapes.Rectangle import Rectangle
 from Shapes.Ellipse import Ellipse
 from Shapes.Triangle import Triangle
 from Shapes.Text import Text
 from Shapes.Line import Line
-from Shapes.Image import Image
+from Shapes.Polyline import Polyline
+from Shapes.Image import SCALE_IDLE_MS, Image
+from Shapes.ImageDecoder import image_decoder
+from Shapes.ImageWatcher import image_watcher
+from contextlib import contextmanager
+from itertools import islice
+import math
+
+MIXED_TEXT = "Mixed"  # Shown by the controls of a property the selected shapes do not share
+
+@contextmanager
+def signals_blocked(*widgets):
+    # Syncing a panel to a newly selected item must not write the values back to it
+    blocked = [widget.blockSignals(True) for widget in widgets]
+    try:
+        yield
+    finally:
+        for widget, was_blocked in zip(widgets, blocked):
+            widget.blockSignals(was_blocked)
+
+def common_value(items, read):
+    """
+    The value read(item) of the first item when every item has it, otherwise None.
+    """
+    value = read(items[0])
+    for item in islice(items, 1, None):
+        if read(item) != value:
+            return None
+    return value
+
+def show_spin_value(spin, value, minimum):
+    # A mixed spin box shows MIXED_TEXT on one step below its range, any step up is a value again
+    if value is None:
+        spin.setMinimum(minimum - 1)
+        spin.setSpecialValueText(MIXED_TEXT)
+        spin.setValue(minimum - 1)
+    else:
+        spin.setSpecialValueText("")
+        spin.setMinimum(minimum)
+        spin.setValue(value)
+
+def settle_spin(spin):
+    if spin.specialValueText():
+        with signals_blocked(spin):
+            spin.setSpecialValueText("")
+            spin.setMinimum(spin.minimum() + 1)
+
+def show_combo_data(combo, data):
+    # Mixed combos show no entry
+    combo.setCurrentIndex(combo.findData(data) if data is not None else -1)
+
+def show_color(button, color, text):
+    if color is None:
+        button.setText(MIXED_TEXT)
+        button.setStyleSheet("")
+    else:
+        button.setText(text)
+        button.setStyleSheet(f"background-color: {QColor(color).name()};")
+
+def set_line_pen(item, pen):
+    # Lines keep the parts of their pen as attributes as well
+    item.line_color = pen.color()
+    item.line_width = pen.width()
+    item.line_style = pen.style()
+    item.cap_style = pen.capStyle()
+    item.setPen(pen)
 
 class RightDock(QDockWidget):
+    """
+    The properties of the selected shapes. Each kind of shape has one panel, built
+    the first time such a shape is selected and rebound to every later selection,
+    so changing the selection only copies values into existing controls. Edits
+    apply to every selected shape of the panel's kind as one undo step, and
+    properties the shapes do not share show as mixed. In a virtualized scene the
+    selection is taken by entry id, the selected shapes that are not materialized
+    are edited by their records and the panel shows the values of the others.
+    """
     def __init__(self, parent=None):
         super().__init__("Properties", parent)
         self.setAllowedAreas(Qt.DockWidgetArea.RightDockWidgetArea)
-        self.main_widget = QWidget()
-        self.form_layout = QFormLayout()
+        self.panels = QStackedWidget()
+        self.panel_kinds = {}  # Kind of shape -> its panel, see panel_kind()
+        self.panel_fields = {}  # Kind of shape -> the (read, control, show) of each control, see show_fields()
+        self.pen_fields = []  # The fields of the shape panel's pen and brush controls
+        self.slider_labels = {}  # Slider -> (label, text), the label marks mixed values
+        self.setWidget(self.panels)
+        self.item = None  # The first of the edited items, the image preview shows it
+        self.items = []
+        self.selection = []  # The selected items the panel was last set from
+        self.virtualizer = None  # SceneVirtualizer of a virtualized scene's selection
+        self.entry_ids = []  # Entry ids of the selected shapes of the panel's kind in that scene
+        self.scale_start_sizes = None  # Image sizes before the current scale slider drag
+        self.preview_request = None
+        self.editing = False  # Set while an edit of the panel is pushed to the undo stack
+        self.reading = None  # [items, fields, their common values, next item] of a refresh in progress
+        self.read_timer = QTimer(self)
+        self.read_timer.timeout.connect(self.read_values)
+        font_catalogue()
+        # Resamples a rescaled image once the scale slider rests
+        self.scale_timer = QTimer(self)
+        self.scale_timer.setSingleShot(True)
+        self.scale_timer.timeout.connect(self.commit_image_size)
+        image_watcher().image_changed.connect(self.linked_image_changed)
+
+    def panel_kind(self, cls):
+        if issubclass(cls, (Rectangle, Ellipse, Triangle)):
+            return "shape"
+        if issubclass(cls, Text):
+            return "text"
+        if issubclass(cls, (Line, Polyline)):
+            return "line"
+        if issubclass(cls, Image):
+            return "image"
+        return None
+
+    def panel(self, kind):
+        panel = self.panel_kinds.get(kind)
+        if panel is None:
+            builders = {"shape": self.build_shape_panel, "text": self.build_text_panel,
+                        "line": self.build_line_panel, "image": self.build_image_panel}
+            builder = builders.get(kind)
+            # Other shapes get an empty panel
+            panel = builder() if builder is not None else QWidget()
+            self.panel_kinds[kind] = panel
+            self.panels.addWidget(panel)
+        return panel
+
+    def fields(self, kind, first):
+        # Shapes without a pen have no pen and brush controls
+        fields = self.panel_fields.get(kind, [])
+        if kind == "shape" and hasattr(first, "pen") and hasattr(first, "brush"):
+            fields = fields + self.pen_fields
+        return fields
+
+    def show_fields(self, fields, items):
+        # Each control shows the value read(item) the items share, or that they are mixed
+        first = items[0]
+        for read, control, show in fields:
+            with signals_blocked(control):
+                show(common_value(items, read), first)
+
+    def refresh(self):
+        """
+        Shows the values of the bound items again, e.g. after undo. The items of a
+        large selection are read a chunk per event loop pass and the controls
+        change once all of them are read, so a refresh keeps to the frame budget.
+        """
+        self.read_timer.stop()
+        items = self.items or [self.item]
+        fields = self.fields(self.panel_kind(type(self.item)), self.item)
+        self.reading = [items, fields, [read(items[0]) for read, _, _ in fields], 1]
+        if len(items) > EDIT_CHUNK:
+            self.read_timer.start(0)
+        else:
+            self.read_values()
+
+    def read_values(self, budget_ms=FRAME_BUDGET_MS, skip=None):
+        clock = QElapsedTimer()
+        clock.start()
+        items, fields, values, start = self.reading
+        while start < len(items):
+            if clock.elapsed() >= budget_ms:
+                self.reading[3] = start
+                if not self.read_timer.isActive():
+                    self.read_timer.start(0)
+                return
+            for item in islice(items, start, start + EDIT_CHUNK):
+                for index, (read, _, _) in enumerate(fields):
+                    if values[index] is not None and read(item) != values[index]:
+                        values[index] = None
+            start += EDIT_CHUNK
+        self.read_timer.stop()
+        self.reading = None
+        for (_, control, show), value in zip(fields, values):
+            if control is not skip:
+                with signals_blocked(control):
+                    show(value, items[0])
+
+    def slider_label(self, slider, text):
+        label = QLabel(text)
+        self.slider_labels[slider] = (label, text)
+        return label
+
+    def show_slider_value(self, slider, value, fallback):
+        # Sliders cannot show a mixed value, their label says so and the first item's value is shown
+        label, text = self.slider_labels[slider]
+        label.setText(text if value is not None else f"{text} ({MIXED_TEXT.lower()})")
+        slider.setValue(int(value if value is not None else fallback))
+
+    def settle_slider(self, slider):
+        label, text = self.slider_labels[slider]
+        label.setText(text)
+
+    def set_controls(self, item):
+        self.set_selection([item])
+
+    def set_selection(self, items, virtualizer=None):
+        """
+        Shows the panel of the first item's kind, bound to every selected item of that kind.
+        With the virtualizer of a virtualized scene the panel is bound to its selected
+        entry ids, and a shape that is not materialized shows when no item is selected.
+        """
+        if self.scale_timer.isActive():
+            self.commit_image_size()
+        if self.preview_request is not None:
+            self.preview_request.cancel()
+            self.preview_request = None
+        self.read_timer.stop()
+        self.reading = None
+        self.selection = items
+        entry_ids = virtualizer.selected_ids() if virtualizer is not None else []
+        first = items[0] if items else virtualizer.shape_item(entry_ids[0])
+        kind = self.panel_kind(type(first))
+        self.items = [item for item in items if self.panel_kind(type(item)) == kind]
+        self.item = first
+        self.virtualizer = virtualizer
+        if virtualizer is not None:
+            shape_class = virtualizer.document.shape_class
+            self.entry_ids = [entry_id for entry_id in entry_ids if self.panel_kind(shape_class(entry_id)) == kind]
+        else:
+            self.entry_ids = []
+        count = len(self.entry_ids) if virtualizer is not None else len(self.items)
+        self.setWindowTitle("Properties" if count == 1 else f"Properties ({count} shapes)")
+
+        shown = self.items or [first]
+        panel = self.panel(kind)
+        if kind == "shape":
+            self.set_shape_controls(shown)
+        elif kind == "text":
+            self.set_text_controls(shown)
+        elif kind == "line":
+            self.set_line_controls(shown)
+        elif kind == "image":
+            self.set_image_controls(shown)
+        self.panels.setCurrentWidget(panel)
+
+    def edit(self, text, read, write, value, restore=None, geometry=False):
+        # One undo step for all edited items, items outside a scene are simply set
+        virtualizer = self.virtualizer
+        entry_ids = ()
+        if virtualizer is not None and virtualizer.scene.virtualizer is virtualizer:
+            scene, entry_ids = virtualizer.scene, self.entry_ids
+        else:
+            scene = self.item.scene() if self.item is not None else None
+        if scene is None:
+            for item in self.items:
+                write(item, value)
+            return
+        if self.reading is not None:
+            # The edited control shows its new value already
+            self.read_values(math.inf, skip=self.sender())
+        self.editing = True
+        try:
+            edit_items(scene, text, self.items, read, write, value, restore, geometry, entry_ids)
+        finally:
+            self.editing = False
+
+    # Rectangle, ellipse and triangle controls
+    def build_shape_panel(self):
+        panel = QWidget()
+        form_layout = QFormLayout()
+        panel.setLayout(form_layout)
+
         self.width_slider = QSlider(Qt.Orientation.Horizontal)
         self.height_slider = QSlider(Qt.Orientation.Horizontal)
         self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
-
         self.width_slider.setRange(10, 400)
         self.height_slider.setRange(10, 400)
         self.rotation_slider.setRange(0, 360)
+        form_layout.addRow(self.slider_label(self.width_slider, "Width"), self.width_slider)
+        form_layout.addRow(self.slider_label(self.height_slider, "Height"), self.height_slider)
+        form_layout.addRow(self.slider_label(self.rotation_slider, "Rotation"), self.rotation_slider)
 
-        self.form_layout.addRow(QLabel("Width"), self.width_slider)
-        self.form_layout.addRow(QLabel("Height"), self.height_slider)
-        self.form_layout.addRow(QLabel("Rotation"), self.rotation_slider)
-
-        # --- Controls for color and border ---
+        # Color and border controls
         self.fill_color_btn = QPushButton("Fill Color")
         self.border_color_btn = QPushButton("Border Color")
         self.border_width_spin = QSpinBox()
         self.border_width_spin.setRange(1, 20)
-        self.form_layout.addRow(QLabel("Fill Color"), self.fill_color_btn)
-        self.form_layout.addRow(QLabel("Border Color"), self.border_color_btn)
-        self.form_layout.addRow(QLabel("Border Width"), self.border_width_spin)
-        # ----------------------------------------
-
-        self.main_widget.setLayout(self.form_layout)
-        self.setWidget(self.main_widget)
-        self.item = None
+        form_layout.addRow(QLabel("Fill Color"), self.fill_color_btn)
+        form_layout.addRow(QLabel("Border Color"), self.border_color_btn)
+        form_layout.addRow(QLabel("Border Width"), self.border_width_spin)
 
         self.width_slider.valueChanged.connect(self.update_width)
         self.height_slider.valueChanged.connect(self.update_height)
@@ -51,151 +303,174 @@ class RightDock(QDockWidget):
         self.border_color_btn.clicked.connect(self.change_border_color)
         self.border_width_spin.valueChanged.connect(self.change_border_width)
 
-    def set_controls(self, item):
-        # Remove old controls
-        self.setWidget(None)
-        self.item = item
-
-        if isinstance(item, (Rectangle, Ellipse, Triangle)):
-            # Add default controls
-            self.form_layout.addRow(QLabel("Width"), self.width_slider)
-            self.form_layout.addRow(QLabel("Height"), self.height_slider)
-            self.form_layout.addRow(QLabel("Rotation"), self.rotation_slider)
-            self.form_layout.addRow(QLabel("Fill Color"), self.fill_color_btn)
-            self.form_layout.addRow(QLabel("Border Color"), self.border_color_btn)
-            self.form_layout.addRow(QLabel("Border Width"), self.border_width_spin)
-
-            rect = item.rect()
-            self.width_slider.setValue(int(rect.width()))
-            self.height_slider.setValue(int(rect.height()))
-            self.rotation_slider.setValue(int(getattr(item, "rotation_angle", 0)))
-            if hasattr(item, "pen") and hasattr(item, "brush"):
-                pen = item.pen()
-                self.border_width_spin.setValue(pen.width())
-                self.fill_color_btn.setEnabled(True)
-                self.border_color_btn.setEnabled(True)
-                self.border_width_spin.setEnabled(True)
-            else:
-                self.fill_color_btn.setEnabled(False)
-                self.border_color_btn.setEnabled(False)
-                self.border_width_spin.setEnabled(False)
-        elif isinstance(item, Text):
-            self.set_text_controls(item)
-        elif isinstance(item, Line):
-            self.set_line_controls(item)
-        elif isinstance(item, Image):
-            self.set_image_controls(item)
-        else:
-            # For other shapes, you may want to clear controls or add generic ones
-            self.setWidget(QWidget())
+        self.panel_fields["shape"] = [
+            (lambda item: item.rect().width(), self.width_slider,
+             lambda width, first: self.show_slider_value(self.width_slider, width, first.rect().width())),
+            (lambda item: item.rect().height(), self.height_slider,
+             lambda height, first: self.show_slider_value(self.height_slider, height, first.rect().height())),
+            (lambda item: item.rotation(), self.rotation_slider,
+             lambda angle, first: self.show_slider_value(self.rotation_slider, angle, first.rotation())),
+        ]
+        self.pen_fields = [
+            (lambda item: item.pen().width(), self.border_width_spin,
+             lambda width, first: show_spin_value(self.border_width_spin, width, 1)),
+            (lambda item: item.brush().color(), self.fill_color_btn,
+             lambda color, first: show_color(self.fill_color_btn, color, "Fill Color")),
+            (lambda item: item.pen().color(), self.border_color_btn,
+             lambda color, first: show_color(self.border_color_btn, color, "Border Color")),
+        ]
+        return panel
+
+    def set_shape_controls(self, items):
+        first = items[0]
+        has_pen = hasattr(first, "pen") and hasattr(first, "brush")
+        self.show_fields(self.fields("shape", first), items)
+        self.fill_color_btn.setEnabled(has_pen)
+        self.border_color_btn.setEnabled(has_pen)
+        self.border_width_spin.setEnabled(has_pen)
 
     def update_width(self, value):
-        if self.item:
-            self.item.setWidth(value)
-            for view in self.item.scene().views():
-                view.viewport().update()
+        self.settle_slider(self.width_slider)
+        self.edit("Width", lambda item: item.rect(), lambda item, width: item.setWidth(width), value,
+                  restore=self.restore_rect, geometry=True)
 
     def update_height(self, value):
-        if self.item:
-            self.item.setHeight(value)
-            for view in self.item.scene().views():
-                view.viewport().update()
+        self.settle_slider(self.height_slider)
+        self.edit("Height", lambda item: item.rect(), lambda item, height: item.setHeight(height), value,
+                  restore=self.restore_rect, geometry=True)
+
+    def restore_rect(self, item, rect):
+        item.setRect(rect)
+        item.setTransformOriginPoint(rect.center())
 
     def update_rotation(self, value):
         import GUI.Grid
-        if self.item:
-            if GUI.Grid.IS_GRID_ENABLED:
-                snapped_angle = round(value / rotation_snap_angle) * rotation_snap_angle
-            else:
-                snapped_angle = value
-            self.item.setRotation(snapped_angle)
-            for view in self.item.scene().views():
-                view.viewport().update()
+        self.settle_slider(self.rotation_slider)
+        if GUI.Grid.IS_GRID_ENABLED:
+            snapped_angle = round(value / rotation_snap_angle) * rotation_snap_angle
+        else:
+            snapped_angle = value
+        self.edit("Rotation", QGraphicsItem.rotation, QGraphicsItem.setRotation, snapped_angle, geometry=True)
 
     def change_fill_color(self):
         if self.item:
             color = QColorDialog.getColor(self.item.brush().color(), self, "Select Fill Color")
             if color.isValid():
-                self.item.setBrush(QBrush(color))
+                # One brush shared by every item, the unbound methods spare a Python frame per item
+                self.edit("Fill Color", QAbstractGraphicsShapeItem.brush, QAbstractGraphicsShapeItem.setBrush,
+                          QBrush(color))
+                show_color(self.fill_color_btn, color, "Fill Color")
 
     def change_border_color(self):
         if self.item:
             color = QColorDialog.getColor(self.item.pen().color(), self, "Select Border Color")
             if color.isValid():
-                pen = self.item.pen()
-                pen.setColor(color)
-                self.item.setPen(pen)
+                self.edit("Border Color", QAbstractGraphicsShapeItem.pen, self.set_pen_color, color,
+                          restore=QAbstractGraphicsShapeItem.setPen, geometry=True)
+                show_color(self.border_color_btn, color, "Border Color")
+
+    def set_pen_color(self, item, color):
+        pen = item.pen()
+        pen.setColor(color)
+        item.setPen(pen)
 
     def change_border_width(self, value):
-        if self.item:
-            pen = self.item.pen()
-            pen.setWidth(value)
-            self.item.setPen(pen)
+        settle_spin(self.border_width_spin)
+        self.edit("Border Width", QAbstractGraphicsShapeItem.pen, self.set_pen_width, value,
+                  restore=QAbstractGraphicsShapeItem.setPen, geometry=True)
 
-    # Text controls
-    def set_text_controls(self, shape):
-        self.item = shape  # Store the current item for use in other methods
+    def set_pen_width(self, item, width):
+        pen = item.pen()
+        pen.setWidth(width)
+        item.setPen(pen)
 
-        slider_widget = QWidget()
+    # Text controls
+    def build_text_panel(self):
+        panel = QWidget()
         layout = QVBoxLayout()
         layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        slider_widget.setLayout(layout)
+        panel.setLayout(layout)
 
         # Rotation controls
-        self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
-        self.rotation_slider.setMinimum(0)
-        self.rotation_slider.setMaximum(360)
-        self.rotation_slider.setValue(int(shape.rotation()))
-        layout.addWidget(QLabel("Rotation (deg):"))
-        layout.addWidget(self.rotation_slider)
-        self.rotation_slider.valueChanged.connect(self.rotate_text)
+        self.text_rotation_slider = QSlider(Qt.Orientation.Horizontal)
+        self.text_rotation_slider.setMinimum(0)
+        self.text_rotation_slider.setMaximum(360)
+        layout.addWidget(self.slider_label(self.text_rotation_slider, "Rotation (deg):"))
+        layout.addWidget(self.text_rotation_slider)
+        self.text_rotation_slider.valueChanged.connect(self.rotate_text)
 
         # Text color controls (color picker)
         layout.addWidget(QLabel("Text Color:"))
-        self.color_button = QPushButton("Choose Color")
-        self.color_button.clicked.connect(self.choose_text_color)
-        layout.addWidget(self.color_button)
+        self.text_color_button = QPushButton("Choose Color")
+        self.text_color_button.clicked.connect(self.choose_text_color)
+        layout.addWidget(self.text_color_button)
 
         # Font family controls
         layout.addWidget(QLabel("Font:"))
-        self.font_combo = QFontComboBox()
-        self.font_combo.setCurrentFont(shape.font())
-        layout.addWidget(self.font_combo)
-        self.font_combo.currentFontChanged.connect(self.update_text_font)
+        self.font_picker = FontPicker()
+        self.font_picker.currentFontChanged.connect(self.update_text_family)
+        layout.addWidget(self.font_picker)
 
         # Font size controls
         layout.addWidget(QLabel("Font Size:"))
         self.font_size_spin = QSpinBox()
         self.font_size_spin.setRange(6, 72)
-        self.font_size_spin.setValue(shape.font().pointSize())
         layout.addWidget(self.font_size_spin)
-        self.font_size_spin.valueChanged.connect(self.update_text_font)
+        self.font_size_spin.valueChanged.connect(self.update_text_size)
+
+        self.panel_fields["text"] = [
+            (lambda item: item.rotation(), self.text_rotation_slider,
+             lambda angle, first: self.show_slider_value(self.text_rotation_slider, angle, first.rotation())),
+            (lambda item: item.font().pointSize(), self.font_size_spin,
+             lambda size, first: show_spin_value(self.font_size_spin, size, 6)),
+            (lambda item: item.font().family(), self.font_picker, self.show_text_family),
+            (lambda item: item.defaultTextColor(), self.text_color_button,
+             lambda color, first: show_color(self.text_color_button, color, "Choose Color")),
+        ]
+        return panel
+
+    def set_text_controls(self, items):
+        self.show_fields(self.fields("text", items[0]), items)
+
+    def show_text_family(self, family, first):
+        if family is not None:
+            self.font_picker.setCurrentFont(first.font())
+        else:
+            self.font_picker.clearCurrentFont()
+
+    def update_text_family(self, font):
+        self.edit("Font", lambda item: item.font(), self.set_text_family, font.family(),
+                  restore=lambda item, font: item.setFont(font), geometry=True)
 
-        # Set the new widget as the dock's widget
-        self.setWidget(slider_widget)
+    def set_text_family(self, item, family):
+        font = item.font()
+        font.setFamily(family)
+        item.setFont(font)
 
-    def update_text_font(self):
-        font = self.font_combo.currentFont()
-        font.setPointSize(self.font_size_spin.value())
-        self.item.setFont(font)
+    def update_text_size(self, size):
+        settle_spin(self.font_size_spin)
+        self.edit("Font Size", lambda item: item.font(), self.set_text_size, size,
+                  restore=lambda item, font: item.setFont(font), geometry=True)
+
+    def set_text_size(self, item, size):
+        font = item.font()
+        font.setPointSize(size)
+        item.setFont(font)
 
     def rotate_text(self, angle):
-        if self.item:
-            rect = self.item.boundingRect()
-            self.item.setTransformOriginPoint(rect.center())
-            self.item.setRotation(angle)
+        self.settle_slider(self.text_rotation_slider)
+        self.edit("Rotation", lambda item: item.rotation(), self.rotate_about_center, angle, geometry=True)
+
+    def rotate_about_center(self, item, angle):
+        item.setTransformOriginPoint(item.boundingRect().center())
+        item.setRotation(angle)
 
     def choose_text_color(self):
-        # Use defaultTextColor for QGraphicsTextItem (Text)
-        if hasattr(self.item, "defaultTextColor"):
-            current_color = self.item.defaultTextColor()
-        else:
-            current_color = Qt.GlobalColor.black
-        color = QColorDialog.getColor(initial=current_color, parent=self, title="Select Text Color")
+        color = QColorDialog.getColor(initial=self.item.defaultTextColor(), parent=self, title="Select Text Color")
         if color.isValid():
-            if hasattr(self.item, "setDefaultTextColor"):
-                self.item.setDefaultTextColor(color)
-            self.color_button.setStyleSheet(f"background-color: {color.name()};")
+            self.edit("Text Color", lambda item: item.defaultTextColor(),
+                      lambda item, color: item.setDefaultTextColor(color), color)
+            show_color(self.text_color_button, color, "Choose Color")
 
     def update_text_pen(self):
         color = getattr(self.item, "line_color", Qt.GlobalColor.white)
@@ -203,34 +478,32 @@ class RightDock(QDockWidget):
         self.item.setPen(pen)
 
     # Line controls
-    def set_line_controls(self, shape):
-        slider_widget = QWidget()
+    def build_line_panel(self):
+        panel = QWidget()
         layout = QVBoxLayout()
         layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        slider_widget.setLayout(layout)
+        panel.setLayout(layout)
 
         # Rotation controls
-        self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
-        self.rotation_slider.setMinimum(0)
-        self.rotation_slider.setMaximum(360)
-        self.rotation_slider.setValue(0)
-        layout.addWidget(QLabel("Rotation (deg):"))
-        layout.addWidget(self.rotation_slider)
-        self.rotation_slider.valueChanged.connect(self.rotate_line)
+        self.line_rotation_slider = QSlider(Qt.Orientation.Horizontal)
+        self.line_rotation_slider.setMinimum(0)
+        self.line_rotation_slider.setMaximum(360)
+        layout.addWidget(self.slider_label(self.line_rotation_slider, "Rotation (deg):"))
+        layout.addWidget(self.line_rotation_slider)
+        self.line_rotation_slider.valueChanged.connect(self.rotate_line)
 
         # Line color controls (color picker)
         layout.addWidget(QLabel("Line Color:"))
-        self.color_button = QPushButton("Choose Color")
-        self.color_button.clicked.connect(self.choose_line_color)
-        layout.addWidget(self.color_button)
+        self.line_color_button = QPushButton("Choose Color")
+        self.line_color_button.clicked.connect(self.choose_line_color)
+        layout.addWidget(self.line_color_button)
 
         # Line width controls
         layout.addWidget(QLabel("Line Width:"))
         self.width_spin = QSpinBox()
         self.width_spin.setRange(1, 20)
-        self.width_spin.setValue(3)
         layout.addWidget(self.width_spin)
-        self.width_spin.valueChanged.connect(self.update_line_pen)
+        self.width_spin.valueChanged.connect(self.update_line_width)
 
         # Line style controls
         layout.addWidget(QLabel("Line Style:"))
@@ -240,9 +513,8 @@ class RightDock(QDockWidget):
         self.style_combo.addItem("Dot", Qt.PenStyle.DotLine)
         self.style_combo.addItem("Dash Dot", Qt.PenStyle.DashDotLine)
         self.style_combo.addItem("Dash Dot Dot", Qt.PenStyle.DashDotDotLine)
-        self.style_combo.setCurrentIndex(0)
         layout.addWidget(self.style_combo)
-        self.style_combo.currentIndexChanged.connect(self.update_line_pen)
+        self.style_combo.currentIndexChanged.connect(self.update_line_style)
 
         # Cap style controls
         layout.addWidget(QLabel("Cap Style:"))
@@ -250,59 +522,88 @@ class RightDock(QDockWidget):
         self.cap_combo.addItem("Square", Qt.PenCapStyle.SquareCap)
         self.cap_combo.addItem("Flat", Qt.PenCapStyle.FlatCap)
         self.cap_combo.addItem("Round", Qt.PenCapStyle.RoundCap)
-        self.cap_combo.setCurrentIndex(0)
         layout.addWidget(self.cap_combo)
-        self.cap_combo.currentIndexChanged.connect(self.update_line_pen)
-
-        # Set the new widget as the dock's widget
-        self.setWidget(slider_widget)
+        self.cap_combo.currentIndexChanged.connect(self.update_line_cap)
+
+        self.panel_fields["line"] = [
+            (lambda item: item.rotation(), self.line_rotation_slider,
+             lambda angle, first: self.show_slider_value(self.line_rotation_slider, angle, first.rotation())),
+            (lambda item: item.pen().width(), self.width_spin,
+             lambda width, first: show_spin_value(self.width_spin, width, 1)),
+            (lambda item: item.pen().style(), self.style_combo,
+             lambda style, first: show_combo_data(self.style_combo, style)),
+            (lambda item: item.pen().capStyle(), self.cap_combo,
+             lambda cap, first: show_combo_data(self.cap_combo, cap)),
+            (lambda item: item.pen().color(), self.line_color_button,
+             lambda color, first: show_color(self.line_color_button, color, "Choose Color")),
+        ]
+        return panel
+
+    def set_line_controls(self, items):
+        self.show_fields(self.fields("line", items[0]), items)
 
     def rotate_line(self, angle):
-        # Get the center of the line
-        line = self.item.line()
-        center = line.pointAt(0.5)
-        self.item.setTransformOriginPoint(center)
-        self.item.setRotation(angle)
+        self.settle_slider(self.line_rotation_slider)
+        self.edit("Rotation", lambda item: item.rotation(), self.rotate_line_item, angle, geometry=True)
+
+    def rotate_line_item(self, item, angle):
+        # Get the center of the line, or of the whole path of a polyline
+        if isinstance(item, Line):
+            center = item.line().pointAt(0.5)
+        else:
+            center = item.boundingRect().center()
+        item.setTransformOriginPoint(center)
+        item.setRotation(angle)
+
+    def edit_line_pen(self, text, change, value):
+        # Each control changes its part of the pen and keeps the rest of every item's pen
+        def write(item, value):
+            pen = item.pen()
+            change(pen, value)
+            set_line_pen(item, pen)
+        self.edit(text, lambda item: item.pen(), write, value, restore=set_line_pen, geometry=True)
 
     def choose_line_color(self):
         color = QColorDialog.getColor(initial=self.item.pen().color(), parent=self, title="Select Line Color")
         if color.isValid():
-            self.item.line_color = color
-            self.color_button.setStyleSheet(f"background-color: {color.name()};")
-            self.update_line_pen()
+            self.edit_line_pen("Line Color", QPen.setColor, color)
+            show_color(self.line_color_button, color, "Choose Color")
 
-    def update_line_pen(self):
-        color = getattr(self.item, "line_color", Qt.GlobalColor.white)
-        width = self.width_spin.value()
-        style = self.style_combo.currentData()
-        cap = self.cap_combo.currentData()
-        pen = QPen(color, width, style, cap)
-        self.item.setPen(pen)
+    def update_line_width(self, width):
+        settle_spin(self.width_spin)
+        self.edit_line_pen("Line Width", QPen.setWidth, width)
+
+    def update_line_style(self, index):
+        if index >= 0:
+            self.edit_line_pen("Line Style", QPen.setStyle, self.style_combo.itemData(index))
+
+    def update_line_cap(self, index):
+        if index >= 0:
+            self.edit_line_pen("Cap Style", QPen.setCapStyle, self.cap_combo.itemData(index))
 
     # Image controls
-    def set_image_controls(self, shape):
-        slider_widget = QWidget()
+    def build_image_panel(self):
+        panel = QWidget()
         layout = QVBoxLayout()
         layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        slider_widget.setLayout(layout)
+        panel.setLayout(layout)
 
         # Rotation controls
-        self.rotation_slider = QSlider(Qt.Orientation.Horizontal)
-        self.rotation_slider.setMinimum(0)
-        self.rotation_slider.setMaximum(360)
-        self.rotation_slider.setValue(0)
-        layout.addWidget(QLabel("Rotation (deg):"))
-        layout.addWidget(self.rotation_slider)
-        self.rotation_slider.valueChanged.connect(self.rotate_image)
+        self.image_rotation_slider = QSlider(Qt.Orientation.Horizontal)
+        self.image_rotation_slider.setMinimum(0)
+        self.image_rotation_slider.setMaximum(360)
+        layout.addWidget(self.slider_label(self.image_rotation_slider, "Rotation (deg):"))
+        layout.addWidget(self.image_rotation_slider)
+        self.image_rotation_slider.valueChanged.connect(self.rotate_image)
 
         # Image scale control
-        layout.addWidget(QLabel("Image Scale:"))
         self.scale_slider = QSlider(Qt.Orientation.Horizontal)
         self.scale_slider.setMinimum(10)
         self.scale_slider.setMaximum(1000)
-        self.scale_slider.setValue(int(self.item.rect().width()))
+        layout.addWidget(self.slider_label(self.scale_slider, "Image Scale:"))
         layout.addWidget(self.scale_slider)
         self.scale_slider.valueChanged.connect(self.update_image_size)
+        self.scale_slider.sliderReleased.connect(self.commit_image_size)
 
         # Image file selector
         layout.addWidget(QLabel("Image File:"))
@@ -314,19 +615,55 @@ class RightDock(QDockWidget):
         self.image_preview = QLabel()
         self.image_preview.setFixedSize(120, 120)
         self.image_preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.update_image_preview(self.item.image_path)
         layout.addWidget(self.image_preview)
 
-        # Set the new widget as the dock's widget
-        self.setWidget(slider_widget)
+        self.panel_fields["image"] = [
+            (lambda item: item.rotation(), self.image_rotation_slider,
+             lambda angle, first: self.show_slider_value(self.image_rotation_slider, angle, first.rotation())),
+            (lambda item: int(item.rect().width()), self.scale_slider,
+             lambda width, first: self.show_slider_value(self.scale_slider, width, first.rect().width())),
+            # The preview shows the first image, also when the files differ
+            (lambda item: item.image_path, self.image_select_button, self.show_image_preview),
+        ]
+        return panel
+
+    def set_image_controls(self, items):
+        self.show_fields(self.fields("image", items[0]), items)
+
+    def show_image_preview(self, path, first):
+        # The previous image's preview must not show while this one decodes
+        self.image_preview.clear()
+        self.update_image_preview(first.image_path)
+
+    def image_size(self, item):
+        if item.target_size is not None:
+            return item.target_size
+        rect = item.rect()
+        return (int(rect.width()), int(rect.height()))
 
     def update_image_size(self):
         scale = self.scale_slider.value()
-        # Snap the current position to the grid
-        x, y = GridScene.snap_to_grid(self.item.pos().x(), self.item.pos().y())
-        self.item.setPos(x, y)
-        self.item.set_image(self.item.image_path, scale, scale)
-        self.update_image_preview(self.item.image_path)
+        self.settle_slider(self.scale_slider)
+        # A selection of unmaterialized images previews the scale on the shown one
+        items = self.items or [self.item]
+        if self.scale_start_sizes is None:
+            self.scale_start_sizes = {item: self.image_size(item) for item in items}
+        for item in items:
+            # Snap the current position to the grid
+            item.setPos(snap_point(item.pos()))
+            # Stretch the current pixels while the slider moves, resample once it rests
+            item.preview_scale(scale, scale)
+        self.scale_timer.start(SCALE_IDLE_MS)
+
+    def commit_image_size(self):
+        self.scale_timer.stop()
+        start_sizes, self.scale_start_sizes = self.scale_start_sizes, None
+        if not isinstance(self.item, Image) or self.item.target_size is None or start_sizes is None:
+            return
+        # The previews show the new size already, undo restores the sizes from before the drag.
+        # Images edited by their records were not previewed and still have those sizes.
+        self.edit("Image Scale", lambda item: start_sizes.get(item) or self.image_size(item),
+                  lambda item, size: item.set_image(item.image_path, *size), self.item.target_size, geometry=True)
 
     def select_image_file(self):
         file_dialog = QFileDialog(self)
@@ -335,22 +672,33 @@ class RightDock(QDockWidget):
             selected_files = file_dialog.selectedFiles()
             if selected_files:
                 image_path = selected_files[0]
-                # Update the image in the scene
-                rect = self.item.rect()
-                self.item.set_image(image_path, rect.width(), rect.height())
+                # Update the images in the scene, each keeps its size
+                self.edit("Image File", lambda item: (item.image_path, self.image_size(item)),
+                          lambda item, path: item.set_image(path, *self.image_size(item)), image_path,
+                          restore=lambda item, image: item.set_image(image[0], *image[1]), geometry=True)
                 self.update_image_preview(image_path)
 
     def update_image_preview(self, image_path):
-        pixmap = QPixmap(image_path)
+        # Decoded on a worker, a newer preview request replaces an older pending one
+        if self.preview_request is not None:
+            self.preview_request.cancel()
+        preview = self.image_preview
+        self.preview_request = image_decoder().request(image_path, preview.width(), preview.height(),
+                                                       lambda pixmap: self.image_preview_decoded(preview, pixmap))
+
+    def linked_image_changed(self, path):
+        # Only the preview of the first selected image shows the file
+        if isinstance(self.item, Image) and self.item.image_path == path:
+            self.update_image_preview(path)
+
+    def image_preview_decoded(self, preview, pixmap):
+        # Requests are canceled when the selection changes, so this is the selected image
+        self.preview_request = None
         if not pixmap.isNull():
-            pixmap = pixmap.scaled(self.image_preview.width(), self.image_preview.height(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            self.image_preview.setPixmap(pixmap)
+            preview.setPixmap(pixmap)
         else:
-            self.image_preview.clear()
+            preview.clear()
 
     def rotate_image(self, angle):
-        # Get the center of the item's bounding rect in item coordinates
-        rect = self.item.boundingRect()
-        center = rect.center()
-        self.item.setTransformOriginPoint(center)
-        self.item.setRotation(angle)
\ No newline at end of file
+        self.settle_slider(self.image_rotation_slider)
+        self.edit("Rotation", lambda item: item.rotation(), self.rotate_about_center, angle, geometry=True)
@@ -0,0 +1,271 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import deque
+import codecs
+import json
+import queue
+import threading
+from GUI.GridScene import GridScene
+
+FRAME_BUDGET_MS = 12  # GUI thread time spent per frame on building or tearing down items
+PARSE_BATCH_SIZE = 500  # Records handed from the parser thread to the GUI thread at once
+READ_CHUNK_SIZE = 1 << 20
+QUEUE_BATCHES = 16  # Parsed batches buffered ahead of the GUI thread
+
+_DONE = object()
+
+def iter_json_array(path, batch_size=PARSE_BATCH_SIZE, chunk_size=READ_CHUNK_SIZE):
+    """
+    Parses a file holding one JSON array without reading it whole.
+    Yields (records, bytes_read) batches.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        buffer = ""
+        pos = 0
+        bytes_read = 0
+        eof = False
+        started = False
+        batch = []
+
+        def read_more():
+            nonlocal buffer, pos, bytes_read, eof
+            raw = f.read(chunk_size)
+            bytes_read += len(raw)
+            eof = not raw
+            buffer = buffer[pos:] + utf8.decode(raw, final=eof)
+            pos = 0
+
+        while True:
+            # Skip whitespace and separators between records
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError("Unexpected end of file, the diagram array is not closed")
+                read_more()
+                continue
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("A diagram file must hold a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            if end == len(buffer) and not eof:
+                # The record may continue in the next chunk
+                read_more()
+                continue
+            pos = end
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch, bytes_read
+                batch = []
+        if batch:
+            yield batch, bytes_read
+
+class RecordStreamer(QThread):
+    """
+    Runs a record source on a worker thread and hands its batches to the GUI
+    thread through a bounded queue, so parsing never runs far ahead of building.
+    """
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.batches = queue.Queue(maxsize=QUEUE_BATCHES)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            for batch in self.source():
+                if not self._put(batch):
+                    return
+            self._put(_DONE)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, entry):
+        while not self.stopped.is_set():
+            try:
+                self.batches.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def stop(self):
+        self.stopped.set()
+        self.wait()
+
+class ChunkedClear(QObject):
+    """
+    Removes every item from a scene in time-sliced chunks instead of one blocking clear().
+    """
+    finished = pyqtSignal()
+
+    def __init__(self, scene, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        if isinstance(scene, GridScene):
+            self.items = deque(scene.top_level_items())
+        else:
+            self.items = deque(item for item in scene.items() if item.parentItem() is None)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.step)
+
+    def start(self):
+        if isinstance(self.scene, GridScene):
+            self.scene.begin_bulk_update()
+        self.timer.start(0)
+
+    def step(self, budget_ms=FRAME_BUDGET_MS):
+        """
+        Removes items until the frame budget is spent. Returns True once the scene is empty.
+        """
+        clock = QElapsedTimer()
+        clock.start()
+        items = self.items
+        while items and clock.elapsed() < budget_ms:
+            for _ in range(min(100, len(items))):
+                self.scene.removeItem(items.popleft())
+        if items:
+            return False
+        if self.timer.isActive():
+            self.timer.stop()
+            if isinstance(self.scene, GridScene):
+                self.scene.end_bulk_update()
+            self.finished.emit()
+        return True
+
+class ProgressiveLoader(QObject):
+    """
+    Replaces a scene's items with the records of a source. The source is parsed on
+    a worker thread and the new items are built in time-sliced batches while the old
+    items stay in the scene. Only once the whole source is parsed are the old items
+    torn down and the new ones added, again in chunks, so a failed or canceled load
+    leaves the scene as it was. Shows a progress dialog that can cancel the load
+    until then. A total of 0 shows a busy indicator for sources of unknown size.
+    """
+    replacing = pyqtSignal()  # The old items are about to be removed
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+    canceled = pyqtSignal()
+
+    def __init__(self, scene, source, total, build_items, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        self.build_items = build_items
+        self.streamer = RecordStreamer(source, self)
+        self.clearer = None  # Set once the source is parsed and the old items go
+        self.records = deque()
+        self.staged = deque()  # Built items waiting for the old items to be removed
+        self.stepping = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.step)
+        self.progress = QProgressDialog("Loading diagram...", "Cancel", 0, max(0, total), parent)
+        self.progress.setWindowTitle("Open")
+        self.progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress.setMinimumDuration(500)
+        self.progress.canceled.connect(self.cancel)
+
+    def start(self):
+        self.streamer.start()
+        self.timer.start(0)
+
+    def step(self):
+        # A modal progress dialog processes events in setValue(), which must not re-enter the build
+        if self.stepping:
+            return
+        self.stepping = True
+        try:
+            self._step()
+        finally:
+            self.stepping = False
+
+    def _step(self):
+        clock = QElapsedTimer()
+        clock.start()
+        if self.clearer is not None:
+            self._replace(FRAME_BUDGET_MS)
+            return
+        while clock.elapsed() < FRAME_BUDGET_MS:
+            if not self.records:
+                try:
+                    entry = self.streamer.batches.get_nowait()
+                except queue.Empty:
+                    return
+                if entry is _DONE:
+                    self._begin_replace()
+                    return
+                if isinstance(entry, Exception):
+                    self.cancel()
+                    self.failed.emit(str(entry))
+                    return
+                batch, progress = entry
+                self.records.extend(batch)
+                if self.progress.maximum():
+                    self.progress.setValue(min(progress, self.progress.maximum() - 1))
+            records = [self.records.popleft() for _ in range(min(50, len(self.records)))]
+            try:
+                items = self.build_items(records)
+            except Exception as e:
+                self.cancel()
+                self.failed.emit(str(e))
+                return
+            self.staged.extend(items)
+
+    def _begin_replace(self):
+        # Past this point the load can no longer fail, so it is not offered to cancel either
+        self.progress.setLabelText("Replacing diagram...")
+        self.progress.setCancelButton(None)
+        self.replacing.emit()
+        if isinstance(self.scene, GridScene):
+            self.scene.begin_bulk_update()
+        self.clearer = ChunkedClear(self.scene, self)
+
+    def _replace(self, budget_ms):
+        """
+        Removes the old items, then adds the staged ones, until the budget is spent.
+        """
+        clock = QElapsedTimer()
+        clock.start()
+        if not self.clearer.step(budget_ms):
+            return
+        staged = self.staged
+        while staged and clock.elapsed() < budget_ms:
+            for _ in range(min(100, len(staged))):
+                self.scene.addItem(staged.popleft())
+        if staged:
+            return
+        self._finish()
+        self.finished.emit()
+
+    def cancel(self):
+        if not self.timer.isActive():
+            return
+        if self.clearer is not None:
+            # The old items are partly gone, so the new document is completed instead
+            self._replace(float("inf"))
+            return
+        # Nothing was added yet, dropping the staged items leaves the scene as it was
+        self._finish()
+        self.canceled.emit()
+
+    def _finish(self):
+        self.timer.stop()
+        self.streamer.stop()
+        self.records.clear()
+        self.staged.clear()
+        if self.clearer is not None and isinstance(self.scene, GridScene):
+            self.scene.end_bulk_update()
+        self.progress.reset()
@@ -0,0 +1,89 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import json
+import os
+import tempfile
+from GUI.BinaryFormat import is_binary_path, write_binary
+from GUI.Bundle import is_bundle_path, write_bundle
+from Shapes.Registry import records_from_snapshot
+
+def write_document(path, records, thumbnail=None):
+    """
+    Writes records to a temp file next to path and renames it over path, so a
+    failed or interrupted save never leaves a half-written document behind.
+    The thumbnail is only stored by bundles.
+    """
+    replace_document(write_temp_document(path, records, thumbnail), path)
+
+def write_temp_document(path, records, thumbnail=None):
+    """
+    Writes and syncs the temp file that write_document() renames over path, and
+    returns its path.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".saving-", suffix=os.path.splitext(path)[1], dir=folder)
+    try:
+        if is_binary_path(path):
+            os.close(fd)
+            write_binary(temp_path, records)
+        elif is_bundle_path(path):
+            os.close(fd)
+            write_bundle(temp_path, records, thumbnail)
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(records, f, indent=2)
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+    except BaseException:
+        discard_temp_document(temp_path)
+        raise
+    return temp_path
+
+def replace_document(temp_path, path):
+    try:
+        os.replace(temp_path, path)
+    except BaseException:
+        discard_temp_document(temp_path)
+        raise
+
+def discard_temp_document(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+class SaveSignals(QObject):
+    written = pyqtSignal(str)  # Temp file path, for tasks that leave renaming it to the GUI thread
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+class SaveTask(QRunnable):
+    """
+    Encodes and writes a snapshot taken on the GUI thread. Runs on a QThreadPool
+    worker and reports back through its signals, which are delivered on the GUI thread.
+    Without replace the task stops at the temp file and reports it as written, for
+    targets the GUI thread must release before they can be replaced.
+    """
+    def __init__(self, path, snapshot, thumbnail=None, replace=True):
+        super().__init__()
+        self.path = path
+        self.snapshot = snapshot
+        self.thumbnail = thumbnail
+        self.replace = replace
+        self.signals = SaveSignals()
+
+    def run(self):
+        try:
+            temp_path = write_temp_document(self.path, records_from_snapshot(self.snapshot), self.thumbnail)
+            if self.replace:
+                replace_document(temp_path, self.path)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            if self.replace:
+                self.signals.finished.emit(self.path)
+            else:
+                self.signals.written.emit(temp_path)
+        finally:
+            self.snapshot = None
@@ -0,0 +1,246 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from bisect import bisect_left
+import GUI.Grid
+from GUI.Damage import damage_tracker
+
+SNAP_DISTANCE = 8  # Object snapping engages within this many pixels
+GUIDE_COLOR = QColor("#ff40ff")
+BULK_UPDATE_THRESHOLD = 64  # Updating more items than this at once rebuilds the indices
+
+def snap_value(value):
+    """
+    Snaps a scalar to the grid level visible in the view.
+    """
+    if not GUI.Grid.IS_GRID_ENABLED:
+        return value
+    grid = GUI.Grid.SNAP_SIZE
+    return round(value / grid) * grid
+
+def snap_point(point):
+    """
+    Snaps a QPointF to the grid level visible in the view.
+    """
+    return QPointF(snap_value(point.x()), snap_value(point.y()))
+
+def snap_item_position(item, pos):
+    """
+    Snaps a proposed item position. Items dragged in a scene with a snap engine
+    also snap to the edges and centers of other shapes, everything else snaps to the grid.
+    """
+    scene = item.scene()
+    engine = getattr(scene, "snap_engine", None)
+    if engine is None or scene.mouseGrabberItem() is not item:
+        return snap_point(pos)
+    return engine.snap_position(item, pos)
+
+def item_snap_rect(item):
+    # Lines snap on their geometry, not on their selection handles
+    if isinstance(item, QGraphicsLineItem):
+        return item.mapRectToScene(QGraphicsLineItem.boundingRect(item))
+    return item.sceneBoundingRect()
+
+class AxisIndex:
+    """
+    Sorted coordinates along one axis, with the item each coordinate belongs to.
+    """
+    def __init__(self):
+        self.keys = []
+        self.owners = []
+
+    def insert(self, value, owner):
+        i = bisect_left(self.keys, value)
+        self.keys.insert(i, value)
+        self.owners.insert(i, owner)
+
+    def remove(self, value, owner):
+        i = bisect_left(self.keys, value)
+        while i < len(self.keys) and self.keys[i] == value:
+            if self.owners[i] is owner:
+                del self.keys[i]
+                del self.owners[i]
+                return
+            i += 1
+
+    def rebuild(self, pairs):
+        pairs.sort(key=lambda pair: pair[0])
+        self.keys = [value for value, _ in pairs]
+        self.owners = [owner for _, owner in pairs]
+
+    def nearest(self, value, tolerance, exclude):
+        """
+        Returns (key, owner) of the closest coordinate within tolerance that does
+        not belong to an excluded item, or None.
+        """
+        keys, owners = self.keys, self.owners
+        i = bisect_left(keys, value)
+        best = None
+        j = i
+        while j < len(keys) and keys[j] - value <= tolerance:
+            if owners[j] not in exclude:
+                best = j
+                break
+            j += 1
+        j = i - 1
+        while j >= 0 and value - keys[j] <= tolerance:
+            if owners[j] not in exclude:
+                if best is None or value - keys[j] < keys[best] - value:
+                    best = j
+                break
+            j -= 1
+        if best is None:
+            return None
+        return keys[best], owners[best]
+
+class SnapEngine:
+    """
+    Snaps positions to the grid and to the edges and centers of the other shapes in
+    a scene. Edges and centers are kept in sorted per-axis indices that are updated
+    incrementally, so a snap query is a bisect lookup regardless of the scene size.
+    Bulk updates only take the new rects, the indices are re-sorted once by the
+    next snap query.
+    """
+    def __init__(self, scene):
+        self.scene = scene
+        self.rects = {}
+        self.x_index = AxisIndex()
+        self.y_index = AxisIndex()
+        self.stale = False  # The indices lag behind rects until the next rebuild()
+        self.guides = []
+
+    @staticmethod
+    def _x_keys(rect):
+        return (rect.left(), rect.center().x(), rect.right())
+
+    @staticmethod
+    def _y_keys(rect):
+        return (rect.top(), rect.center().y(), rect.bottom())
+
+    def add_item(self, item):
+        if item in self.rects or item.parentItem() is not None:
+            return
+        rect = item_snap_rect(item)
+        self.rects[item] = rect
+        if self.stale:
+            return
+        for value in self._x_keys(rect):
+            self.x_index.insert(value, item)
+        for value in self._y_keys(rect):
+            self.y_index.insert(value, item)
+
+    def remove_item(self, item):
+        rect = self.rects.pop(item, None)
+        if rect is None or self.stale:
+            return
+        for value in self._x_keys(rect):
+            self.x_index.remove(value, item)
+        for value in self._y_keys(rect):
+            self.y_index.remove(value, item)
+
+    def update_item(self, item):
+        self.remove_item(item)
+        self.add_item(item)
+
+    def update_items(self, items):
+        # Adds the items that are not indexed yet and refreshes the others
+        if len(items) <= BULK_UPDATE_THRESHOLD:
+            for item in items:
+                self.update_item(item)
+            return
+        # Re-sorting once is cheaper than many single inserts into large indices
+        for item in items:
+            if item.parentItem() is None:
+                self.rects[item] = item_snap_rect(item)
+        self.stale = True
+
+    def reset(self, items):
+        # Re-index exactly the given items
+        self.rects = {item: item_snap_rect(item) for item in items if item.parentItem() is None}
+        self.stale = True
+
+    def rebuild(self):
+        self.stale = False
+        x_pairs, y_pairs = [], []
+        for item, rect in self.rects.items():
+            x_pairs.extend((value, item) for value in self._x_keys(rect))
+            y_pairs.extend((value, item) for value in self._y_keys(rect))
+        self.x_index.rebuild(x_pairs)
+        self.y_index.rebuild(y_pairs)
+
+    def clear(self):
+        self.rects.clear()
+        self.x_index = AxisIndex()
+        self.y_index = AxisIndex()
+        self.stale = False
+        self.set_guides([])
+
+    def snap_position(self, item, pos):
+        grid_pos = snap_point(pos)
+        rect = item_snap_rect(item).translated(pos - item.pos())
+        dx, dy = self.snap_rect(rect, {item})
+        return QPointF(
+            pos.x() + dx if dx is not None else grid_pos.x(),
+            pos.y() + dy if dy is not None else grid_pos.y()
+        )
+
+    def snap_rect(self, rect, exclude):
+        """
+        Returns the (dx, dy) that aligns rect with the closest edge or center of
+        another shape, with None for an axis that has nothing within reach.
+        Draws alignment guides for the matches.
+        """
+        if self.stale:
+            self.rebuild()
+        tolerance = SNAP_DISTANCE / GUI.Grid.VIEW_SCALE
+        x_match = self._best_match(self.x_index, self._x_keys(rect), tolerance, exclude)
+        y_match = self._best_match(self.y_index, self._y_keys(rect), tolerance, exclude)
+        guides = []
+        dx = dy = None
+        if x_match is not None:
+            dx, x, other = x_match
+            other_rect = self.rects[other]
+            top = min(rect.top(), other_rect.top())
+            bottom = max(rect.bottom(), other_rect.bottom())
+            guides.append(QLineF(x, top, x, bottom))
+        if y_match is not None:
+            dy, y, other = y_match
+            other_rect = self.rects[other]
+            left = min(rect.left(), other_rect.left())
+            right = max(rect.right(), other_rect.right())
+            guides.append(QLineF(left, y, right, y))
+        self.set_guides(guides)
+        return dx, dy
+
+    @staticmethod
+    def _best_match(index, probes, tolerance, exclude):
+        best = None
+        for probe in probes:
+            match = index.nearest(probe, tolerance, exclude)
+            if match is None:
+                continue
+            key, owner = match
+            if best is None or abs(key - probe) < abs(best[0]):
+                best = (key - probe, key, owner)
+        return best
+
+    def set_guides(self, guides):
+        if not guides and not self.guides:
+            return
+        margin = 2 / GUI.Grid.VIEW_SCALE
+        for guide in self.guides + guides:
+            damage_tracker(self.scene).add(QRectF(guide.p1(), guide.p2()).normalized().adjusted(-margin, -margin, margin, margin))
+        self.guides = guides
+
+    def clear_guides(self):
+        self.set_guides([])
+
+    def draw_guides(self, painter):
+        if not self.guides:
+            return
+        pen = QPen(GUIDE_COLOR, 1, Qt.PenStyle.DashLine)
+        pen.setCosmetic(True)
+        painter.save()
+        painter.setPen(pen)
+        painter.drawLines(self.guides)
+        painter.restore()
@@ -0,0 +1,92 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import math
+from GUI.Grid import GRID_SIZE
+
+INDEX_CELL_SIZE = GRID_SIZE * 16  # Index cells span 16 x 16 grid squares
+MAX_ITEM_CELLS = 256  # Items covering more cells than this are kept in a separate list
+
+class UniformGridIndex:
+    """
+    Buckets items by the index cells their scene bounding rect overlaps. Updates
+    touch only the cells of one item, and queries only the cells of the query rect.
+    """
+    def __init__(self, cell_size=INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+        self.item_cells = {}
+        self.large_items = set()
+
+    def __len__(self):
+        return len(self.rects)
+
+    def _cell_range(self, rect):
+        size = self.cell_size
+        return (math.floor(rect.left() / size), math.floor(rect.top() / size),
+                math.floor(rect.right() / size), math.floor(rect.bottom() / size))
+
+    def insert(self, item, rect):
+        if item in self.rects:
+            self.remove(item)
+        self.rects[item] = rect
+        left, top, right, bottom = self._cell_range(rect)
+        if (right - left + 1) * (bottom - top + 1) > MAX_ITEM_CELLS:
+            self.large_items.add(item)
+            return
+        keys = [(cx, cy) for cx in range(left, right + 1) for cy in range(top, bottom + 1)]
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = bucket = set()
+            bucket.add(item)
+        self.item_cells[item] = keys
+
+    def remove(self, item):
+        if self.rects.pop(item, None) is None:
+            return
+        self.large_items.discard(item)
+        for key in self.item_cells.pop(item, ()):
+            bucket = self.cells[key]
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[key]
+
+    def update(self, item, rect):
+        # Only rebucket when the item crossed into different cells
+        old_rect = self.rects.get(item)
+        if old_rect is not None and item not in self.large_items \
+                and self._cell_range(old_rect) == self._cell_range(rect):
+            self.rects[item] = rect
+            return
+        self.insert(item, rect)
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+        self.item_cells.clear()
+        self.large_items.clear()
+
+    def candidates(self, rect):
+        """
+        Returns the items whose bounding rect intersects rect.
+        """
+        left, top, right, bottom = self._cell_range(rect)
+        cell_count = (right - left + 1) * (bottom - top + 1)
+        if cell_count > len(self.cells):
+            # A query larger than the occupied area is cheaper as a straight scan
+            found = self.rects.keys()
+        else:
+            found = set(self.large_items)
+            cells = self.cells
+            for cx in range(left, right + 1):
+                for cy in range(top, bottom + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket:
+                        found.update(bucket)
+        rects = self.rects
+        return [item for item in found if rects[item].intersects(rect)]
+
+    def candidates_at(self, point):
+        return self.candidates(QRectF(point, QSizeF(0.001, 0.001)))
@@ -0,0 +1,521 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from array import array
+import os
+from GUI.BinaryFormat import BATCH_SIZE, BinaryDocument, RecordView
+from GUI.Damage import damage_tracker
+from GUI.SpatialIndex import UniformGridIndex
+from Shapes.Registry import (SHAPE_TYPES, VERSION_KEY, load_builtin_shapes, record_shape_type, records_from_snapshot,
+                             shape_type_for_item, snapshot_entry, snapshot_items)
+
+VIRTUALIZE_MIN_RECORDS = 20000  # Documents with at least this many shapes open virtualized
+VIRTUALIZE_MIN_BYTES = 5 << 20  # JSON files of this size hold roughly that many shapes
+MATERIALIZE_MARGIN = 0.5  # Viewport fraction materialized beyond each edge of the viewport
+MAX_MATERIALIZED = 5000  # Past this many shapes in reach, the shapes not yet built are drawn as proxies
+MAX_PROXY_RECTS = 20000  # Past this many proxies, occupied index cells are drawn instead
+POOL_SIZE = 256  # Recycled items kept per shape class
+PROXY_COLOR = QColor(128, 128, 128)
+SELECTED_PROXY_COLOR = QColor(0, 120, 215)
+MAPPED = object()  # Entry still only in the mapped binary file
+
+class VirtualDocument:
+    """
+    The shapes of a document as snapshot entries, the (shape type, values) pairs
+    that snapshot_items() produces, with their scene bounds in a uniform grid index.
+    Entry ids are positions in the document file and never change, removed shapes
+    leave None behind. A document opened from a binary file leaves its shapes in
+    the mapped file until they are materialized or edited. After the document was
+    saved over that file, which leaves out removed shapes, positions maps entry ids
+    to the positions of their records in the file.
+    """
+    def __init__(self):
+        load_builtin_shapes()
+        self.entries = []
+        self.index = UniformGridIndex()
+        self.bounds = QRectF()
+        self.source = None  # BinaryDocument holding the MAPPED entries
+        self.positions = None  # Entry id -> record position in source, None while they are equal
+
+    def __len__(self):
+        return len(self.entries)
+
+    def extend(self, records):
+        # Records of unknown shape types keep their position, so ids match the journal's
+        for data in records:
+            shape_type = record_shape_type(data)
+            if shape_type is None:
+                self.entries.append(None)
+                continue
+            data = shape_type.migrate(data)
+            self.append(snapshot_entry(shape_type, data), shape_type.cls.record_bounds(data))
+
+    def map_binary(self, source):
+        self.source = source
+
+    def maps(self, path):
+        return self.source is not None and os.path.normcase(os.path.abspath(path)) == \
+            os.path.normcase(os.path.abspath(self.source.path))
+
+    def replace_source(self, temp_path, saved_ids):
+        """
+        Renames a saved copy of this document over the mapped file and maps the copy.
+        The mapping is closed first, as a mapped file cannot be replaced on Windows.
+        saved_ids are the entry ids whose records the copy holds, in its order.
+        """
+        path = self.source.path
+        self.source.close()
+        try:
+            os.replace(temp_path, path)
+        finally:
+            # Mapped again whether or not the copy replaced it
+            self.source = BinaryDocument(path)
+        if not saved_ids or saved_ids[-1] == len(saved_ids) - 1:
+            # The copy left no entry out
+            self.positions = None
+        else:
+            self.positions = positions = array("q", bytes(8 * len(self.entries)))
+            for position, entry_id in enumerate(saved_ids):
+                positions[entry_id] = position
+
+    def source_index(self, entry_id):
+        # Position of a MAPPED entry's record in the mapped file
+        return entry_id if self.positions is None else self.positions[entry_id]
+
+    def mapped_batches(self, batch_size=BATCH_SIZE):
+        # Entry ids of the mapped file, in the (batch, progress) shape the scene loader expects
+        count = len(self.source)
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            yield range(start, stop), stop
+
+    def index_mapped(self, entry_ids):
+        """
+        Adds a run of consecutive shapes of the mapped file by their bounds. The
+        records are decoded column by column for record_bounds() and then dropped,
+        the entries stay in the file. Records of older shape versions are migrated
+        and kept like the records of other formats.
+        """
+        if not entry_ids:
+            return
+        for data in self.source.records(entry_ids[0], entry_ids[-1] + 1):
+            shape_type = record_shape_type(data)
+            if shape_type is None:
+                self.entries.append(None)
+            elif data.get(VERSION_KEY, 1) == shape_type.version:
+                self.append(MAPPED, shape_type.cls.record_bounds(data))
+            else:
+                data = shape_type.migrate(data)
+                self.append(snapshot_entry(shape_type, data), shape_type.cls.record_bounds(data))
+
+    def append(self, entry, bounds):
+        entry_id = len(self.entries)
+        self.entries.append(entry)
+        self.index.insert(entry_id, bounds)
+        self.bounds = self.bounds.united(bounds)
+        return entry_id
+
+    def update(self, entry_id, entry, bounds):
+        self.entries[entry_id] = entry
+        self.index.update(entry_id, bounds)
+        self.bounds = self.bounds.united(bounds)
+
+    def remove(self, entry_id):
+        self.entries[entry_id] = None
+        self.index.remove(entry_id)
+
+    def translate(self, entry_id, dx, dy):
+        # Every shape record keeps the item's position in pos_x and pos_y, its bounds move along
+        shape_type, values = self.entry(entry_id)
+        if shape_type is not None:
+            fields = shape_type.cls.SNAPSHOT_FIELDS
+            values = list(values)
+            values[fields.index("pos_x")] += dx
+            values[fields.index("pos_y")] += dy
+            entry = (shape_type, tuple(values))
+        else:
+            data = dict(values) if isinstance(values, dict) else values.record()
+            data["pos_x"] = data.get("pos_x", 0) + dx
+            data["pos_y"] = data.get("pos_y", 0) + dy
+            entry = snapshot_entry(SHAPE_TYPES[data["type"]], data)
+        self.update(entry_id, entry, self.index.rects[entry_id].translated(dx, dy))
+
+    def holes(self):
+        # Ids of removed shapes and of records of unknown types, which a saved file leaves out
+        return [entry_id for entry_id, entry in enumerate(self.entries) if entry is None]
+
+    def entry(self, entry_id):
+        entry = self.entries[entry_id]
+        if entry is MAPPED:
+            return (None, RecordView(self.source, self.source_index(entry_id)))
+        return entry
+
+    def snapshot(self):
+        # Mapped records are decoded by records_from_snapshot(), off the GUI thread when saving
+        return [self.entry(entry_id) if entry is MAPPED else entry for entry_id, entry in enumerate(self.entries)]
+
+    def record(self, entry_id):
+        return records_from_snapshot((self.entry(entry_id),))[0]
+
+    def shape_class(self, entry_id):
+        if self.entries[entry_id] is MAPPED:
+            return SHAPE_TYPES[self.source.value("type", self.source_index(entry_id))].cls
+        shape_type, values = self.entries[entry_id]
+        if shape_type is None:
+            shape_type = SHAPE_TYPES[values["type"]]
+        return shape_type.cls
+
+    def entries_in_rect(self, rect, mode=Qt.ItemSelectionMode.IntersectsItemBoundingRect):
+        # Shape modes are answered from the bounds, the records have no shapes
+        found = self.index.candidates(rect)
+        if mode in (Qt.ItemSelectionMode.ContainsItemBoundingRect, Qt.ItemSelectionMode.ContainsItemShape):
+            rects = self.index.rects
+            found = [entry_id for entry_id in found if rect.contains(rects[entry_id])]
+        return found
+
+    def fill_color(self, entry_id):
+        if self.entries[entry_id] is MAPPED:
+            values = RecordView(self.source, self.source_index(entry_id))
+            return values.get("fill_color") or values.get("border_color") or values.get("text_color")
+        shape_type, values = self.entries[entry_id]
+        if shape_type is not None:
+            values = dict(zip(shape_type.cls.SNAPSHOT_FIELDS, values))
+        return values.get("fill_color") or values.get("border_color") or values.get("text_color")
+
+class SceneVirtualizer(QObject):
+    """
+    Keeps real items only for the shapes of a VirtualDocument near a view's viewport.
+    Items that leave the materialized region are written back to the document and
+    recycled for shapes that enter it. Selected, grabbed and focused items stay
+    materialized, so selections and edits survive scrolling. Rubber band selections
+    are kept as entry ids instead, so a band over the whole document builds only
+    the selected shapes in the viewport.
+    """
+    def __init__(self, scene, view, document, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        self.view = view
+        self.document = document
+        self.items = {}  # Entry id -> materialized item
+        self.ids = {}  # Materialized item -> entry id
+        self.pool = {}  # Shape class -> recycled items
+        self.selected = set()  # Entry ids selected by the rubber band, materialized or not
+        self.band_base = set()  # Entry ids selected before the running band started
+        self.updating = False
+        self.selecting = False
+        self.overflow = False
+        self.refresh_pending = False
+        scene.virtualizer = self
+        self.grow_scene_rect()
+        view.viewport_changed.connect(self.schedule_refresh)
+        scene.selectionChanged.connect(self.selection_changed)
+        self.refresh()
+
+    def detach(self):
+        """
+        Leaves the materialized items in the scene as ordinary items.
+        """
+        self.view.viewport_changed.disconnect(self.schedule_refresh)
+        self.scene.selectionChanged.disconnect(self.selection_changed)
+        if self.scene.virtualizer is self:
+            self.scene.virtualizer = None
+        self.pool.clear()
+        if self.overflow:
+            self.scene.update()
+
+    def grow_scene_rect(self):
+        # Let the user scroll over the whole document, not only the materialized part
+        rect = self.scene.sceneRect()
+        if not rect.contains(self.document.bounds):
+            self.scene.setSceneRect(rect.united(self.document.bounds))
+
+    def schedule_refresh(self):
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            QTimer.singleShot(0, self.refresh)
+
+    def region(self):
+        rect = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        dx, dy = rect.width() * MATERIALIZE_MARGIN, rect.height() * MATERIALIZE_MARGIN
+        return rect.adjusted(-dx, -dy, dx, dy)
+
+    def pinned(self, item):
+        # Band selections survive recycling as entry ids
+        return ((item.isSelected() and self.ids.get(item) not in self.selected) or self.scene.mouseGrabberItem() is item
+                or self.scene.focusItem() is item or getattr(item, "editor", None) is not None)
+
+    def refresh(self):
+        self.refresh_pending = False
+        if self.scene.virtualizer is not self:
+            return
+        if self.scene.drag_transaction is not None:
+            # The dragged items must not be recycled, the drag refreshes when it ends
+            return
+        region = self.region()
+        wanted = self.document.index.candidates(region)
+        overflow = len(wanted) > MAX_MATERIALIZED
+        leaving = [item for item in self.ids
+                   if not self.pinned(item) and (overflow or not item.sceneBoundingRect().intersects(region))]
+        entering = [] if overflow else [entry_id for entry_id in wanted if entry_id not in self.items]
+        if overflow != self.overflow:
+            self.overflow = overflow
+            self.scene.update()
+        self.update_items(leaving, entering)
+
+    def materialize_rect(self, rect):
+        """
+        Materializes every shape that intersects rect, so item queries see the
+        whole document and not only the items near the viewport. Rects holding more
+        shapes than MAX_MATERIALIZED allows are left alone, queries over them see
+        the materialized items only and large regions are queried with
+        document.entries_in_rect() instead.
+        """
+        if self.scene.virtualizer is not self:
+            return
+        entering = [entry_id for entry_id in self.document.index.candidates(rect) if entry_id not in self.items]
+        if len(self.items) + len(entering) <= MAX_MATERIALIZED:
+            self.update_items((), entering)
+
+    def selected_ids(self):
+        # The whole selection as entry ids, band-selected shapes included whether materialized or not
+        ids = self.ids
+        return sorted(self.selected.union(ids[item] for item in self.scene.selectedItems() if item in ids))
+
+    def unmaterialized_selection(self):
+        return [entry_id for entry_id in self.selected if entry_id not in self.items]
+
+    def shape_item(self, entry_id):
+        """
+        The materialized item of a shape, or else an item built from its record
+        that is not added to the scene, e.g. to show the shape's properties.
+        """
+        item = self.items.get(entry_id)
+        if item is None:
+            item = self.document.shape_class(entry_id).from_dict(self.document.record(entry_id))
+        return item
+
+    def edit_records(self, entry_ids, write, values, read=None):
+        """
+        Edits shapes that are not materialized through their records. Each record
+        is loaded into a spare item of the pool, write(item, value) changes it and
+        the item is written back to the document. Returns read(item) of each shape
+        before its edit when read is given, which lets an undo restore the records.
+        """
+        document = self.document
+        rects = document.index.rects
+        spares = {}
+        old_values = []
+        damage = QRectF()
+        for entry_id, value in zip(entry_ids, values):
+            cls = document.shape_class(entry_id)
+            record = document.record(entry_id)
+            item = spares.get(cls)
+            if item is None:
+                pool = self.pool.get(cls)
+                item = spares[cls] = pool.pop() if pool else cls.from_dict(record)
+            item.apply_dict(record)
+            if read is not None:
+                old_values.append(read(item))
+            damage = damage.united(rects[entry_id])
+            write(item, value)
+            self.write_back(entry_id, item)
+            damage = damage.united(rects[entry_id])
+        for cls, item in spares.items():
+            pool = self.pool.setdefault(cls, [])
+            if len(pool) < POOL_SIZE:
+                pool.append(item)
+        self.records_changed(damage)
+        return old_values
+
+    def move_records(self, entry_ids, delta):
+        # A group drag moves the band-selected shapes that are not materialized by their records
+        document = self.document
+        dx, dy = delta.x(), delta.y()
+        damage = QRectF()
+        for entry_id in entry_ids:
+            damage = damage.united(document.index.rects[entry_id])
+            document.translate(entry_id, dx, dy)
+        self.records_changed(damage.united(damage.translated(dx, dy)))
+
+    def records_changed(self, damage):
+        # The shapes appear once they are materialized, only their proxies are drawn meanwhile
+        self.grow_scene_rect()
+        if self.overflow:
+            damage_tracker(self.scene).add(damage)
+        self.schedule_refresh()
+
+    def begin_band(self, extend):
+        # The band replaces the selection, or adds to it with Ctrl held
+        if extend:
+            self.band_base = self.selected | {self.ids[item] for item in self.scene.selectedItems() if item in self.ids}
+        else:
+            self.band_base = set()
+        self.selected = set(self.band_base)
+
+    def select_rect(self, rect, mode=Qt.ItemSelectionMode.IntersectsItemBoundingRect):
+        """
+        Selects the shapes of the document under the running rubber band. Only the
+        selected shapes in the viewport are materialized, the others are drawn as
+        selected proxies while the viewport holds too many shapes.
+        """
+        if self.scene.virtualizer is not self:
+            return
+        self.selected = selected = self.band_base.union(self.document.entries_in_rect(rect, mode))
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        entering = []
+        if not self.overflow:
+            # The viewport holds few shapes, so the selected ones in it are built
+            entering = [entry_id for entry_id in self.document.index.candidates(rect.intersected(visible))
+                        if entry_id in selected and entry_id not in self.items]
+        self.selecting = True
+        try:
+            if len(self.items) + len(entering) <= MAX_MATERIALIZED:
+                self.update_items((), entering)
+            self.scene.select_items([item for item, entry_id in self.ids.items() if entry_id in selected])
+        finally:
+            self.selecting = False
+        if self.overflow:
+            self.scene.update(visible)
+
+    def selection_changed(self):
+        if self.selected and not self.updating and not self.selecting:
+            # Band-selected shapes the user deselected leave the band selection. When none
+            # of them stays selected, e.g. after a click on another shape, it is dropped.
+            deselected = [entry_id for item, entry_id in self.ids.items()
+                          if entry_id in self.selected and not item.isSelected()]
+            if deselected:
+                self.selected.difference_update(deselected)
+                if not any(item.isSelected() for item, entry_id in self.ids.items() if entry_id in self.selected):
+                    self.selected.clear()
+                    if self.overflow:
+                        self.scene.update()
+        self.schedule_refresh()
+
+    def update_items(self, leaving, entering):
+        if not leaving and not entering:
+            return
+        # Materializing is not an edit, so it stays out of the journal
+        journal = self.scene.journal
+        self.scene.journal = None
+        self.updating = True
+        # Recycled and rebuilt band-selected shapes change the selection once, not per item
+        selection_changed = any(item.isSelected() for item in leaving) or not self.selected.isdisjoint(entering)
+        blocked = self.scene.blockSignals(True)
+        self.scene.begin_bulk_update()
+        try:
+            for item in leaving:
+                self.recycle(item, journal)
+            for entry_id in entering:
+                self.materialize(entry_id, journal)
+        finally:
+            self.scene.end_bulk_update()
+            self.scene.blockSignals(blocked)
+            self.updating = False
+            self.scene.journal = journal
+        if selection_changed:
+            self.scene.selectionChanged.emit()
+
+    def materialize(self, entry_id, journal=None):
+        record = self.document.record(entry_id)
+        cls = self.document.shape_class(entry_id)
+        pool = self.pool.get(cls)
+        if pool:
+            item = pool.pop()
+            item.apply_dict(record)
+        else:
+            item = cls.from_dict(record)
+        self.items[entry_id] = item
+        self.ids[item] = entry_id
+        self.scene.addItem(item)
+        if entry_id in self.selected:
+            item.setSelected(True)
+        if journal is not None:
+            journal.bind(item, entry_id)
+        return item
+
+    def recycle(self, item, journal=None):
+        entry_id = self.ids.pop(item)
+        del self.items[entry_id]
+        self.write_back(entry_id, item)
+        if journal is not None:
+            journal.unbind(item)
+        self.scene.removeItem(item)
+        # Removing keeps the selected flag, which the next shape must not inherit
+        item.setSelected(False)
+        pool = self.pool.setdefault(type(item), [])
+        if len(pool) < POOL_SIZE:
+            pool.append(item)
+
+    def write_back(self, entry_id, item):
+        self.document.update(entry_id, snapshot_items((item,))[0], item.sceneBoundingRect())
+
+    def item_added(self, item):
+        # Items the user adds become new shapes of the document
+        if self.updating or item in self.ids or item.parentItem() is not None:
+            return
+        if shape_type_for_item(item) is None:
+            return
+        entry_id = self.document.append(snapshot_items((item,))[0], item.sceneBoundingRect())
+        self.items[entry_id] = item
+        self.ids[item] = entry_id
+        self.grow_scene_rect()
+
+    def item_removed(self, item):
+        if self.updating:
+            return
+        entry_id = self.ids.pop(item, None)
+        if entry_id is not None:
+            del self.items[entry_id]
+            self.selected.discard(entry_id)
+            self.document.remove(entry_id)
+
+    def item_ids(self):
+        return dict(self.ids)
+
+    def snapshot_with_ids(self):
+        """
+        Entry ids and snapshot entries of the whole document in document order,
+        with the current state of the materialized items.
+        """
+        entries = self.document.snapshot()
+        for item, entry_id in self.ids.items():
+            entries[entry_id] = snapshot_items((item,))[0]
+        ids = [entry_id for entry_id, entry in enumerate(entries) if entry is not None]
+        return ids, [entries[entry_id] for entry_id in ids]
+
+    def snapshot(self):
+        return self.snapshot_with_ids()[1]
+
+    def draw_proxies(self, painter, rect):
+        # Shapes in reach that were not materialized are drawn as plain rects
+        if not self.overflow:
+            return
+        document = self.document
+        found = [entry_id for entry_id in document.index.candidates(rect) if entry_id not in self.items]
+        painter.save()
+        painter.setPen(Qt.PenStyle.NoPen)
+        if len(found) > MAX_PROXY_RECTS:
+            # Too many to draw one by one, show which index cells hold shapes
+            size = document.index.cell_size
+            cells = [QRectF(cx * size, cy * size, size, size) for cx, cy in document.index.cells]
+            painter.setBrush(QColor(PROXY_COLOR.red(), PROXY_COLOR.green(), PROXY_COLOR.blue(), 96))
+            painter.drawRects([cell for cell in cells if cell.intersects(rect)])
+        else:
+            by_color = {}
+            rects = document.index.rects
+            for entry_id in found:
+                by_color.setdefault(document.fill_color(entry_id) or PROXY_COLOR.name(), []).append(rects[entry_id])
+            for color, color_rects in by_color.items():
+                painter.setBrush(QColor(color))
+                painter.drawRects(color_rects)
+            selected = [rects[entry_id] for entry_id in found if entry_id in self.selected]
+            if selected:
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.setPen(QPen(SELECTED_PROXY_COLOR, 0))
+                painter.drawRects(selected)
+        painter.restore()
+
+def should_virtualize(record_count=None, byte_size=None):
+    if record_count is not None:
+        return record_count >= VIRTUALIZE_MIN_RECORDS
+    return byte_size is not None and byte_size >= VIRTUALIZE_MIN_BYTES
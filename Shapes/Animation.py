@@ -0,0 +1,168 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import OrderedDict
+import bisect
+import os
+
+FRAME_CACHE_BYTES = 64 << 20  # Decoded animation frames kept across all files
+MAX_SEQUENCE_SHARE = 4  # Animations larger than budget / this are shown as a still image
+DEFAULT_FRAME_DELAY_MS = 100  # Used for frames asking for 10 ms or less, like browsers do
+IDLE_POLL_MS = 500  # Check interval while no animated item is visible
+
+_animated = {}  # (path, mtime, size) -> whether the file holds more than one frame
+
+def is_animated(path):
+    """
+    Whether the file at path is an animation. Reads the image header once per file version.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return False
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    animated = _animated.get(key)
+    if animated is None:
+        reader = QImageReader(path)
+        animated = _animated[key] = reader.supportsAnimation() and reader.imageCount() != 1
+    return animated
+
+def frame_delay(delay):
+    return delay if delay > 10 else DEFAULT_FRAME_DELAY_MS
+
+class FrameSequence:
+    """
+    The decoded frames of one animation at one size, shared by every item showing it.
+    """
+    def __init__(self, frames, delays):
+        self.frames = frames
+        self.ends = []  # End time of each frame within one loop
+        elapsed = 0
+        for delay in delays:
+            elapsed += frame_delay(delay)
+            self.ends.append(elapsed)
+        self.duration = elapsed
+        self.cost = sum(frame.width() * frame.height() * max(1, frame.depth()) // 8 for frame in frames)
+
+    def frame_at(self, msecs):
+        """
+        Returns (frame index, msecs until the next frame) at a point of the shared timeline.
+        """
+        position = msecs % self.duration if self.duration else 0
+        index = min(bisect.bisect_right(self.ends, position), len(self.frames) - 1)
+        return index, max(1, self.ends[index] - position)
+
+class FrameCache:
+    """
+    LRU cache of frame sequences keyed like PIXMAP_CACHE, with a byte budget.
+    """
+    def __init__(self, budget=FRAME_CACHE_BYTES):
+        self.budget = budget
+        self.used = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        sequence = self.entries.get(key)
+        if sequence is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return sequence
+
+    def insert(self, key, sequence):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used -= old.cost
+        self.entries[key] = sequence
+        self.used += sequence.cost
+        # Items keep playing the sequences they hold, eviction only stops new items sharing them
+        while self.used > self.budget and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.used -= evicted.cost
+
+    def invalidate(self, path):
+        # Drop every size of one file, e.g. after it changed on disk
+        for key in [key for key in self.entries if key[0] == path]:
+            self.used -= self.entries.pop(key).cost
+
+    def max_sequence_bytes(self):
+        return self.budget // MAX_SEQUENCE_SHARE
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "used": self.used, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses}
+
+FRAME_CACHE = FrameCache()
+
+class AnimationClock(QObject):
+    """
+    Advances the animated items of one scene from a single timer. Items on the same
+    timeline show the same frame, and only items inside a view's visible rect are
+    advanced, so offscreen animations cost nothing but an occasional check.
+    """
+    def __init__(self, scene):
+        super().__init__(scene)
+        self.scene = scene
+        self.items = set()
+        self.views = set()
+        self.elapsed = QElapsedTimer()
+        self.elapsed.start()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+
+    def add(self, item):
+        self.items.add(item)
+        self.wake()
+
+    def remove(self, item):
+        self.items.discard(item)
+
+    def wake(self):
+        # Run a tick soon, e.g. after the view scrolled animated items into sight
+        if self.items:
+            self.timer.start(0)
+
+    def visible_rects(self):
+        rects = []
+        for view in self.scene.views():
+            if view not in self.views and hasattr(view, "viewport_changed"):
+                self.views.add(view)
+                view.viewport_changed.connect(self.wake)
+            if view.isVisible() and not view.window().isMinimized():
+                rects.append(view.mapToScene(view.viewport().rect()).boundingRect())
+        return rects
+
+    def tick(self):
+        if not self.items:
+            return
+        now = self.elapsed.elapsed()
+        rects = self.visible_rects()
+        next_frame = None
+        for item in self.items:
+            if not item.isVisible():
+                continue
+            bounds = item.sceneBoundingRect()
+            if not any(bounds.intersects(rect) for rect in rects):
+                continue
+            index, remaining = item.animation.frame_at(now)
+            item.show_frame(index)
+            next_frame = remaining if next_frame is None else min(next_frame, remaining)
+        self.timer.start(next_frame if next_frame is not None else IDLE_POLL_MS)
+
+def animation_clock(scene):
+    """
+    The AnimationClock of a scene, created on first use.
+    """
+    clock = getattr(scene, "animation_clock", None)
+    if clock is None:
+        clock = AnimationClock(scene)
+        scene.animation_clock = clock
+    return clock
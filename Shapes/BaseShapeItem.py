@@ -2,6 +2,17 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from GUI.GridScene import *
+from GUI.Damage import damage_tracker
+from GUI.Snapping import snap_value
+
+def rotated_bounds(rect, rotation):
+    """
+    Bounds of an item rect rotated about the item origin, which is where from_dict()
+    leaves the transform origin.
+    """
+    if not rotation % 360:
+        return rect
+    return QTransform().rotate(rotation).mapRect(rect)
 
 class BaseShapeItem:
     def __init__(self):
@@ -12,7 +23,7 @@ class BaseShapeItem:
         )
             
     def setWidth(self, width):
-        width = GridScene.snap_to_grid(width, 0)[0]  # Use only the snapped x value
+        width = snap_value(width) or width
         rect = self.rect()
         rect.setWidth(width)
         self.setRect(rect)
@@ -20,7 +31,7 @@ class BaseShapeItem:
             self.setTransformOriginPoint(rect.center())
 
     def setHeight(self, height):
-        height = GridScene.snap_to_grid(0, height)[1]  # Use only the snapped y value
+        height = snap_value(height) or height
         rect = self.rect()
         rect.setHeight(height)
         self.setRect(rect)
@@ -29,4 +40,33 @@ class BaseShapeItem:
 
     def setRotationAngle(self, angle):
         self.setRotation(angle)
-        self.rotation_angle = angle
\ No newline at end of file
+        self.rotation_angle = angle
+
+    def invalidate_move(self, new_pos):
+        # Repaint only the area the shape leaves and the area it enters
+        scene = self.scene()
+        if scene is not None:
+            old_rect = self.sceneBoundingRect()
+            new_rect = old_rect.translated(new_pos - self.pos())
+            damage_tracker(scene).add(old_rect.united(new_rect))
+
+    def apply_dict(self, data):
+        self.setRect(QRectF(data.get("x", 0), data.get("y", 0), data.get("width", 100), data.get("height", 100)))
+        self.setRotation(data.get("rotation", 0))
+        self.setBrush(QBrush(QColor(data.get("fill_color", "#0000ff"))))
+        self.setPen(QPen(
+            QColor(data.get("border_color", "#000000")),
+            data.get("border_width", 3)
+        ))
+        # Set the scene position after the geometry
+        self.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+
+    @classmethod
+    def record_bounds(cls, data):
+        """
+        Scene bounds of the item a record describes, without building the item.
+        """
+        half_pen = data.get("border_width", 3) / 2
+        rect = QRectF(data.get("x", 0), data.get("y", 0), data.get("width", 100), data.get("height", 100))
+        rect = rotated_bounds(rect.adjusted(-half_pen, -half_pen, half_pen, half_pen), data.get("rotation", 0))
+        return rect.translated(data.get("pos_x", 0), data.get("pos_y", 0))
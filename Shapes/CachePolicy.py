@@ -0,0 +1,232 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import deque
+import math
+import time
+
+CACHE_BUDGET_BYTES = 64 << 20  # Item cache pixmaps of all items of a scene together
+MIN_CACHED_PAINT_MS = 0.3  # Items that paint faster than this are repainted from scratch
+PAINT_SAMPLES = 3  # Paints measured before an item's cache mode is decided
+EVALUATE_MS = 500  # Cache modes are revised this often, never from within paint()
+CHURN_WINDOW_MS = 2000  # Rebuilds and transform changes older than this are forgotten
+MAX_DEVICE_REBUILDS = 4  # Device cache rebuilds in the window that switch to the item cache
+MAX_ITEM_REBUILDS = 4  # Item cache rebuilds in the window that mark an item as volatile
+VOLATILE_COOLDOWN_MS = 10000  # Volatile items stay uncached this long
+MAX_CACHE_PIXELS = 2048 * 2048  # Items larger than this on screen are never cached
+COST_SMOOTHING = 0.3  # Weight of the newest paint in the paint cost average
+
+NO_CACHE = QGraphicsItem.CacheMode.NoCache
+ITEM_CACHE = QGraphicsItem.CacheMode.ItemCoordinateCache
+DEVICE_CACHE = QGraphicsItem.CacheMode.DeviceCoordinateCache
+CACHE_MODE_NAMES = {NO_CACHE: "None", ITEM_CACHE: "Item", DEVICE_CACHE: "Device"}
+
+def now_ms():
+    return time.monotonic() * 1000
+
+def rotation_scale(transform):
+    # The part of a transform that invalidates a device cache, translation left out
+    return (round(transform.m11(), 6), round(transform.m12(), 6), round(transform.m21(), 6), round(transform.m22(), 6))
+
+class PaintStats:
+    """
+    What the policy knows about one item: its smoothed paint cost, recent cache
+    rebuilds and transform changes, and the cache it was given.
+    """
+    def __init__(self):
+        self.paints = 0
+        self.cost_ms = 0.0
+        self.rebuilds = deque()  # Times of paints while the item was cached
+        self.transform_changes = deque()
+        self.transform = None
+        self.mode = NO_CACHE
+        self.bytes = 0
+        self.volatile_until = 0
+
+    def record(self, msecs, cached, at):
+        self.cost_ms = msecs if not self.paints else self.cost_ms + COST_SMOOTHING * (msecs - self.cost_ms)
+        self.paints += 1
+        if cached:
+            self.rebuilds.append(at)
+
+    def forget_before(self, at):
+        for times in (self.rebuilds, self.transform_changes):
+            while times and times[0] < at:
+                times.popleft()
+
+class RenderCachePolicy(QObject):
+    """
+    Picks the QGraphicsItem cache mode of every painted shape of a scene. Cheap
+    items repaint from scratch. Expensive items get a device cache, or an item cache
+    while they or the views keep changing scale or rotation. Items whose content
+    keeps changing get no cache. The cached items share one memory budget, and the
+    items that save the most paint time per byte win it.
+    """
+    def __init__(self, scene, budget=CACHE_BUDGET_BYTES):
+        super().__init__(scene)
+        self.scene = scene
+        self.budget = budget
+        self.enabled = True
+        self.stats = {}  # Item -> PaintStats
+        self.painted = set()  # Items painted since the last evaluation
+        self.view_transforms = {}
+        self.view_changed_at = -CHURN_WINDOW_MS
+        self.used = 0
+        # Item caches live in QPixmapCache, which must be able to hold the whole budget
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), budget // 1024 + 10240))
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.evaluate)
+
+    def record_paint(self, item, msecs):
+        stats = self.stats.get(item)
+        if stats is None:
+            stats = self.stats[item] = PaintStats()
+        stats.record(msecs, item.cacheMode() != NO_CACHE, now_ms())
+        self.painted.add(item)
+        if not self.timer.isActive():
+            self.timer.start(EVALUATE_MS)
+
+    def untrack(self, item):
+        stats = self.stats.pop(item, None)
+        self.painted.discard(item)
+        if stats is not None:
+            self.used -= stats.bytes
+
+    def clear(self):
+        # The scene deleted its items
+        self.stats.clear()
+        self.painted.clear()
+        self.used = 0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.evaluate()
+
+    def device_scale(self):
+        # Largest scale any view shows the scene at, in device pixels per scene unit
+        scale = 0
+        for view in self.scene.views():
+            transform = view.transform()
+            scale = max(scale, math.hypot(transform.m11(), transform.m12()) * view.devicePixelRatioF())
+            key = rotation_scale(transform)
+            previous = self.view_transforms.get(view)
+            if previous != key:
+                self.view_transforms[view] = key
+                if previous is not None:
+                    self.view_changed_at = now_ms()
+        return scale or 1
+
+    def estimated_bytes(self, item, mode):
+        rect = item.boundingRect()
+        if mode == DEVICE_CACHE:
+            scale = self.device_scale() * math.hypot(item.sceneTransform().m11(), item.sceneTransform().m12())
+            return math.ceil(rect.width() * scale) * math.ceil(rect.height() * scale) * 4
+        return math.ceil(rect.width()) * math.ceil(rect.height()) * 4
+
+    def preferred_mode(self, item, stats, at):
+        if not self.enabled or stats.paints < PAINT_SAMPLES or stats.cost_ms < MIN_CACHED_PAINT_MS:
+            return NO_CACHE
+        if at < stats.volatile_until:
+            return NO_CACHE
+        transform = rotation_scale(item.sceneTransform())
+        if stats.transform is not None and transform != stats.transform:
+            stats.transform_changes.append(at)
+        stats.transform = transform
+        transforming = stats.transform_changes or at - self.view_changed_at < CHURN_WINDOW_MS
+        if stats.mode == DEVICE_CACHE and len(stats.rebuilds) > MAX_DEVICE_REBUILDS and not transforming:
+            # Rebuilt without any transform change, so the content itself keeps changing
+            stats.volatile_until = at + VOLATILE_COOLDOWN_MS
+            return NO_CACHE
+        if stats.mode == ITEM_CACHE and len(stats.rebuilds) > MAX_ITEM_REBUILDS:
+            stats.volatile_until = at + VOLATILE_COOLDOWN_MS
+            return NO_CACHE
+        if transforming:
+            # An item cache survives rotating and scaling, it is only resampled. Items that
+            # pick their detail by the view scale, like tiled images, would keep the wrong one.
+            if item.flags() & QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption:
+                return NO_CACHE
+            return ITEM_CACHE
+        return DEVICE_CACHE
+
+    def evaluate(self):
+        """
+        Revises the modes of the items painted since the last run, then fits the
+        cached items into the budget.
+        """
+        at = now_ms()
+        self.device_scale()
+        painted, self.painted = self.painted, set()
+        if not self.enabled:
+            painted = set(self.stats)
+        wanted = {}
+        for item in painted:
+            stats = self.stats.get(item)
+            if stats is None or item.scene() is not self.scene:
+                continue
+            stats.forget_before(at - CHURN_WINDOW_MS)
+            mode = self.preferred_mode(item, stats, at)
+            size = self.estimated_bytes(item, mode) if mode != NO_CACHE else 0
+            if size > MAX_CACHE_PIXELS * 4:
+                mode, size = NO_CACHE, 0
+            wanted[item] = (mode, size)
+        # Items cached before compete for the budget with the newly measured ones
+        for item, stats in self.stats.items():
+            if item not in wanted and stats.mode != NO_CACHE:
+                wanted[item] = (stats.mode, stats.bytes)
+        candidates = sorted((item for item, (mode, _) in wanted.items() if mode != NO_CACHE),
+                            key=lambda item: self.stats[item].cost_ms / max(1, wanted[item][1]), reverse=True)
+        used = 0
+        for item in candidates:
+            mode, size = wanted[item]
+            if used + size > self.budget:
+                wanted[item] = (NO_CACHE, 0)
+            else:
+                used += size
+        for item, (mode, size) in wanted.items():
+            self.apply(item, mode, size)
+        self.used = used
+
+    def apply(self, item, mode, size):
+        stats = self.stats[item]
+        stats.bytes = size
+        if stats.mode == mode:
+            return
+        stats.mode = mode
+        # The paint that fills the new cache is not a rebuild of it
+        stats.rebuilds.clear()
+        item.setCacheMode(mode)
+
+    def cached_items(self):
+        return [(item, stats) for item, stats in self.stats.items() if stats.mode != NO_CACHE]
+
+    def summary(self):
+        return {"measured": len(self.stats), "cached": sum(1 for stats in self.stats.values() if stats.mode != NO_CACHE),
+                "used": self.used, "budget": self.budget, "enabled": self.enabled}
+
+def render_cache_policy(scene):
+    """
+    The RenderCachePolicy of a scene, created on first use.
+    """
+    policy = getattr(scene, "cache_policy", None)
+    if policy is None:
+        policy = RenderCachePolicy(scene)
+        scene.cache_policy = policy
+    return policy
+
+def adaptive_cache(cls):
+    """
+    Class decorator for shapes: times every paint() of the class and reports it
+    to the RenderCachePolicy of the item's scene.
+    """
+    paint = cls.paint
+
+    def measured_paint(self, painter, option, widget=None):
+        started = time.perf_counter()
+        paint(self, painter, option, widget)
+        scene = self.scene()
+        if scene is not None:
+            render_cache_policy(scene).record_paint(self, (time.perf_counter() - started) * 1000)
+
+    cls.paint = measured_paint
+    return cls
@@ -2,14 +2,38 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from GUI.GridScene import *
+from GUI.Snapping import snap_item_position
+from Shapes.Registry import register_shape
+from Shapes.CachePolicy import adaptive_cache
+from Shapes.BaseShapeItem import rotated_bounds
+from GUI.Bundle import rendition_for
+from Shapes.ImageCache import PIXMAP_CACHE
+from Shapes.ImageDecoder import image_decoder
+from Shapes.TilePyramid import tile_loader, tile_pyramid
+from Shapes.Animation import animation_clock, is_animated
+from Shapes.ImageWatcher import image_watcher
 
+PLACEHOLDER_COLOR = QColor(128, 128, 128, 96)  # Fill of images whose pixels are still being decoded
+SCALE_IDLE_MS = 150  # Rest time of a scale slider after which the image is resampled in high quality
+
+@register_shape("image")
+@adaptive_cache
 class Image(QGraphicsPixmapItem):
+    SNAPSHOT_FIELDS = ("x", "y", "width", "height", "rotation", "image_path", "pos_x", "pos_y")
+
     def __init__(self, x, y, w, h, image_path=None):
         super().__init__()
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
         self.setPos(x, y)
+        self.decode_request = None
+        self.pending_size = None  # Size shown while a decode is pending
+        self.target_size = None
+        self.pyramid = None  # Tile pyramid of an image too large to decode whole
+        self.deep_size = None
+        self.animation = None  # Shared FrameSequence of an animated image
+        self.frame_index = 0
         default_path = "C:\\python_projects\\images\\earth.jpg"
         if image_path:
             self.image_path = image_path
@@ -19,13 +43,185 @@ class Image(QGraphicsPixmapItem):
             self.set_image(default_path, w, h)
 
     def set_image(self, image_path, w, h):
-        pixmap = QPixmap(image_path)
-        if not pixmap.isNull():
-            pixmap = pixmap.scaled(int(w), int(h), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        """
+        Shows the image at image_path fitted into w x h. Cached pixmaps show at once,
+        others are decoded on a worker while the item paints a placeholder.
+        Animations decode all their frames and are advanced by the scene's clock.
+        """
+        self.cancel_decode()
+        self.set_animation(None)
+        pyramid = tile_pyramid(image_path)
+        if pyramid is not None:
+            self.show_pyramid(pyramid, image_path, w, h)
+            return
+        if self.pyramid is not None:
+            self.leave_pyramid()
+        previous_path = self.image_path
+        self.image_path = image_path
+        self.target_size = (w, h)
+        if self.scene() is not None:
+            image_watcher().watch(self)
+        # Keep the current aspect ratio for the placeholder, the new pixels usually share it
+        size = QSizeF(self.pixmap().size()) if not self.pixmap().isNull() else QSizeF(w, h)
+        self.prepareGeometryChange()
+        self.pending_size = size.scaled(QSizeF(w, h), Qt.AspectRatioMode.KeepAspectRatio)
+        # A bundle's pre-scaled rendition spares decoding and scaling the original
+        rendition = rendition_for(image_path, w, h)
+        if is_animated(image_path):
+            request = image_decoder().request_frames(image_path, w, h, lambda sequence: self.frames_decoded(sequence, previous_path))
+        elif rendition is not None:
+            request = image_decoder().request(rendition, None, None, lambda pixmap: self.image_decoded(pixmap, previous_path))
+        else:
+            request = image_decoder().request(image_path, w, h, lambda pixmap: self.image_decoded(pixmap, previous_path))
+        if self.pending_size is not None:
+            self.decode_request = request
+
+    def preview_scale(self, w, h):
+        """
+        Fast phase of an interactive rescale: stretches the current pixels to fit
+        w x h without resampling, unless that size is cached already. Finish the
+        interaction with set_image() for the high quality result.
+        """
+        if self.pyramid is not None:
+            # Tiles are fetched per view scale anyway, so a pyramid rescales at once
+            self.show_pyramid(self.pyramid, self.image_path, w, h)
+            return
+        self.cancel_decode()
+        # An animation holds on its current frame until the final size is decoded
+        self.set_animation(None)
+        self.target_size = (w, h)
+        key = PIXMAP_CACHE.key(self.image_path, w, h)
+        pixmap = PIXMAP_CACHE.peek(key) if key is not None else None
+        if pixmap is not None:
+            # Sizes visited before cost nothing
+            self.image_decoded(pixmap, self.image_path)
+            return
+        size = QSizeF(self.pixmap().size()) if not self.pixmap().isNull() else QSizeF(w, h)
+        self.prepareGeometryChange()
+        self.pending_size = size.scaled(QSizeF(w, h), Qt.AspectRatioMode.KeepAspectRatio)
+        notify_geometry_changed(self)
+
+    def show_pyramid(self, pyramid, image_path, w, h):
+        # Deep zoom: no pixmap at all, paint() draws the tiles the view needs
+        if self.pyramid is not None:
+            tile_loader().cancel_owner(self)
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.image_path = image_path
+        self.target_size = (w, h)
+        if self.scene() is not None:
+            image_watcher().watch(self)
+        self.pending_size = None
+        self.deep_size = QSizeF(pyramid.size).scaled(QSizeF(w, h), Qt.AspectRatioMode.KeepAspectRatio)
+        self.setPixmap(QPixmap())
+        # Paint is handed the exposed rect instead of the whole bounding rect
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+        self.update()
+        notify_geometry_changed(self)
+
+    def leave_pyramid(self):
+        tile_loader().cancel_owner(self)
+        self.prepareGeometryChange()
+        self.pyramid = None
+        self.deep_size = None
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, False)
+
+    def tile_loaded(self, key):
+        if self.pyramid is not None and key[0] == self.pyramid.id:
+            self.update(self.pyramid.tile_rect(key, self.boundingRect()))
+
+    def image_decoded(self, pixmap, previous_path):
+        self.decode_request = None
+        self.prepareGeometryChange()
+        self.pending_size = None
+        if pixmap.isNull():
+            # Keep showing the previous image, as a failed load always did
+            if not self.pixmap().isNull():
+                self.image_path = previous_path
+                if self.scene() is not None:
+                    image_watcher().watch(self)
+            self.update()
+        else:
             self.setPixmap(pixmap)
-            self.image_path = image_path
+        notify_geometry_changed(self)
+
+    def frames_decoded(self, sequence, previous_path):
+        if sequence is not None and len(sequence.frames) > 1:
+            self.set_animation(sequence)
+        self.image_decoded(sequence.frames[0] if sequence is not None else QPixmap(), previous_path)
+
+    def set_animation(self, sequence):
+        if sequence is self.animation:
+            return
+        scene = self.scene()
+        if self.animation is not None and getattr(scene, "animation_clock", None) is not None:
+            scene.animation_clock.remove(self)
+        self.animation = sequence
+        self.frame_index = 0
+        if sequence is not None and scene is not None:
+            animation_clock(scene).add(self)
+
+    def show_frame(self, index):
+        # Called by the clock for items inside a view, the frames already are pixmaps
+        if index == self.frame_index or self.pending_size is not None or self.pyramid is not None:
+            return
+        self.frame_index = index
+        self.setPixmap(self.animation.frames[index])
+
+    def reload_image(self):
+        # The file changed on disk, decode it again at the size shown
+        if self.target_size is not None:
+            self.set_image(self.image_path, *self.target_size)
+
+    def cancel_decode(self):
+        if self.decode_request is not None:
+            self.decode_request.cancel()
+            self.decode_request = None
+
+    def boundingRect(self):
+        if self.pyramid is not None:
+            return QRectF(QPointF(0, 0), self.deep_size)
+        if self.pending_size is not None:
+            return QRectF(QPointF(0, 0), self.pending_size)
+        return super().boundingRect()
+
+    def shape(self):
+        if self.pending_size is not None or self.pyramid is not None:
+            path = QPainterPath()
+            path.addRect(self.boundingRect())
+            return path
+        return super().shape()
+
+    def paint(self, painter, option, widget=None):
+        if self.pending_size is None and self.pyramid is None:
+            super().paint(painter, option, widget)
+            return
+        rect = self.boundingRect()
+        if self.pyramid is not None:
+            # Only the tiles of the exposed rect, at the level that matches the view scale
+            device_scale = (QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+                            * painter.device().devicePixelRatioF())
+            self.pyramid.paint(painter, rect, option.exposedRect, device_scale, self, self.tile_loaded)
+        elif self.pixmap().isNull():
+            # Fill a box until the first pixels arrive
+            painter.fillRect(rect, PLACEHOLDER_COLOR)
+        else:
+            # Stretch the previous pixels over the new size. A transient state, so the
+            # cheap transform without resampling is good enough
+            painter.save()
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+            painter.drawPixmap(rect, self.pixmap(), QRectF(self.pixmap().rect()))
+            painter.restore()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(QPen(option.palette.windowText(), 0, Qt.PenStyle.DashLine))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRect(rect)
 
     def rect(self):
+        if self.pyramid is not None:
+            return QRectF(self.pos(), self.deep_size)
+        if self.pending_size is not None:
+            return QRectF(self.pos(), self.pending_size)
         return QRectF(self.pos().x(), self.pos().y(), self.pixmap().width(), self.pixmap().height())
 
     def setRect(self, rect):
@@ -35,38 +231,65 @@ class Image(QGraphicsPixmapItem):
         self.setPos(rect.left(), rect.top())
 
     def itemChange(self, change, value):
+        if change == QGraphicsItem.GraphicsItemChange.ItemSceneChange:
+            # Leave the clock of the old scene, the new one picks the animation up below
+            scene = self.scene()
+            if self.animation is not None and getattr(scene, "animation_clock", None) is not None:
+                scene.animation_clock.remove(self)
+        if change == QGraphicsItem.GraphicsItemChange.ItemSceneHasChanged:
+            if value is not None and self.animation is not None:
+                animation_clock(value).add(self)
+            # A removed item stops waiting for its pixels and asks again when it returns
+            if value is None:
+                image_watcher().unwatch(self)
+                self.cancel_decode()
+                if self.pyramid is not None:
+                    tile_loader().cancel_owner(self)
+            elif self.pending_size is not None and self.decode_request is None:
+                self.set_image(self.image_path, *self.target_size)
+            else:
+                image_watcher().watch(self)
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            # Snap the new position to the grid
-            x, y = value.x(), value.y()
-            snapped_x, snapped_y = GridScene.snap_to_grid(x, y)
-            return QPointF(snapped_x, snapped_y)
+            # Snap the new position to the grid and to other shapes
+            return snap_item_position(self, value)
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            notify_geometry_changed(self)
         return super().itemChange(change, value)
-    
-    def to_dict(self):
+
+    def snapshot(self):
+        rect = self.rect()
         pos = self.pos()
-        return {
-            "type": "image",
-            "x": self.rect().x(),
-            "y": self.rect().y(),
-            "width": self.rect().width(),
-            "height": self.rect().height(),
-            "rotation": self.rotation(),
-            "image_path": self.image_path,
-            "pos_x": pos.x(),
-            "pos_y": pos.y()
-        }
+        return (rect.x(), rect.y(), rect.width(), rect.height(), self.rotation(),
+                self.image_path, pos.x(), pos.y())
+
+    def to_dict(self):
+        return {"type": "image", **dict(zip(self.SNAPSHOT_FIELDS, self.snapshot()))}
 
     @classmethod
     def from_dict(cls, data):
+        # Restore the image path
+        image_path = data.get("image_path", "C:\\python_projects\\images\\earth.jpg")
         rect = cls(
             data.get("x", 0),
             data.get("y", 0),
             data.get("width", 100),
-            data.get("height", 100)
+            data.get("height", 100),
+            image_path
         )
-        rect.setRotation(data.get("rotation", 0))
-        # Restore the image path
+        rect.apply_dict(data)
+        return rect
+
+    def apply_dict(self, data):
         image_path = data.get("image_path", "C:\\python_projects\\images\\earth.jpg")
-        # Set the scene position after creation
-        rect.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
-        return rect
\ No newline at end of file
+        width, height = data.get("width", 100), data.get("height", 100)
+        if image_path != self.image_path or self.rect().size() != QSizeF(width, height):
+            self.set_image(image_path, width, height)
+        self.setRotation(data.get("rotation", 0))
+        # Set the scene position after the image
+        self.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+
+    @classmethod
+    def record_bounds(cls, data):
+        # The pixmap fits inside width x height with its aspect ratio kept
+        rect = QRectF(0, 0, data.get("width", 100), data.get("height", 100))
+        return rotated_bounds(rect, data.get("rotation", 0)).translated(data.get("pos_x", 0), data.get("pos_y", 0))
\ No newline at end of file
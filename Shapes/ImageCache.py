@@ -0,0 +1,132 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import OrderedDict
+import os
+
+DEFAULT_BUDGET_BYTES = 256 << 20  # Decoded pixels kept across all images
+MAX_ORIGINAL_SHARE = 4  # Originals larger than budget / this are decoded for each new size instead of kept
+
+class PixmapCache:
+    """
+    Process-wide LRU cache of decoded images, keyed by (path, mtime, size, target
+    size). Items that show the same image at the same size get the same QPixmap
+    and so share its pixel data. Scaling to a new size starts from the cached
+    original, so resizing an image does not read the file again. The cache evicts
+    the least recently used pixmaps once their pixel data exceeds the budget.
+    """
+    def __init__(self, budget=DEFAULT_BUDGET_BYTES):
+        self.budget = budget
+        self.used = 0
+        self.entries = OrderedDict()  # Key -> (pixmap, cost in bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decodes = 0  # Misses that had to read and decode the file
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def cost(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth()) // 8
+
+    def key(self, path, width=None, height=None):
+        """
+        The cache key of an image at a target size, or None when the file cannot be read.
+        """
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        size = None if width is None or height is None else (max(1, int(width)), max(1, int(height)))
+        return (path, stat.st_mtime_ns, stat.st_size, size)
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key):
+        # Lookup that leaves the statistics and the LRU order alone, for speculative checks
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def pixmap(self, path, width=None, height=None):
+        """
+        Returns the image at path scaled to fit width x height with its aspect ratio
+        kept, or at its own size without a target size. Returns a null pixmap for
+        files that cannot be read. Decodes on the calling thread, see ImageDecoder
+        for decoding on a worker.
+        """
+        key = self.key(path, width, height)
+        if key is None:
+            return QPixmap()
+        pixmap = self.lookup(key)
+        if pixmap is not None:
+            return pixmap
+        original = self._original(key[:3])
+        size = key[3]
+        if original.isNull() or size is None:
+            return original
+        pixmap = original.scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        self.insert(key, pixmap)
+        return pixmap
+
+    def _original(self, file_key):
+        key = file_key + (None,)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.decodes += 1
+        pixmap = QPixmap(file_key[0])
+        if not pixmap.isNull() and self.cost(pixmap) <= self.budget // MAX_ORIGINAL_SHARE:
+            self.insert(key, pixmap)
+        return pixmap
+
+    def insert(self, key, pixmap):
+        cost = self.cost(pixmap)
+        if cost > self.budget:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used -= old[1]
+        self.entries[key] = (pixmap, cost)
+        self.used += cost
+        self._evict()
+
+    def _evict(self):
+        while self.used > self.budget and self.entries:
+            _, (_, cost) = self.entries.popitem(last=False)
+            self.used -= cost
+            self.evictions += 1
+
+    def set_budget(self, budget):
+        self.budget = max(0, int(budget))
+        self._evict()
+
+    def invalidate(self, path):
+        # Drop every size of one file, e.g. after it changed on disk
+        for key in [key for key in self.entries if key[0] == path]:
+            self.used -= self.entries.pop(key)[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = self.decodes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "used": self.used, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses, "decodes": self.decodes, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+PIXMAP_CACHE = PixmapCache()
@@ -0,0 +1,183 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import threading
+from Shapes.ImageCache import PIXMAP_CACHE
+from Shapes.Animation import FRAME_CACHE, FrameSequence
+
+FRAMES = "frames"  # Last element of the keys of animation decodes
+
+class DecodeSignals(QObject):
+    decoded = pyqtSignal(object, object)  # Key, QImage or a list of (QImage, delay) frames
+
+class DecodeTask(QRunnable):
+    """
+    Decodes one image with QImageReader on a pool worker. Images with a target
+    size are decoded straight at the size that fits it, so large photos never
+    exist at full resolution in memory. Animation decodes read every frame.
+    """
+    def __init__(self, key):
+        super().__init__()
+        self.key = key
+        self.canceled = threading.Event()
+        self.signals = DecodeSignals()
+
+    def run(self):
+        if self.canceled.is_set():
+            return
+        path, _, _, size = self.key[:4]
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        if size is not None:
+            source_size = reader.size()
+            if source_size.isValid():
+                reader.setScaledSize(source_size.scaled(QSize(*size), Qt.AspectRatioMode.KeepAspectRatio))
+        if self.key[-1] == FRAMES:
+            result = self.read_frames(reader, size)
+        else:
+            result = self.read_image(reader, size)
+        if not self.canceled.is_set():
+            self.signals.decoded.emit(self.key, result)
+
+    @staticmethod
+    def read_image(reader, size):
+        image = reader.read()
+        if size is not None and not image.isNull() and not reader.scaledSize().isValid():
+            # Formats that cannot report their size are scaled after reading
+            image = image.scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        return image
+
+    def read_frames(self, reader, size):
+        # Animations too large for the frame cache keep only their first frame
+        frames = []
+        cost = 0
+        limit = FRAME_CACHE.max_sequence_bytes()
+        while not self.canceled.is_set():
+            image = self.read_image(reader, size)
+            if image.isNull():
+                break
+            cost += image.sizeInBytes()
+            if frames and cost > limit:
+                return frames[:1]
+            frames.append((image, reader.nextImageDelay()))
+            if not reader.canRead():
+                break
+        return frames
+
+class DecodeRequest:
+    """
+    A pending decode for one caller. Canceling it drops the callback, and the
+    decode itself once no other request waits for the same image.
+    """
+    def __init__(self, decoder, key, callback):
+        self.decoder = decoder
+        self.key = key
+        self.callback = callback
+
+    def cancel(self):
+        self.decoder.cancel(self)
+
+class ImageDecoder(QObject):
+    """
+    Decodes images on its own thread pool and hands the results to PIXMAP_CACHE.
+    Requests for an image that is already being decoded wait for that decode.
+    Pixmaps are only created on the GUI thread, when a decode finishes.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.tasks = {}  # Cache key -> running DecodeTask
+        self.waiting = {}  # Cache key -> requests waiting for the decode
+
+    def request(self, path, width, height, callback):
+        """
+        Calls callback(pixmap) with the image at path fitted into width x height,
+        right away when it is cached, otherwise once a worker decoded it. Returns
+        a DecodeRequest that can be canceled, or None when callback already ran.
+        A file that cannot be read calls back with a null pixmap.
+        """
+        key = PIXMAP_CACHE.key(path, width, height)
+        if key is None:
+            callback(QPixmap())
+            return None
+        pixmap = PIXMAP_CACHE.lookup(key)
+        if pixmap is not None:
+            callback(pixmap)
+            return None
+        return self.start(key, callback)
+
+    def request_frames(self, path, width, height, callback):
+        """
+        Like request(), for all frames of an animation. Calls back with a
+        FrameSequence, or None when the file cannot be read.
+        """
+        key = PIXMAP_CACHE.key(path, width, height)
+        if key is None:
+            callback(None)
+            return None
+        key += (FRAMES,)
+        sequence = FRAME_CACHE.lookup(key)
+        if sequence is not None:
+            callback(sequence)
+            return None
+        return self.start(key, callback)
+
+    def start(self, key, callback):
+        request = DecodeRequest(self, key, callback)
+        self.waiting.setdefault(key, []).append(request)
+        if key not in self.tasks:
+            task = DecodeTask(key)
+            task.signals.decoded.connect(self.decoded)
+            self.tasks[key] = task
+            PIXMAP_CACHE.decodes += 1
+            self.pool.start(task)
+        return request
+
+    def cancel(self, request):
+        requests = self.waiting.get(request.key)
+        if not requests or request not in requests:
+            return
+        requests.remove(request)
+        if not requests:
+            del self.waiting[request.key]
+            task = self.tasks.pop(request.key, None)
+            if task is not None:
+                task.canceled.set()
+
+    def decoded(self, key, image):
+        self.tasks.pop(key, None)
+        requests = self.waiting.pop(key, ())
+        if not requests:
+            return
+        if key[-1] == FRAMES:
+            sequence = None
+            if image:
+                sequence = FrameSequence([QPixmap.fromImage(frame) for frame, _ in image], [delay for _, delay in image])
+                FRAME_CACHE.insert(key, sequence)
+            for request in requests:
+                request.callback(sequence)
+            return
+        pixmap = QPixmap.fromImage(image)
+        if not pixmap.isNull():
+            PIXMAP_CACHE.insert(key, pixmap)
+        for request in requests:
+            request.callback(pixmap)
+
+    def pending(self):
+        return len(self.tasks)
+
+    def wait(self, msecs=-1):
+        # Blocks until the workers are idle, the results still arrive through the event loop
+        return self.pool.waitForDone(msecs)
+
+_decoder = None
+
+def image_decoder():
+    """
+    The process-wide ImageDecoder, created on first use on the GUI thread.
+    """
+    global _decoder
+    if _decoder is None:
+        _decoder = ImageDecoder(QCoreApplication.instance())
+    return _decoder
@@ -0,0 +1,169 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+import os
+from GUI.Bundle import drop_renditions, file_hash
+from Shapes.ImageCache import PIXMAP_CACHE
+from Shapes.Animation import FRAME_CACHE
+
+RELOAD_DEBOUNCE_MS = 300  # Quiet time after the last change event before files are checked
+MISSING_RETRIES = 5  # Checks of a removed file before its directory is watched for it instead
+
+class HashSignals(QObject):
+    hashed = pyqtSignal(str, object)  # Path, SHA-256 or None for a missing file
+
+class HashTask(QRunnable):
+    """
+    Hashes one linked image on a pool worker, so saving a large file in another
+    program never blocks the editor.
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.signals = HashSignals()
+
+    def run(self):
+        try:
+            digest = file_hash(self.path)
+        except OSError:
+            digest = None
+        self.signals.hashed.emit(self.path, digest)
+
+class ImageWatcher(QObject):
+    """
+    Watches the files of all Image items in scenes with one QFileSystemWatcher.
+    Bursts of change events are collapsed, and items only reload when the content
+    hash of their file changed, not on every touch of its modification time.
+    A file that stays removed is waited for through its directory, not polled.
+    """
+    image_changed = pyqtSignal(str)  # Path of a file whose new content is being shown
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.file_changed)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self.pool = QThreadPool(self)
+        self.items = {}  # Path -> Image items showing it
+        self.paths = {}  # Image item -> watched path
+        self.hashes = {}  # Path -> SHA-256 of the content the items show
+        self.changed = set()  # Paths with change events since the last check
+        self.retries = {}  # Path -> checks that found the file removed
+        self.missing = {}  # Watched directory -> removed paths in it that items still show
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.check_changed)
+
+    def watch(self, item):
+        # Called whenever an item enters a scene or changes its file
+        path = item.image_path
+        old_path = self.paths.get(item)
+        if old_path == path:
+            return
+        if old_path is not None:
+            self.unwatch(item)
+        if not path or not os.path.isfile(path):
+            return
+        self.paths[item] = path
+        items = self.items.setdefault(path, set())
+        items.add(item)
+        if len(items) == 1:
+            self.watcher.addPath(path)
+            self.hash_later(path)
+
+    def unwatch(self, item):
+        path = self.paths.pop(item, None)
+        if path is None:
+            return
+        items = self.items.get(path)
+        items.discard(item)
+        if not items:
+            del self.items[path]
+            self.hashes.pop(path, None)
+            self.changed.discard(path)
+            self.retries.pop(path, None)
+            self.stop_waiting(path)
+            self.watcher.removePath(path)
+
+    def file_changed(self, path):
+        if path in self.items:
+            self.changed.add(path)
+            self.timer.start(RELOAD_DEBOUNCE_MS)
+
+    def check_changed(self):
+        changed, self.changed = self.changed, set()
+        for path in changed:
+            if path not in self.items:
+                continue
+            if not os.path.exists(path):
+                retries = self.retries[path] = self.retries.get(path, 0) + 1
+                if retries <= MISSING_RETRIES:
+                    # Saving by replace briefly removes the file, look again after the next quiet time
+                    self.changed.add(path)
+                else:
+                    self.wait_for(path)
+                continue
+            self.retries.pop(path, None)
+            # Replacing a file drops it from the watcher, so it is added back
+            if path not in self.watcher.files():
+                self.watcher.addPath(path)
+            self.hash_later(path)
+        if self.changed:
+            self.timer.start(RELOAD_DEBOUNCE_MS)
+
+    def wait_for(self, path):
+        # The file was removed for good, its directory reports when it comes back
+        self.retries.pop(path, None)
+        directory = os.path.dirname(path)
+        if directory in self.missing:
+            self.missing[directory].add(path)
+        elif os.path.isdir(directory):
+            self.missing[directory] = {path}
+            self.watcher.addPath(directory)
+
+    def stop_waiting(self, path):
+        directory = os.path.dirname(path)
+        paths = self.missing.get(directory)
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del self.missing[directory]
+                self.watcher.removePath(directory)
+
+    def directory_changed(self, directory):
+        for path in [path for path in self.missing.get(directory, ()) if os.path.exists(path)]:
+            self.stop_waiting(path)
+            self.changed.add(path)
+            self.timer.start(RELOAD_DEBOUNCE_MS)
+
+    def hash_later(self, path):
+        task = HashTask(path)
+        task.signals.hashed.connect(self.hashed)
+        self.pool.start(task)
+
+    def hashed(self, path, digest):
+        if path not in self.items or digest is None:
+            return
+        previous = self.hashes.get(path)
+        self.hashes[path] = digest
+        if previous is None or previous == digest:
+            # The first hash only records what the items show
+            return
+        # Decoded pixels of the old content must not be served again
+        PIXMAP_CACHE.invalidate(path)
+        FRAME_CACHE.invalidate(path)
+        drop_renditions(path)
+        for item in list(self.items[path]):
+            item.reload_image()
+        self.image_changed.emit(path)
+
+_watcher = None
+
+def image_watcher():
+    """
+    The process-wide ImageWatcher, created on first use on the GUI thread.
+    """
+    global _watcher
+    if _watcher is None:
+        _watcher = ImageWatcher(QCoreApplication.instance())
+    return _watcher
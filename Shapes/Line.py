@@ -2,15 +2,24 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from GUI.GridScene import *
+from GUI.Snapping import snap_item_position, snap_point
+from Shapes.Registry import register_shape
+from Shapes.CachePolicy import adaptive_cache
+from Shapes.BaseShapeItem import rotated_bounds
 
+@register_shape("line")
+@adaptive_cache
 class Line(QGraphicsLineItem):
+    HANDLE_SIZE = 10
+    HANDLE_PEN_WIDTH = 1  # Outline of the endpoint handles
+    SNAPSHOT_FIELDS = ("x1", "y1", "x2", "y2", "rotation", "border_color", "border_width", "line_style", "cap_style", "pos_x", "pos_y")
+
     def __init__(self, x1, y1, x2, y2):
         super().__init__(x1, y1, x2, y2)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
-        self.setCacheMode(QGraphicsItem.CacheMode.DeviceCoordinateCache)
 
         self.line_color = Qt.GlobalColor.white
         self.line_width = 3
@@ -23,24 +32,40 @@ class Line(QGraphicsLineItem):
         self._drag_offset = QPointF(0, 0)
 
     def paint(self, painter, option, widget=None):
-        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
         painter.setPen(self.pen())
         painter.drawLine(self.line())
 
         # If selected, draw blue rectangles at endpoints
         if self.isSelected():
-            rect_size = 10
+            rect_size = self.HANDLE_SIZE
             half = rect_size / 2
             line = self.line()
             for pt in [line.p1(), line.p2()]:
                 rect = QRectF(pt.x() - half, pt.y() - half, rect_size, rect_size)
                 painter.setBrush(QBrush(Qt.GlobalColor.blue))
-                painter.setPen(Qt.GlobalColor.blue)
+                painter.setPen(QPen(Qt.GlobalColor.blue, self.HANDLE_PEN_WIDTH))
                 painter.drawRect(rect)
 
+    def boundingRect(self):
+        # Include the endpoint handles and their outline so they are repainted when the line moves
+        rect = super().boundingRect()
+        if self.isSelected():
+            half = (self.HANDLE_SIZE + self.HANDLE_PEN_WIDTH) / 2
+            rect.adjust(-half, -half, half, half)
+        return rect
+
+    def shape(self):
+        path = super().shape()
+        if self.isSelected():
+            half = self.HANDLE_SIZE / 2
+            line = self.line()
+            for pt in [line.p1(), line.p2()]:
+                path.addRect(QRectF(pt.x() - half, pt.y() - half, self.HANDLE_SIZE, self.HANDLE_SIZE))
+        return path
+
     def mousePressEvent(self, event):
         if self.isSelected():
-            rect_size = 10
+            rect_size = self.HANDLE_SIZE
             half = rect_size / 2
             line = self.line()
             mouse_pos = event.pos()
@@ -57,12 +82,12 @@ class Line(QGraphicsLineItem):
     def mouseMoveEvent(self, event):
         if self._dragging_point is not None:
             line = self.line()
-            new_pt = event.pos() - self._drag_offset
-            snapped_x, snapped_y = GridScene.snap_to_grid(new_pt.x(), new_pt.y())
+            new_pt = snap_point(event.pos() - self._drag_offset)
             if self._dragging_point == 0:
-                self.setLine(snapped_x, snapped_y, *GridScene.snap_to_grid(line.x2(), line.y2()))
+                self.setLine(QLineF(new_pt, snap_point(line.p2())))
             else:
-                self.setLine(*GridScene.snap_to_grid(line.x1(), line.y1()), snapped_x, snapped_y)
+                self.setLine(QLineF(snap_point(line.p1()), new_pt))
+            notify_geometry_changed(self)
             event.accept()
             self.update()
             return
@@ -73,31 +98,26 @@ class Line(QGraphicsLineItem):
         super().mouseReleaseEvent(event)
 
     def itemChange(self, change, value):
+        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedChange:
+            # The handles change the bounding rect
+            self.prepareGeometryChange()
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            # Get the new position as x, y
-            x, y = value.x(), value.y()
-            snapped_x, snapped_y = GridScene.snap_to_grid(x, y)
-            return QPointF(snapped_x, snapped_y)
+            # Snap the new position to the grid and to other shapes
+            return snap_item_position(self, value)
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            notify_geometry_changed(self)
         return super().itemChange(change, value)
-    
-    def to_dict(self):
-        pos = self.pos()
+
+    def snapshot(self):
         line = self.line()
         pen = self.pen()
-        return {
-            "type": "line",
-            "x1": line.x1(),
-            "y1": line.y1(),
-            "x2": line.x2(),
-            "y2": line.y2(),
-            "rotation": self.rotation(),
-            "border_color": self.pen().color().name(),
-            "border_width": self.pen().widthF(),
-            "line_style": pen.style().value,
-            "cap_style": pen.capStyle().value,
-            "pos_x": pos.x(),
-            "pos_y": pos.y()
-        }
+        pos = self.pos()
+        return (line.x1(), line.y1(), line.x2(), line.y2(), self.rotation(),
+                pen.color().name(), pen.widthF(), pen.style().value, pen.capStyle().value,
+                pos.x(), pos.y())
+
+    def to_dict(self):
+        return {"type": "line", **dict(zip(self.SNAPSHOT_FIELDS, self.snapshot()))}
 
     @classmethod
     def from_dict(cls, data):
@@ -107,14 +127,24 @@ class Line(QGraphicsLineItem):
             data.get("x2", 100),
             data.get("y2", 100)
         )
-        rect.setRotation(data.get("rotation", 0))
-        pen = QPen(
-            QColor(data.get("border_color", "#000000")),
-            data.get("border_width", 3),
-        Qt.PenStyle(data.get("line_style", int(Qt.PenStyle.SolidLine.value))),
-        Qt.PenCapStyle(data.get("cap_style", int(Qt.PenCapStyle.SquareCap.value)))
-        )
-        rect.setPen(pen)
-        # Set the scene position after creation
-        rect.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
-        return rect
\ No newline at end of file
+        rect.apply_dict(data)
+        return rect
+
+    def apply_dict(self, data):
+        self.setLine(data.get("x1", 0), data.get("y1", 0), data.get("x2", 100), data.get("y2", 100))
+        self.setRotation(data.get("rotation", 0))
+        self.line_color = QColor(data.get("border_color", "#000000"))
+        self.line_width = data.get("border_width", 3)
+        self.line_style = Qt.PenStyle(data.get("line_style", int(Qt.PenStyle.SolidLine.value)))
+        self.cap_style = Qt.PenCapStyle(data.get("cap_style", int(Qt.PenCapStyle.SquareCap.value)))
+        self.setPen(QPen(self.line_color, self.line_width, self.line_style, self.cap_style))
+        # Set the scene position after the geometry
+        self.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+
+    @classmethod
+    def record_bounds(cls, data):
+        # Includes the endpoint handles drawn while the line is selected
+        margin = max(data.get("border_width", 3) / 2, cls.HANDLE_SIZE / 2)
+        rect = QRectF(QPointF(data.get("x1", 0), data.get("y1", 0)), QPointF(data.get("x2", 100), data.get("y2", 100))).normalized()
+        rect = rotated_bounds(rect.adjusted(-margin, -margin, margin, margin), data.get("rotation", 0))
+        return rect.translated(data.get("pos_x", 0), data.get("pos_y", 0))
\ No newline at end of file
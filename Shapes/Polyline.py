@@ -0,0 +1,502 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from GUI.GridScene import *
+from GUI.Snapping import snap_item_position, snap_point
+from Shapes.Registry import register_shape
+from Shapes.CachePolicy import adaptive_cache
+from Shapes.BaseShapeItem import rotated_bounds
+from array import array
+import base64
+import bisect
+import math
+import sys
+import threading
+
+LOD_TOLERANCE = 0.5  # Device pixels a simplified path may stray from the full one
+MIN_LOD_LEVEL = -4  # Finest level, its tolerance is a 32nd of a device pixel at 1:1
+SEGMENT_CHUNK = 64  # Consecutive segments per entry of the hit-test index
+HIT_TOLERANCE = 3  # Item units around the stroke that still hit it
+MAX_VERTEX_HANDLES = 500  # Handles are only drawn when at most this many vertices are exposed
+SYNC_SIMPLIFY_VERTICES = 2000  # Paths up to this long are simplified right away, longer ones on a worker
+PREVIEW_VERTICES = 4096  # Evenly picked vertices painted while the simplification is pending
+
+def encode_points(points):
+    # Little-endian doubles in base64, compact in JSON and a single string column in binary files
+    if sys.byteorder != "little":
+        points = array("d", points)
+        points.byteswap()
+    return base64.b64encode(points.tobytes()).decode("ascii")
+
+def decode_points(value):
+    """
+    Returns the flat x, y array of a record's points, stored either encoded or as
+    a plain list of numbers or of [x, y] pairs.
+    """
+    points = array("d")
+    if isinstance(value, str):
+        points.frombytes(base64.b64decode(value))
+        if sys.byteorder != "little":
+            points.byteswap()
+    elif value and isinstance(value[0], (list, tuple)):
+        for x, y in value:
+            points.append(x)
+            points.append(y)
+    elif value:
+        points.extend(value)
+    return points
+
+def points_bounds(points):
+    xs, ys = points[0::2], points[1::2]
+    return QRectF(QPointF(min(xs), min(ys)), QPointF(max(xs), max(ys)))
+
+def vertex_importance(points):
+    """
+    Douglas-Peucker run once for every tolerance at the same time: a vertex is kept
+    by the simplification with tolerance t exactly when its importance exceeds t.
+    End points are always kept.
+    """
+    count = len(points) // 2
+    importance = array("d", bytes(8 * count))
+    if count == 0:
+        return importance
+    importance[0] = importance[count - 1] = math.inf
+    xs, ys = points[0::2], points[1::2]
+    stack = [(0, count - 1, math.inf)]
+    while stack:
+        first, last, limit = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length_sq = dx * dx + dy * dy
+        farthest, distance_sq = first + 1, -1.0
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if length_sq:
+                t = (px * dx + py * dy) / length_sq
+                if t < 0:
+                    t = 0
+                elif t > 1:
+                    t = 1
+                px -= t * dx
+                py -= t * dy
+            d = px * px + py * py
+            if d > distance_sq:
+                farthest, distance_sq = i, d
+        # A vertex is never more important than the split that led to it
+        value = min(math.sqrt(distance_sq), limit)
+        importance[farthest] = value
+        stack.append((first, farthest, value))
+        stack.append((farthest, last, value))
+    return importance
+
+def segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0 if not length_sq else max(0, min(1, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+class SimplifySignals(QObject):
+    simplified = pyqtSignal(int, object)  # Points version, importance array
+
+class SimplifyTask(QRunnable):
+    """
+    Works out the vertex importance of a copy of a path's points on a pool worker.
+    """
+    def __init__(self, points, version):
+        super().__init__()
+        self.points = points
+        self.version = version
+        self.canceled = threading.Event()
+        self.signals = SimplifySignals()
+
+    def run(self):
+        if self.canceled.is_set():
+            return
+        importance = vertex_importance(self.points)
+        if not self.canceled.is_set():
+            self.signals.simplified.emit(self.version, importance)
+
+_pool = None
+
+def simplify_pool():
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool(QCoreApplication.instance())
+    return _pool
+
+@register_shape("polyline")
+@adaptive_cache
+class Polyline(QGraphicsItem):
+    """
+    An open path of many vertices, e.g. a GPS track or a freehand stroke. Points
+    live in one flat array of doubles. It paints a Douglas-Peucker simplification
+    that matches the view scale, and finds hits through chunks of segments.
+    """
+    HANDLE_SIZE = 10
+    SNAPSHOT_FIELDS = ("points", "rotation", "border_color", "border_width", "line_style", "cap_style", "pos_x", "pos_y")
+
+    def __init__(self, points=None):
+        super().__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+        # Paint is handed the exposed rect, which limits the vertex handles drawn
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.line_color = QColor(Qt.GlobalColor.white)
+        self.line_width = 3
+        self.line_style = Qt.PenStyle.SolidLine
+        self.cap_style = Qt.PenCapStyle.SquareCap
+        self._pen = QPen(self.line_color, self.line_width, self.line_style, self.cap_style)
+        self._dragging_point = None  # Index of the vertex being dragged
+        self._drag_offset = QPointF(0, 0)
+        self.simplify_task = None
+        self.points_version = 0
+        self.set_points(points if points is not None else array("d", (0, 0, 50, 50, 100, 0, 150, 50)))
+
+    def set_points(self, points):
+        self.prepareGeometryChange()
+        self.points = array("d", points)
+        self.bounds = points_bounds(self.points) if self.points else QRectF()
+        self.forget_layout()
+        self.update()
+
+    def forget_layout(self):
+        # Everything derived from the vertices, rebuilt lazily
+        self.points_version += 1
+        self.cancel_simplify()
+        self.importance = None
+        self.lods = {}  # LOD level -> (vertex indices, QPolygonF)
+        self.preview = None  # (vertex indices, QPolygonF) painted while the simplification is pending
+        self.chunks = None  # [(first vertex, rect)] of SEGMENT_CHUNK segments each
+        self.shape_path = None
+        self.encoded_points = None
+
+    def vertex_count(self):
+        return len(self.points) // 2
+
+    def vertex(self, index):
+        return QPointF(self.points[2 * index], self.points[2 * index + 1])
+
+    def pen(self):
+        return QPen(self._pen)
+
+    def setPen(self, pen):
+        self.prepareGeometryChange()
+        self._pen = QPen(pen)
+        self.line_color = pen.color()
+        self.line_width = pen.widthF()
+        self.shape_path = None
+        self.update()
+
+    def lod_level(self, device_scale):
+        if device_scale <= 0:
+            return MIN_LOD_LEVEL
+        return max(MIN_LOD_LEVEL, math.floor(math.log2(1 / device_scale)))
+
+    def lod(self, level):
+        """
+        The vertex indices and polygon of the simplification for a LOD level, whose
+        tolerance doubles with every level.
+        """
+        cached = self.lods.get(level)
+        if cached is not None:
+            return cached
+        if self.importance is None:
+            if self.vertex_count() > SYNC_SIMPLIFY_VERTICES:
+                if self._dragging_point is None:
+                    self.start_simplify()
+                if self.preview is None:
+                    self.preview = self.preview_lod()
+                return self.preview
+            self.importance = vertex_importance(self.points)
+        tolerance = LOD_TOLERANCE * 2.0 ** level
+        points = self.points
+        indices = array("i", (i for i, value in enumerate(self.importance) if value > tolerance))
+        polygon = QPolygonF([QPointF(points[2 * i], points[2 * i + 1]) for i in indices])
+        cached = self.lods[level] = (indices, polygon)
+        return cached
+
+    def preview_lod(self):
+        # Stands in until the worker is done, vertex drags patch it like the simplifications
+        count = self.vertex_count()
+        step = max(1, count // PREVIEW_VERTICES)
+        indices = array("i", range(0, count, step))
+        if indices[-1] != count - 1:
+            indices.append(count - 1)
+        points = self.points
+        return indices, QPolygonF([QPointF(points[2 * i], points[2 * i + 1]) for i in indices])
+
+    def start_simplify(self):
+        if self.simplify_task is not None:
+            return
+        # The worker gets a copy, the points may be edited meanwhile
+        task = SimplifyTask(array("d", self.points), self.points_version)
+        task.signals.simplified.connect(self.simplified)
+        self.simplify_task = task
+        simplify_pool().start(task)
+
+    def cancel_simplify(self):
+        if self.simplify_task is not None:
+            self.simplify_task.canceled.set()
+            self.simplify_task = None
+
+    def simplified(self, version, importance):
+        if version != self.points_version:
+            return
+        self.simplify_task = None
+        self.importance = importance
+        self.lods = {}
+        self.preview = None
+        self.shape_path = None
+        self.update()
+
+    def segment_chunks(self):
+        if self.chunks is None:
+            points = self.points
+            self.chunks = []
+            for first in range(0, max(1, self.vertex_count() - 1), SEGMENT_CHUNK):
+                span = points[2 * first:2 * (first + SEGMENT_CHUNK + 1)]
+                self.chunks.append((first, points_bounds(span)))
+        return self.chunks
+
+    def chunks_near(self, rect):
+        return [first for first, bounds in self.segment_chunks() if bounds.intersects(rect)]
+
+    def runs_near(self, rect):
+        # Vertex ranges of neighbouring chunks near rect, merged
+        runs = []
+        for first in self.chunks_near(rect):
+            last = min(first + SEGMENT_CHUNK, self.vertex_count() - 1)
+            if runs and runs[-1][1] == first:
+                runs[-1][1] = last
+            else:
+                runs.append([first, last])
+        return runs
+
+    def hit_margin(self):
+        return self._pen.widthF() / 2 + HIT_TOLERANCE
+
+    def boundingRect(self):
+        margin = self._pen.widthF() / 2
+        if self.isSelected():
+            margin = max(margin, self.HANDLE_SIZE / 2)
+        return self.bounds.adjusted(-margin, -margin, margin, margin)
+
+    def shape(self):
+        # A stroke of a simplification about as fine as the hit margin, for rubber band selection
+        if self.shape_path is None:
+            margin = self.hit_margin()
+            level = self.lod_level(LOD_TOLERANCE / margin)
+            path = QPainterPath()
+            path.addPolygon(self.lod(level)[1])
+            stroker = QPainterPathStroker()
+            stroker.setWidth(2 * margin)
+            self.shape_path = stroker.createStroke(path)
+        return self.shape_path
+
+    def contains(self, point):
+        if self.vertex_at(point) is not None:
+            return True
+        margin = self.hit_margin()
+        area = QRectF(point.x() - margin, point.y() - margin, 2 * margin, 2 * margin)
+        if not self.bounds.adjusted(-margin, -margin, margin, margin).contains(point):
+            return False
+        points = self.points
+        x, y = point.x(), point.y()
+        last = self.vertex_count() - 1
+        for first in self.chunks_near(area):
+            for i in range(first, min(first + SEGMENT_CHUNK, last)):
+                if segment_distance(x, y, points[2 * i], points[2 * i + 1],
+                                    points[2 * i + 2], points[2 * i + 3]) <= margin:
+                    return True
+        return self.vertex_count() == 1 and math.hypot(x - points[0], y - points[1]) <= margin
+
+    def vertex_at(self, point):
+        # The vertex whose handle is under point, only while the handles are shown
+        if not self.isSelected():
+            return None
+        half = self.HANDLE_SIZE / 2
+        area = QRectF(point.x() - half, point.y() - half, self.HANDLE_SIZE, self.HANDLE_SIZE)
+        points = self.points
+        best, best_distance = None, None
+        for first in self.chunks_near(area):
+            for i in range(first, min(first + SEGMENT_CHUNK + 1, self.vertex_count())):
+                dx, dy = abs(points[2 * i] - point.x()), abs(points[2 * i + 1] - point.y())
+                if dx <= half and dy <= half and (best is None or dx + dy < best_distance):
+                    best, best_distance = i, dx + dy
+        return best
+
+    def exposed_vertices(self, rect):
+        points = self.points
+        found = set()
+        for first in self.chunks_near(rect):
+            for i in range(first, min(first + SEGMENT_CHUNK + 1, self.vertex_count())):
+                if rect.contains(points[2 * i], points[2 * i + 1]):
+                    found.add(i)
+                    if len(found) > MAX_VERTEX_HANDLES:
+                        return None
+        return found
+
+    def paint(self, painter, option, widget=None):
+        if not self.points:
+            return
+        device_scale = (QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+                        * painter.device().devicePixelRatioF())
+        painter.setPen(self._pen)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        level = self.lod_level(device_scale)
+        indices, polygon = self.lod(level)
+        # The simplified path strays from the full one by up to the level's tolerance
+        margin = self._pen.widthF() + LOD_TOLERANCE * 2.0 ** level / max(device_scale, 1e-9)
+        exposed = option.exposedRect.adjusted(-margin, -margin, margin, margin)
+        if exposed.contains(self.bounds):
+            painter.drawPolyline(polygon)
+        else:
+            # Only the runs of the path near the exposed rect, with one vertex more at each end
+            for first, last in self.runs_near(exposed):
+                start = max(0, bisect.bisect_right(indices, first) - 1)
+                stop = min(len(indices), bisect.bisect_left(indices, last) + 1)
+                if stop - start > 1:
+                    painter.drawPolyline(polygon.mid(start, stop - start))
+
+        # Vertex handles, once the view is close enough to tell them apart
+        if self.isSelected():
+            vertices = self.exposed_vertices(option.exposedRect)
+            if vertices:
+                half = self.HANDLE_SIZE / 2
+                painter.setBrush(QBrush(Qt.GlobalColor.blue))
+                painter.setPen(Qt.GlobalColor.blue)
+                for i in vertices:
+                    painter.drawRect(QRectF(self.points[2 * i] - half, self.points[2 * i + 1] - half,
+                                            self.HANDLE_SIZE, self.HANDLE_SIZE))
+
+    def mousePressEvent(self, event):
+        vertex = self.vertex_at(event.pos())
+        if vertex is not None:
+            self._dragging_point = vertex
+            self._drag_offset = event.pos() - self.vertex(vertex)
+            event.accept()
+            return
+        self._dragging_point = None
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._dragging_point is not None:
+            self.move_vertex(self._dragging_point, snap_point(event.pos() - self._drag_offset))
+            notify_geometry_changed(self)
+            event.accept()
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self._dragging_point is not None:
+            self._dragging_point = None
+            # Dragging only grew the bounds, the vertex may have left an edge
+            self.prepareGeometryChange()
+            self.bounds = points_bounds(self.points)
+            notify_geometry_changed(self)
+            # The patched simplifications are shown until they are worked out again
+            self.importance = None
+            if self.vertex_count() > SYNC_SIMPLIFY_VERTICES:
+                self.start_simplify()
+            else:
+                self.lods = {}
+                self.update()
+            notify_item_changed(self)
+        super().mouseReleaseEvent(event)
+
+    def move_vertex(self, index, point):
+        """
+        Moves one vertex. The cached simplifications and the chunks around the
+        vertex are patched rather than rebuilt, so dragging stays cheap on long
+        paths. The bounds only grow, the caller shrinks them when the drag ends.
+        """
+        self.prepareGeometryChange()
+        self.points_version += 1
+        self.cancel_simplify()
+        self.points[2 * index] = point.x()
+        self.points[2 * index + 1] = point.y()
+        bounds = self.bounds
+        self.bounds = QRectF(QPointF(min(bounds.left(), point.x()), min(bounds.top(), point.y())),
+                             QPointF(max(bounds.right(), point.x()), max(bounds.bottom(), point.y())))
+        if self.importance is not None:
+            self.importance[index] = math.inf
+        if self.chunks is not None:
+            # The vertex ends the chunk before its own when it starts one
+            for chunk in {index // SEGMENT_CHUNK, (index - 1) // SEGMENT_CHUNK}:
+                if 0 <= chunk < len(self.chunks):
+                    first = chunk * SEGMENT_CHUNK
+                    self.chunks[chunk] = (first, points_bounds(self.points[2 * first:2 * (first + SEGMENT_CHUNK + 1)]))
+        lods = list(self.lods.values())
+        if self.preview is not None:
+            lods.append(self.preview)
+        for indices, polygon in lods:
+            position = bisect.bisect_left(indices, index)
+            if position < len(indices) and indices[position] == index:
+                polygon.replace(position, point)
+            else:
+                indices.insert(position, index)
+                polygon.insert(position, point)
+        self.shape_path = None
+        self.encoded_points = None
+        self.update()
+
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.GraphicsItemChange.ItemSceneHasChanged and value is None:
+            # A removed path stops waiting for its simplification and asks again when painted
+            self.cancel_simplify()
+        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedChange:
+            # The handles change the bounding rect
+            self.prepareGeometryChange()
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
+            # Snap the new position to the grid and to other shapes
+            return snap_item_position(self, value)
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            notify_geometry_changed(self)
+        return super().itemChange(change, value)
+
+    def snapshot(self):
+        # The encoded points are kept until the next edit
+        if self.encoded_points is None:
+            self.encoded_points = encode_points(self.points)
+        pen = self._pen
+        pos = self.pos()
+        return (self.encoded_points, self.rotation(), pen.color().name(), pen.widthF(),
+                pen.style().value, pen.capStyle().value, pos.x(), pos.y())
+
+    def to_dict(self):
+        return {"type": "polyline", **dict(zip(self.SNAPSHOT_FIELDS, self.snapshot()))}
+
+    @classmethod
+    def from_dict(cls, data):
+        item = cls()
+        item.apply_dict(data)
+        return item
+
+    def apply_dict(self, data):
+        points = data.get("points")
+        if points != self.encoded_points:
+            self.set_points(decode_points(points))
+            if isinstance(points, str):
+                self.encoded_points = points
+        self.setRotation(data.get("rotation", 0))
+        self.line_color = QColor(data.get("border_color", "#000000"))
+        self.line_width = data.get("border_width", 3)
+        self.line_style = Qt.PenStyle(data.get("line_style", int(Qt.PenStyle.SolidLine.value)))
+        self.cap_style = Qt.PenCapStyle(data.get("cap_style", int(Qt.PenCapStyle.SquareCap.value)))
+        self.setPen(QPen(self.line_color, self.line_width, self.line_style, self.cap_style))
+        # Set the scene position after the geometry
+        self.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+
+    @classmethod
+    def record_bounds(cls, data):
+        # Includes the vertex handles drawn while the polyline is selected
+        points = decode_points(data.get("points"))
+        if not points:
+            return QRectF(data.get("pos_x", 0), data.get("pos_y", 0), 0, 0)
+        margin = max(data.get("border_width", 3) / 2, cls.HANDLE_SIZE / 2)
+        rect = rotated_bounds(points_bounds(points).adjusted(-margin, -margin, margin, margin), data.get("rotation", 0))
+        return rect.translated(data.get("pos_x", 0), data.get("pos_y", 0))
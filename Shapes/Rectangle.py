@@ -2,9 +2,16 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from Shapes.BaseShapeItem import BaseShapeItem
-from GUI.Grid import snap_to_grid, GRID_SIZE
+from GUI.GridScene import notify_geometry_changed
+from GUI.Snapping import snap_item_position
+from Shapes.Registry import register_shape
+from Shapes.CachePolicy import adaptive_cache
 
+@register_shape("rectangle")
+@adaptive_cache
 class Rectangle(QGraphicsRectItem, BaseShapeItem):
+    SNAPSHOT_FIELDS = ("x", "y", "width", "height", "rotation", "fill_color", "border_color", "border_width", "pos_x", "pos_y")
+
     def __init__(self, x, y, w, h):
         super().__init__(x, y, w, h)
 
@@ -18,29 +25,22 @@ class Rectangle(QGraphicsRectItem, BaseShapeItem):
 
     def itemChange(self, change, value):
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            # Force the view to update to prevent artifacts
-            scene = self.scene()
-            if scene is not None:
-                for view in scene.views():
-                    view.viewport().update()
-            return snap_to_grid(value, GRID_SIZE)
+            value = snap_item_position(self, value)
+            self.invalidate_move(value)
+            return value
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            notify_geometry_changed(self)
         return super().itemChange(change, value)
-    
-    def to_dict(self):
+
+    def snapshot(self):
+        rect = self.rect()
         pos = self.pos()
-        return {
-            "type": "rectangle",
-            "x": self.rect().x(),
-            "y": self.rect().y(),
-            "width": self.rect().width(),
-            "height": self.rect().height(),
-            "rotation": self.rotation(),
-            "fill_color": self.brush().color().name(),
-            "border_color": self.pen().color().name(),
-            "border_width": self.pen().widthF(),
-            "pos_x": pos.x(),
-            "pos_y": pos.y()
-        }
+        return (rect.x(), rect.y(), rect.width(), rect.height(), self.rotation(),
+                self.brush().color().name(), self.pen().color().name(), self.pen().widthF(),
+                pos.x(), pos.y())
+
+    def to_dict(self):
+        return {"type": "rectangle", **dict(zip(self.SNAPSHOT_FIELDS, self.snapshot()))}
 
     @classmethod
     def from_dict(cls, data):
@@ -50,12 +50,5 @@ class Rectangle(QGraphicsRectItem, BaseShapeItem):
             data.get("width", 100),
             data.get("height", 100)
         )
-        rect.setRotation(data.get("rotation", 0))
-        rect.setBrush(QBrush(QColor(data.get("fill_color", "#0000ff"))))
-        rect.setPen(QPen(
-            QColor(data.get("border_color", "#000000")),
-            data.get("border_width", 3)
-        ))
-        # Set the scene position after creation
-        rect.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+        rect.apply_dict(data)
         return rect
\ No newline at end of file
@@ -0,0 +1,227 @@
+import importlib
+
+# Modules that register the built-in shapes, imported on first use of the registry
+BUILTIN_SHAPE_MODULES = (
+    "Shapes.Rectangle",
+    "Shapes.Ellipse",
+    "Shapes.Triangle",
+    "Shapes.Line",
+    "Shapes.Polyline",
+    "Shapes.Text",
+    "Shapes.Image",
+)
+VERSION_KEY = "version"  # Records without it were written before shapes had schema versions
+
+class ShapeType:
+    """
+    A registered shape class with its type tag, current schema version and the
+    migrations that bring older records up to that version.
+    """
+    def __init__(self, tag, cls, version):
+        self.tag = tag
+        self.cls = cls
+        self.version = version
+        self.migrations = {}  # Version migrated from -> function(data) returning the next version
+
+    def migrate(self, data):
+        version = data.get(VERSION_KEY, 1)
+        if version > self.version:
+            raise ValueError(f"'{self.tag}' shapes of version {version} are newer than this editor supports")
+        if version == self.version:
+            return data
+        data = dict(data)
+        while version < self.version:
+            migration = self.migrations.get(version)
+            if migration is not None:
+                data = migration(data)
+            version += 1
+        data[VERSION_KEY] = version
+        return data
+
+SHAPE_TYPES = {}  # Type tag -> ShapeType
+CLASS_TYPES = {}  # Shape class -> ShapeType
+_builtins_loaded = False
+
+def register_shape(tag, version=1):
+    """
+    Class decorator that registers a shape class under a type tag. The class
+    provides to_dict() and a from_dict(data) classmethod.
+
+    A class can also provide snapshot(), returning its plain values in the order
+    of its SNAPSHOT_FIELDS class constant, cheap enough to take on the GUI thread.
+    It can provide apply_dict(data) too, which restores a record onto an existing
+    item, so the virtualizer can recycle items instead of rebuilding them.
+    """
+    def register(cls):
+        shape_type = ShapeType(tag, cls, version)
+        existing = SHAPE_TYPES.get(tag)
+        if existing is not None:
+            # Keep migrations registered before a module reload
+            shape_type.migrations.update(existing.migrations)
+            CLASS_TYPES.pop(existing.cls, None)
+        SHAPE_TYPES[tag] = shape_type
+        CLASS_TYPES[cls] = shape_type
+        cls.shape_tag = tag
+        cls.schema_version = version
+        return cls
+    return register
+
+def register_migration(tag, from_version):
+    """
+    Decorator for a function that upgrades a record of a shape type from
+    from_version to from_version + 1. Register it next to the shape class.
+    """
+    def register(migration):
+        shape_type = SHAPE_TYPES.get(tag)
+        if shape_type is None:
+            raise KeyError(f"Shape type '{tag}' must be registered before its migrations")
+        shape_type.migrations[from_version] = migration
+        return migration
+    return register
+
+def load_builtin_shapes():
+    global _builtins_loaded
+    if _builtins_loaded:
+        return
+    _builtins_loaded = True
+    for module in BUILTIN_SHAPE_MODULES:
+        importlib.import_module(module)
+
+def shape_type_for_tag(tag):
+    load_builtin_shapes()
+    return SHAPE_TYPES.get(tag)
+
+def shape_type_for_item(item):
+    # Subclasses of a registered shape serialize as that shape
+    load_builtin_shapes()
+    for cls in type(item).__mro__:
+        shape_type = CLASS_TYPES.get(cls)
+        if shape_type is not None:
+            return shape_type
+    return None
+
+def serialize_items(items):
+    """
+    Returns the records of the given items, skipping items that are not registered shapes.
+    """
+    load_builtin_shapes()
+    types = {}
+    records = []
+    for item in items:
+        cls = type(item)
+        shape_type = types.get(cls, False)
+        if shape_type is False:
+            shape_type = types[cls] = shape_type_for_item(item)
+        if shape_type is None:
+            continue
+        data = item.to_dict()
+        data[VERSION_KEY] = shape_type.version
+        records.append(data)
+    return records
+
+def serialize_item(item):
+    records = serialize_items((item,))
+    return records[0] if records else None
+
+def snapshot_items(items):
+    """
+    Takes the plain state of the given items as (shape type, values) pairs that can
+    be handed to another thread. Shapes without snapshot() are stored as records.
+    """
+    load_builtin_shapes()
+    types = {}
+    snapshot = []
+    for item in items:
+        cls = type(item)
+        shape_type = types.get(cls, False)
+        if shape_type is False:
+            shape_type = types[cls] = shape_type_for_item(item)
+        if shape_type is None:
+            continue
+        if hasattr(item, "snapshot"):
+            snapshot.append((shape_type, item.snapshot()))
+        else:
+            data = item.to_dict()
+            data[VERSION_KEY] = shape_type.version
+            snapshot.append((None, data))
+    return snapshot
+
+def records_from_snapshot(snapshot):
+    # Does not touch any item, so it can run on a worker thread
+    records = []
+    for shape_type, values in snapshot:
+        if shape_type is None:
+            # Records still in a mapped file are decoded now
+            records.append(values if isinstance(values, dict) else values.record())
+            continue
+        data = {"type": shape_type.tag}
+        data.update(zip(shape_type.cls.SNAPSHOT_FIELDS, values))
+        data[VERSION_KEY] = shape_type.version
+        records.append(data)
+    return records
+
+def snapshot_entry(shape_type, data):
+    """
+    The snapshot entry of a migrated record: its values in SNAPSHOT_FIELDS order,
+    or the record itself when it lacks some of the fields.
+    """
+    fields = getattr(shape_type.cls, "SNAPSHOT_FIELDS", None)
+    if fields is not None and all(field in data for field in fields):
+        return (shape_type, tuple(data[field] for field in fields))
+    data = dict(data)
+    data["type"] = shape_type.tag
+    data[VERSION_KEY] = shape_type.version
+    return (None, data)
+
+def snapshot_from_records(records):
+    # The inverse of records_from_snapshot(), for records read from a file
+    load_builtin_shapes()
+    snapshot = []
+    for data in records:
+        shape_type = record_shape_type(data)
+        if shape_type is not None:
+            snapshot.append(snapshot_entry(shape_type, shape_type.migrate(data)))
+    return snapshot
+
+def record_shape_type(data):
+    # The shape type of a record, None for empty records and unknown types, which loading skips
+    if not data:
+        return None
+    load_builtin_shapes()
+    return SHAPE_TYPES.get(data.get("type", ""))
+
+def deserialize_records(records):
+    """
+    Builds items from records, migrating old records first. Records of unknown
+    types are skipped.
+    """
+    items = []
+    for data in records:
+        shape_type = record_shape_type(data)
+        if shape_type is not None:
+            items.append(shape_type.cls.from_dict(shape_type.migrate(data)))
+    return items
+
+def deserialize_record(data):
+    items = deserialize_records((data,))
+    return items[0] if items else None
+
+def scene_shapes(scene):
+    """
+    The top-level items of a scene in insertion order. A GridScene keeps that order
+    itself, which avoids the z-order sort of QGraphicsScene.items().
+    """
+    top_level_items = getattr(scene, "top_level_items", None)
+    if top_level_items is not None:
+        return top_level_items()
+    return [item for item in reversed(scene.items()) if item.parentItem() is None]
+
+def scene_snapshot(scene):
+    """
+    Snapshot of every shape of a scene's document, including the shapes a
+    virtualized scene has not turned into items.
+    """
+    virtualizer = getattr(scene, "virtualizer", None)
+    if virtualizer is not None:
+        return virtualizer.snapshot()
+    return snapshot_items(scene_shapes(scene))
@@ -2,19 +2,195 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from GUI.GridScene import *
+from GUI.Snapping import snap_item_position
+from Shapes.Registry import register_shape, register_migration
+from Shapes.CachePolicy import adaptive_cache
+from Shapes.BaseShapeItem import rotated_bounds
+from functools import lru_cache
+import math
+
+TEXT_DOCUMENT_MARGIN = 4  # QTextDocument's default margin around the text
+STATIC_TEXT_CACHE_SIZE = 4096  # Laid out labels kept for reuse, identical labels share one entry
+
+@lru_cache(maxsize=64)
+def text_metrics(family, size):
+    font = QFont(family)
+    font.setPointSize(size)
+    return QFontMetricsF(font)
+
+@lru_cache(maxsize=STATIC_TEXT_CACHE_SIZE)
+def static_lines(text, font_description):
+    """
+    The lines of a label as prepared QStaticText, laid out once per text and font.
+    QStaticText draws a single line, so every line gets its own.
+    """
+    font = QFont()
+    font.fromString(font_description)
+    lines = []
+    for line in text.split("\n"):
+        static = QStaticText(line)
+        static.setTextFormat(Qt.TextFormat.PlainText)
+        static.prepare(QTransform(), font)
+        lines.append(static)
+    return tuple(lines)
+
+class TextEditor(QGraphicsTextItem):
+    """
+    The editable document of a Text while the user edits it. Closes when it loses
+    focus or on Escape and hands the text back to its label.
+    """
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Escape:
+            self.clearFocus()
+            return
+        super().keyPressEvent(event)
+
+    def focusOutEvent(self, event):
+        super().focusOutEvent(event)
+        label = self.parentItem()
+        # Switching windows or opening a menu keeps the edit going
+        if event.reason() in (Qt.FocusReason.ActiveWindowFocusReason, Qt.FocusReason.PopupFocusReason):
+            return
+        if label is not None:
+            # Removing the editor inside its own focus event is not safe, so wait a turn
+            QTimer.singleShot(0, label.finish_editing)
+
+@register_shape("text", version=2)
+@adaptive_cache
+class Text(QGraphicsItem):
+    """
+    A label drawn from cached QStaticText lines. The QTextDocument needed for
+    editing only exists while the user edits the label after a double click.
+    """
+    SNAPSHOT_FIELDS = ("x", "y", "text_string", "rotation", "text_color", "pos_x", "pos_y", "font_family", "font_size")
 
-class Text(QGraphicsTextItem):
     def __init__(self, x, y):
-        super().__init__("Hello World!")
-        self.setTextInteractionFlags(Qt.TextInteractionFlag.TextEditorInteraction)
-        self.setDefaultTextColor(Qt.GlobalColor.blue)
-        font = QFont()
-        font.setPointSize(18)
-        self.setFont(font)
+        super().__init__()
+        self.plain_text = "Hello World!"
+        self.text_color = QColor(Qt.GlobalColor.blue)
+        self.text_font = QFont()
+        self.text_font.setPointSize(18)
+        self.editor = None
+        self.lines = None  # Laid out on first use
+        self.line_height = 0
+        self.size = QSizeF()
         self.setPos(x, y)
-        # Use setFlag, not setFlags, for QGraphicsTextItem
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
+
+    def layout_text(self):
+        # The text or font changed, the lines are laid out again when next needed
+        self.prepareGeometryChange()
+        self.lines = None
+        self.update()
+
+    def ensure_layout(self):
+        # Same extent as a QGraphicsTextItem showing the text, margins included
+        if self.lines is not None:
+            return
+        self.lines = static_lines(self.plain_text, self.text_font.toString())
+        self.line_height = math.ceil(QFontMetricsF(self.text_font).height())
+        width = max(line.size().width() for line in self.lines)
+        self.size = QSizeF(width + 2 * TEXT_DOCUMENT_MARGIN, self.line_height * len(self.lines) + 2 * TEXT_DOCUMENT_MARGIN)
+
+    def toPlainText(self):
+        if self.editor is not None:
+            return self.editor.toPlainText()
+        return self.plain_text
+
+    def setPlainText(self, text):
+        if self.editor is not None:
+            self.editor.setPlainText(text)
+        if text != self.plain_text:
+            self.plain_text = text
+            self.layout_text()
+
+    def font(self):
+        return QFont(self.text_font)
+
+    def setFont(self, font):
+        if self.editor is not None:
+            self.editor.setFont(font)
+        self.text_font = QFont(font)
+        self.layout_text()
+
+    def defaultTextColor(self):
+        return QColor(self.text_color)
+
+    def setDefaultTextColor(self, color):
+        if self.editor is not None:
+            self.editor.setDefaultTextColor(color)
+        self.text_color = QColor(color)
+        self.update()
+
+    def pen(self):
+        return QPen(self.text_color)
+
+    def setPen(self, pen):
+        self.setDefaultTextColor(pen.color())
+
+    def boundingRect(self):
+        self.ensure_layout()
+        return QRectF(QPointF(0, 0), self.size)
+
+    def paint(self, painter, option, widget=None):
+        if self.editor is None:
+            self.ensure_layout()
+            painter.setFont(self.text_font)
+            painter.setPen(self.text_color)
+            top = TEXT_DOCUMENT_MARGIN
+            for line in self.lines:
+                painter.drawStaticText(QPointF(TEXT_DOCUMENT_MARGIN, top), line)
+                top += self.line_height
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(QPen(option.palette.windowText(), 0, Qt.PenStyle.DashLine))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRect(self.boundingRect())
+
+    def mouseDoubleClickEvent(self, event):
+        if self.editor is not None:
+            super().mouseDoubleClickEvent(event)
+            return
+        self.start_editing()
+        # Put the cursor where the label was clicked
+        layout = self.editor.document().documentLayout()
+        cursor = self.editor.textCursor()
+        cursor.setPosition(max(0, layout.hitTest(event.pos(), Qt.HitTestAccuracy.FuzzyHit)))
+        self.editor.setTextCursor(cursor)
+
+    def start_editing(self):
+        if self.editor is not None or self.scene() is None:
+            return
+        editor = TextEditor(self.plain_text)
+        editor.setFont(self.text_font)
+        editor.setDefaultTextColor(self.text_color)
+        editor.setTextInteractionFlags(Qt.TextInteractionFlag.TextEditorInteraction)
+        editor.setParentItem(self)
+        self.editor = editor
+        self.update()
+        editor.setFocus(Qt.FocusReason.MouseFocusReason)
+
+    def finish_editing(self):
+        if self.editor is None or (self.scene() is not None and self.scene().focusItem() is self.editor):
+            return
+        text = self.close_editor()
+        if text != self.plain_text:
+            self.setPlainText(text)
+            notify_geometry_changed(self)
+            notify_item_changed(self)
+
+    def close_editor(self):
+        # Drops the document and returns its text, the label paints from static text again
+        editor, self.editor = self.editor, None
+        text = editor.toPlainText()
+        scene = editor.scene()
+        if scene is not None:
+            # The editor never went through GridScene.addItem, so it skips its bookkeeping
+            QGraphicsScene.removeItem(scene, editor)
+        editor.setParentItem(None)
+        self.update()
+        return text
 
     def rect(self):
         # Return a QRectF for compatibility
@@ -24,33 +200,22 @@ class Text(QGraphicsTextItem):
         # Move the text to the new position
         self.setPos(rect.left(), rect.top())
 
-    def setPen(self, pen):
-        self.setDefaultTextColor(pen.color())
-
     def itemChange(self, change, value):
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            # Snap the new position to the grid
-            x, y = value.x(), value.y()
-            snapped_x, snapped_y = GridScene.snap_to_grid(x, y)
-            return GridScene.snap_to_grid(x, y)
+            # Snap the new position to the grid and to other shapes
+            return snap_item_position(self, value)
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            notify_geometry_changed(self)
         return super().itemChange(change, value)
-    
-    def to_dict(self):
+
+    def snapshot(self):
         pos = self.pos()
         font = self.font()
-        return {
-            "type": "text",
-            "x": self.rect().x(),
-            "y": self.rect().y(),
-            "text_string": self.toPlainText(),
-            "rotation": self.rotation(),
-            "border_color": self.pen().color().name(),
-            "border_width": self.pen().widthF(),
-            "pos_x": pos.x(),
-            "pos_y": pos.y(),
-            "font_family": font.family(),
-            "font_size": font.pointSize()
-        }
+        return (pos.x(), pos.y(), self.toPlainText(), self.rotation(), self.defaultTextColor().name(),
+                pos.x(), pos.y(), font.family(), font.pointSize())
+
+    def to_dict(self):
+        return {"type": "text", **dict(zip(self.SNAPSHOT_FIELDS, self.snapshot()))}
 
     @classmethod
     def from_dict(cls, data):
@@ -58,17 +223,39 @@ class Text(QGraphicsTextItem):
             data.get("x", 0),
             data.get("y", 0)
         )
-        rect.setPlainText(data.get("text_string", "Hello World!"))
-        rect.setRotation(data.get("rotation", 0))
-        rect.setPen(QPen(
-            QColor(data.get("border_color", "#000000")),
-            data.get("border_width", 3)
-        ))
-        # Restore font
-        font = rect.font()
+        rect.apply_dict(data)
+        return rect
+
+    def apply_dict(self, data):
+        if self.editor is not None:
+            # The record wins over an edit in progress
+            self.close_editor()
+        # Text and font are laid out once, together
+        self.plain_text = data.get("text_string", "Hello World!")
+        font = self.text_font
         font.setFamily(data.get("font_family", font.family()))
         font.setPointSize(data.get("font_size", font.pointSize()))
-        rect.setFont(font)
-        # Set the scene position after creation
-        rect.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
-        return rect
\ No newline at end of file
+        self.layout_text()
+        self.setRotation(data.get("rotation", 0))
+        self.setDefaultTextColor(QColor(data.get("text_color", "#0000ff")))
+        # Set the scene position after the text
+        self.setPos(data.get("pos_x", 0), data.get("pos_y", 0))
+
+    @classmethod
+    def record_bounds(cls, data):
+        # Measured with the record's font like layout_text(), margins included
+        metrics = text_metrics(data.get("font_family", ""), data.get("font_size", 18))
+        lines = data.get("text_string", "Hello World!").split("\n")
+        margin = 2 * TEXT_DOCUMENT_MARGIN
+        rect = QRectF(0, 0, max(metrics.horizontalAdvance(line) for line in lines) + margin,
+                      math.ceil(metrics.height()) * len(lines) + margin)
+        return rotated_bounds(rect, data.get("rotation", 0)).translated(data.get("pos_x", 0), data.get("pos_y", 0))
+
+@register_migration("text", 1)
+def migrate_text_v1(data):
+    # Version 1 stored the text color as a border color, with an unused border width
+    data = dict(data)
+    data.pop("border_width", None)
+    if "border_color" in data:
+        data["text_color"] = data.pop("border_color")
+    return data
@@ -0,0 +1,265 @@
+from PyQt6.QtWidgets import *
+from PyQt6.QtCore import *
+from PyQt6.QtGui import *
+from collections import OrderedDict
+import hashlib
+import math
+import os
+import threading
+
+TILE_SIZE = 256  # Tile edge in pixels of its level
+DEEP_ZOOM_MIN_PIXELS = 64 << 20  # Images with more pixels than this are shown from a tile pyramid
+TILE_CACHE_BYTES = 128 << 20  # Decoded tiles kept in memory across all pyramids
+TILE_FORMAT = "png"
+
+_pyramids = {}  # (path, mtime, size) -> TilePyramid, or None for images below the threshold
+
+def pyramid_cache_folder():
+    folder = os.path.join(QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation), "tile-pyramids")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def tile_pyramid(path):
+    """
+    Returns the TilePyramid of an image too large to decode whole, or None for
+    other images and unreadable files. Only the image header is read.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _pyramids:
+        size = QImageReader(path).size()
+        large = size.isValid() and size.width() * size.height() > DEEP_ZOOM_MIN_PIXELS
+        _pyramids[key] = TilePyramid(path, size, key) if large else None
+    return _pyramids[key]
+
+class TileCache:
+    """
+    LRU cache of decoded tiles with a byte budget, shared by every pyramid.
+    """
+    def __init__(self, budget=TILE_CACHE_BYTES):
+        self.budget = budget
+        self.used = 0
+        self.entries = OrderedDict()  # (pyramid id, level, column, row) -> pixmap
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        pixmap = self.entries.get(key)
+        if pixmap is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return pixmap
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def insert(self, key, pixmap):
+        if key in self.entries:
+            return
+        self.entries[key] = pixmap
+        self.used += pixmap.width() * pixmap.height() * 4
+        while self.used > self.budget and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.used -= evicted.width() * evicted.height() * 4
+
+    def set_budget(self, budget):
+        self.budget = max(0, int(budget))
+        while self.used > self.budget and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.used -= evicted.width() * evicted.height() * 4
+
+    def clear(self):
+        self.entries.clear()
+        self.used = 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "used": self.used, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses}
+
+TILE_CACHE = TileCache()
+
+class TileSignals(QObject):
+    loaded = pyqtSignal(object, QImage)
+
+class TileTask(QRunnable):
+    """
+    Produces one tile on a pool worker: from the disk cache when the tile was
+    built before, otherwise by decoding just that region of the source at the
+    tile's level and writing it to the disk cache.
+    """
+    def __init__(self, pyramid, key):
+        super().__init__()
+        self.pyramid = pyramid
+        self.key = key
+        self.canceled = threading.Event()
+        self.signals = TileSignals()
+
+    def run(self):
+        if self.canceled.is_set():
+            return
+        _, level, column, row = self.key
+        path = self.pyramid.tile_path(level, column, row)
+        image = QImage(path) if os.path.exists(path) else QImage()
+        if image.isNull():
+            image = self.pyramid.render_tile(level, column, row)
+            if not image.isNull():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = path + ".tmp"
+                if image.save(temp_path, TILE_FORMAT.upper()):
+                    os.replace(temp_path, path)
+        if not self.canceled.is_set():
+            self.signals.loaded.emit(self.key, image)
+
+class TileLoader(QObject):
+    """
+    Loads tiles on its own thread pool, newest requests first, so tiles of the
+    current view are not stuck behind tiles of a view the user zoomed past.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.tasks = {}  # Tile key -> running TileTask
+        self.waiting = {}  # Tile key -> {owner: callback}
+        self.sequence = 0
+
+    def request(self, pyramid, key, owner, callback):
+        self.waiting.setdefault(key, {})[owner] = callback
+        if key in self.tasks:
+            return
+        task = TileTask(pyramid, key)
+        task.signals.loaded.connect(self.loaded)
+        self.tasks[key] = task
+        self.sequence = (self.sequence + 1) % (1 << 30)
+        self.pool.start(task, self.sequence)
+
+    def cancel_owner(self, owner):
+        # Drop the requests of an item that left its scene
+        for key in list(self.waiting):
+            callbacks = self.waiting[key]
+            callbacks.pop(owner, None)
+            if not callbacks:
+                del self.waiting[key]
+                task = self.tasks.pop(key, None)
+                if task is not None:
+                    task.canceled.set()
+
+    def loaded(self, key, image):
+        self.tasks.pop(key, None)
+        callbacks = self.waiting.pop(key, {})
+        if image.isNull() or not callbacks:
+            return
+        TILE_CACHE.insert(key, QPixmap.fromImage(image))
+        for callback in callbacks.values():
+            callback(key)
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+_loader = None
+
+def tile_loader():
+    global _loader
+    if _loader is None:
+        _loader = TileLoader(QCoreApplication.instance())
+    return _loader
+
+class TilePyramid:
+    """
+    A resolution pyramid of one large image. Level 0 is the full resolution and
+    every level above halves it, up to a level that fits into a single tile.
+    Tiles are built lazily on first use and kept in a disk cache, so an image is
+    only ever decoded region by region.
+    """
+    def __init__(self, path, size, key):
+        self.path = path
+        self.size = size
+        self.id = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+        self.top_level = max(0, math.ceil(math.log2(max(size.width(), size.height()) / TILE_SIZE)))
+        self.folder = os.path.join(pyramid_cache_folder(), self.id)
+
+    def level_size(self, level):
+        scale = 1 << level
+        return QSize(max(1, math.ceil(self.size.width() / scale)), max(1, math.ceil(self.size.height() / scale)))
+
+    def level_for(self, device_scale):
+        # The coarsest level that still has at least one pixel per device pixel
+        if device_scale <= 0:
+            return self.top_level
+        return max(0, min(self.top_level, math.floor(math.log2(1 / device_scale))))
+
+    def tile_path(self, level, column, row):
+        return os.path.join(self.folder, str(level), f"{column}_{row}.{TILE_FORMAT}")
+
+    def render_tile(self, level, column, row):
+        # Runs on a worker, QImageReader decodes only the clipped region where the format allows it
+        size = self.level_size(level)
+        clip = QRect(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE).intersected(QRect(QPoint(0, 0), size))
+        reader = QImageReader(self.path)
+        if level:
+            reader.setScaledSize(size)
+            reader.setScaledClipRect(clip)
+        else:
+            reader.setClipRect(clip)
+        return reader.read()
+
+    def paint(self, painter, target, exposed, device_scale, owner, callback):
+        """
+        Paints the tiles that intersect exposed, with target being the item rect the
+        whole image is shown in. Tiles that are not loaded yet are requested and
+        stand in with the finest coarser tile already in memory.
+        """
+        source_scale = target.width() / self.size.width()  # Item units per source pixel
+        level = self.level_for(device_scale * source_scale)
+        size = self.level_size(level)
+        unit = source_scale * (1 << level)  # Item units per pixel of the level
+        area = exposed.intersected(target).translated(-target.topLeft())
+        if area.isEmpty():
+            return
+        first_column = max(0, int(area.left() / unit) // TILE_SIZE)
+        first_row = max(0, int(area.top() / unit) // TILE_SIZE)
+        last_column = min((size.width() - 1) // TILE_SIZE, int(area.right() / unit) // TILE_SIZE)
+        last_row = min((size.height() - 1) // TILE_SIZE, int(area.bottom() / unit) // TILE_SIZE)
+        loader = tile_loader()
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                key = (self.id, level, column, row)
+                pixmap = TILE_CACHE.get(key)
+                if pixmap is not None:
+                    rect = QRectF(column * TILE_SIZE * unit, row * TILE_SIZE * unit,
+                                  pixmap.width() * unit, pixmap.height() * unit)
+                    painter.drawPixmap(rect.translated(target.topLeft()), pixmap, QRectF(pixmap.rect()))
+                    continue
+                loader.request(self, key, owner, callback)
+                self._paint_fallback(painter, target, level, column, row, source_scale)
+
+    def _paint_fallback(self, painter, target, level, column, row, source_scale):
+        for parent_level in range(level + 1, self.top_level + 1):
+            shift = parent_level - level
+            key = (self.id, parent_level, column >> shift, row >> shift)
+            pixmap = TILE_CACHE.peek(key)
+            if pixmap is None:
+                continue
+            # The part of the parent tile that covers this tile, in the parent's pixels
+            span = TILE_SIZE >> shift
+            source = QRectF((column - ((column >> shift) << shift)) * span,
+                            (row - ((row >> shift) << shift)) * span, span, span).intersected(QRectF(pixmap.rect()))
+            if source.isEmpty():
+                return
+            unit = source_scale * (1 << parent_level)
+            rect = QRectF(((column >> shift) * TILE_SIZE + source.left()) * unit,
+                          ((row >> shift) * TILE_SIZE + source.top()) * unit,
+                          source.width() * unit, source.height() * unit)
+            painter.drawPixmap(rect.translated(target.topLeft()), pixmap, source)
+            return
+
+    def tile_rect(self, key, target):
+        # Item rect covered by a tile, for repainting just that part once it arrives
+        _, level, column, row = key
+        unit = target.width() / self.size.width() * (1 << level)
+        return QRectF(column * TILE_SIZE * unit, row * TILE_SIZE * unit,
+                      TILE_SIZE * unit, TILE_SIZE * unit).translated(target.topLeft())
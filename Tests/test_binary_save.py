@@ -0,0 +1,45 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from GUI.BinaryFormat import BinaryDocument, write_binary
+from GUI.SceneSaver import SaveTask
+from GUI.Virtualizer import MAPPED, VirtualDocument
+from Shapes.Rectangle import Rectangle
+from Shapes.Registry import serialize_items
+
+app = QApplication.instance() or QApplication([])  # Kept for the whole module, shared caches are its children
+
+def test_save_over_the_mapped_document(tmp_path, monkeypatch):
+    path = str(tmp_path / "diagram.dgb")
+    write_binary(path, serialize_items(Rectangle(i * 20, 0, 10, 10) for i in range(6)))
+    document = VirtualDocument()
+    document.map_binary(BinaryDocument(path))
+    for entry_ids, _ in document.mapped_batches():
+        document.index_mapped(entry_ids)
+    document.remove(1)
+    assert document.maps(path)
+
+    snapshot = document.snapshot()
+    saved_ids = [entry_id for entry_id, entry in enumerate(snapshot) if entry is not None]
+    snapshot = [snapshot[entry_id] for entry_id in saved_ids]
+    task = SaveTask(path, snapshot, replace=False)
+    written = []
+    task.signals.written.connect(written.append)
+    task.run()
+    assert len(written) == 1 and os.path.exists(written[0])
+
+    # Windows refuses to replace a file that is still mapped
+    replace = os.replace
+    def checked_replace(source, target):
+        assert document.source.map is None
+        replace(source, target)
+    monkeypatch.setattr(os, "replace", checked_replace)
+    document.replace_source(written[0], saved_ids)
+
+    assert len(document.source) == 5
+    assert document.entries[4] is MAPPED
+    assert [document.record(entry_id)["x"] for entry_id in saved_ids] == [0, 40, 60, 80, 100]
+    document.source.close()
@@ -0,0 +1,65 @@
+import json
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QStandardPaths
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QApplication
+
+from GUI.GridScene import GridScene
+from GUI.Journal import Journal, replay_journal
+from GUI.GridView import GridView
+from GUI.Virtualizer import SceneVirtualizer, VirtualDocument
+from Shapes.Rectangle import Rectangle
+from Shapes.Registry import deserialize_records, serialize_items
+
+QStandardPaths.setTestModeEnabled(True)
+app = QApplication.instance() or QApplication([])  # Kept for the whole module, shared caches are its children
+
+def write_document(path):
+    # The loader skips the empty record and the unknown type, so the ids of the
+    # shapes after them are not their positions in the file
+    records = serialize_items(Rectangle(i * 20, 0, 10, 10) for i in range(4))
+    records[1:1] = [{}, {"type": "unknown-shape"}]
+    path.write_text(json.dumps(records))
+    return records
+
+def recorded(journal):
+    journal.close()
+    return replay_journal(journal.path)
+
+def test_replay_skips_the_records_loading_skipped(tmp_path):
+    path = tmp_path / "diagram.json"
+    records = write_document(path)
+    scene = GridScene()
+    journal = Journal(scene)
+    for item in deserialize_records(records):
+        scene.addItem(item)
+    journal.start(str(path))
+    items = scene.top_level_items()
+    items[2].setBrush(QColor("#123456"))
+    scene.item_changed(items[2])
+    scene.removeItem(items[3])
+    replayed = recorded(journal)
+    assert [record["x"] for record in replayed] == [0, 20, 40]
+    assert replayed[2]["fill_color"] == "#123456"
+
+def test_replay_skips_the_holes_of_a_virtual_document(tmp_path):
+    path = tmp_path / "diagram.json"
+    records = write_document(path)
+    document = VirtualDocument()
+    document.extend(records)
+    assert document.holes() == [1, 2]
+    scene = GridScene()
+    view = GridView()
+    view.setScene(scene)
+    journal = Journal(scene)
+    virtualizer = SceneVirtualizer(scene, view, document)
+    journal.start(str(path))
+    item = virtualizer.items[4]
+    item.setBrush(QColor("#123456"))
+    scene.item_changed(item)
+    replayed = recorded(journal)
+    assert [record["x"] for record in replayed] == [0, 20, 40, 60]
+    assert replayed[2]["fill_color"] == "#123456"
@@ -0,0 +1,84 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt6.QtCore import QStandardPaths
+from PyQt6.QtWidgets import QApplication
+
+from GUI.BatchEdit import batch_writer
+from GUI.Virtualizer import SceneVirtualizer, VirtualDocument
+from Shapes.Rectangle import Rectangle
+from Shapes.Registry import serialize_items
+
+QStandardPaths.setTestModeEnabled(True)
+app = QApplication.instance() or QApplication([])  # Kept for the whole module, shared caches are its children
+
+def write_pending(window):
+    # Large batch edits are written over several event loop passes, and the panel reads them back the same way
+    writer = batch_writer(window.scene)
+    while writer.pending() or window.right_dock.reading is not None:
+        app.processEvents()
+
+@pytest.fixture
+def window(monkeypatch):
+    from diagram_editor import MainWindow
+    monkeypatch.setattr("GUI.MenuBar.recoverable_journal", lambda: None)
+    window = MainWindow()
+    app.processEvents()
+    yield window
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+
+def test_undo_and_redo_refresh_the_panel(window):
+    items = [Rectangle(i * 20, 0, 10, 10) for i in range(3)]
+    for item in items:
+        window.scene.addItem(item)
+        item.setSelected(True)
+    dock = window.right_dock
+    dock.width_slider.setValue(40)
+    window.menuBar().undo()
+    assert items[0].rect().width() == 10
+    assert dock.width_slider.value() == 10
+    window.menuBar().redo()
+    assert dock.width_slider.value() == 40
+
+def test_panel_edits_the_unmaterialized_band_selection(window):
+    document = VirtualDocument()
+    document.extend(serialize_items(Rectangle(i * 20, 0, 10, 10) for i in range(3000)))
+    virtualizer = SceneVirtualizer(window.scene, window.view, document)
+    virtualizer.begin_band(False)
+    virtualizer.select_rect(document.bounds)
+    far = len(document) - 1
+    assert far not in virtualizer.items
+    dock = window.right_dock
+    assert len(dock.entry_ids) == len(document)
+    dock.width_slider.setValue(40)
+    write_pending(window)
+    assert document.record(far)["width"] == 40
+    window.menuBar().undo()
+    write_pending(window)
+    assert document.record(far)["width"] == 10
+    assert dock.width_slider.value() == 10
+    virtualizer.detach()
+
+def test_large_edits_are_written_in_slices(window):
+    items = [Rectangle((i % 100) * 12, (i // 100) * 12, 10, 10) for i in range(10000)]
+    with window.scene.bulk_update():
+        for item in items:
+            window.scene.addItem(item)
+    window.scene.select_items(items)
+    dock = window.right_dock
+    dock.width_slider.setValue(40)
+    assert batch_writer(window.scene).pending()
+    write_pending(window)
+    assert all(item.rect().width() == 40 for item in items)
+    # An undo while the redo is still being written restores the items the redo reached
+    window.menuBar().undo()
+    window.menuBar().redo()
+    assert batch_writer(window.scene).pending()
+    window.menuBar().undo()
+    write_pending(window)
+    assert all(item.rect().width() == 10 for item in items)
+    assert dock.width_slider.value() == 10
@@ -0,0 +1,71 @@
+import json
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt6.QtCore import QElapsedTimer, QStandardPaths
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+from Shapes.Rectangle import Rectangle
+from Shapes.Registry import serialize_items
+
+QStandardPaths.setTestModeEnabled(True)
+app = QApplication.instance() or QApplication([])  # Kept for the whole module, shared caches are its children
+
+@pytest.fixture
+def window(monkeypatch):
+    from diagram_editor import MainWindow
+    monkeypatch.setattr("GUI.MenuBar.recoverable_journal", lambda: None)
+    window = MainWindow()
+    window.warnings = []
+    monkeypatch.setattr(QMessageBox, "warning", lambda parent, title, text: window.warnings.append(text))
+    app.processEvents()
+    for i in range(5):
+        window.scene.addItem(Rectangle(i * 20, 0, 10, 10))
+    yield window
+    window.menuBar().cancel_load()
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+
+def open_file(window, monkeypatch, path):
+    monkeypatch.setattr(QFileDialog, "getOpenFileName", lambda *args, **kwargs: (str(path), ""))
+    window.menuBar().open_file()
+    return window.menuBar().loader
+
+def wait_for(loader, timeout_ms=10000):
+    clock = QElapsedTimer()
+    clock.start()
+    while loader.timer.isActive() and clock.elapsed() < timeout_ms:
+        QApplication.processEvents()
+    assert not loader.timer.isActive()
+
+def write_diagram(path, count):
+    records = serialize_items(Rectangle(i % 100 * 12, i // 100 * 12, 10, 10) for i in range(count))
+    path.write_text(json.dumps(records))
+
+def test_malformed_file_keeps_the_open_document(window, monkeypatch, tmp_path):
+    old_items = window.scene.top_level_items()
+    path = tmp_path / "truncated.json"
+    write_diagram(path, 20)
+    path.write_text(path.read_text()[:-40])
+    wait_for(open_file(window, monkeypatch, path))
+    assert window.warnings
+    assert window.scene.top_level_items() == old_items
+
+def test_cancel_keeps_the_open_document(window, monkeypatch, tmp_path):
+    old_items = window.scene.top_level_items()
+    path = tmp_path / "diagram.json"
+    write_diagram(path, 5000)
+    loader = open_file(window, monkeypatch, path)
+    loader.step()
+    loader.cancel()
+    assert not window.warnings
+    assert window.scene.top_level_items() == old_items
+
+def test_load_replaces_the_open_document(window, monkeypatch, tmp_path):
+    path = tmp_path / "diagram.json"
+    write_diagram(path, 300)
+    wait_for(open_file(window, monkeypatch, path))
+    assert len(window.scene.top_level_items()) == 300
@@ -0,0 +1,80 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt6.QtCore import QPointF, QStandardPaths
+from PyQt6.QtGui import QBrush, QColor
+from PyQt6.QtWidgets import QAbstractGraphicsShapeItem, QApplication
+
+import GUI.Virtualizer
+from GUI.BatchEdit import batch_writer, edit_items, undo_stack
+from GUI.GridScene import DragTransaction, GridScene
+from GUI.GridView import GridView
+from GUI.Virtualizer import SceneVirtualizer, VirtualDocument
+from Shapes.Rectangle import Rectangle
+from Shapes.Registry import serialize_items
+
+QStandardPaths.setTestModeEnabled(True)
+app = QApplication.instance() or QApplication([])  # Kept for the whole module, shared caches are its children
+
+SHAPES = 3000
+
+def write_pending(scene):
+    # Large batch edits are written over several event loop passes
+    writer = batch_writer(scene)
+    while writer.pending():
+        app.processEvents()
+
+@pytest.fixture
+def virtualizer():
+    # A row of shapes far wider than the viewport, so most of them are never materialized
+    document = VirtualDocument()
+    document.extend(serialize_items(Rectangle(i * 20, 0, 10, 10) for i in range(SHAPES)))
+    scene = GridScene()
+    view = GridView()
+    view.setScene(scene)
+    virtualizer = SceneVirtualizer(scene, view, document)
+    virtualizer.begin_band(False)
+    virtualizer.select_rect(document.bounds)
+    yield virtualizer
+    view.setScene(None)
+
+def test_group_drag_moves_the_unmaterialized_selection(virtualizer):
+    scene, document = virtualizer.scene, virtualizer.document
+    far = SHAPES - 1
+    assert far not in virtualizer.items
+    far_bounds = document.index.rects[far]
+    item = next(iter(virtualizer.ids))
+    start = item.pos()
+    scene.drag_transaction = transaction = DragTransaction(scene, QPointF(0, 0))
+    transaction.move_to(QPointF(100, 50))
+    transaction.finish()
+    scene.drag_transaction = None
+    assert item.pos() == start + QPointF(100, 50)
+    record = document.record(far)
+    assert (record["pos_x"], record["pos_y"]) == (100, 50)
+    assert document.index.rects[far] == far_bounds.translated(100, 50)
+
+def test_property_edit_reaches_the_unmaterialized_selection(virtualizer):
+    scene, document = virtualizer.scene, virtualizer.document
+    far = SHAPES - 1
+    old_color = document.record(far)["fill_color"]
+    edit_items(scene, "Fill Color", scene.selectedItems(), QAbstractGraphicsShapeItem.brush,
+               QAbstractGraphicsShapeItem.setBrush, QBrush(QColor("#123456")), entry_ids=virtualizer.selected_ids())
+    write_pending(scene)
+    assert document.record(far)["fill_color"] == "#123456"
+    assert all(item.brush().color().name() == "#123456" for item in virtualizer.ids)
+    assert far not in virtualizer.items
+    undo_stack(scene).undo()
+    write_pending(scene)
+    assert document.record(far)["fill_color"] == old_color
+    assert all(item.brush().color().name() == old_color for item in virtualizer.ids)
+
+def test_item_queries_materialize_at_most_the_cap(virtualizer, monkeypatch):
+    monkeypatch.setattr(GUI.Virtualizer, "MAX_MATERIALIZED", 100)
+    materialized = len(virtualizer.items)
+    virtualizer.scene.items_in_rect(virtualizer.document.bounds)
+    assert len(virtualizer.items) == materialized
+    virtualizer.scene.items_at(QPointF(5, 5))
+    assert 0 in virtualizer.items
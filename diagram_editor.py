@@ -6,6 +6,7 @@ import sys
 
 # Custom class imports
 from GUI.GridScene import GridScene
+from GUI.BatchEdit import batch_writer, undo_stack
 from GUI.GridView import GridView
 from GUI.MenuBar import *
 from GUI.LeftDock import LeftDock
@@ -41,11 +42,45 @@ class MainWindow(QMainWindow):
 
         # Connect selection change to update properties panel
         self.scene.selectionChanged.connect(self.on_selection_changed)
+        # Undo and redo change the values the properties panel shows
+        undo_stack(self.scene).indexChanged.connect(self.on_undo_index_changed)
+        batch_writer(self.scene).applied.connect(self.on_batch_applied)
+        self.panel_stale = False
+
+        # Journal the edits for crash recovery once the window is up
+        QTimer.singleShot(0, menu_bar.start_journal)
 
     def on_selection_changed(self):
         selected_items = self.scene.selectedItems()
-        if selected_items:
-            self.right_dock.set_controls(selected_items[0])
+        # A virtualized scene's band selection also holds shapes that are not materialized
+        virtualizer = self.scene.virtualizer
+        if virtualizer is not None and (selected_items or virtualizer.selected):
+            self.right_dock.set_selection(selected_items, virtualizer)
+        elif selected_items:
+            self.right_dock.set_selection(selected_items)
+
+    def on_undo_index_changed(self):
+        # The panel's own edits already show their values
+        if self.right_dock.editing:
+            return
+        if batch_writer(self.scene).pending():
+            # Large steps are written over several frames, the panel shows them once written
+            self.panel_stale = True
+        else:
+            self.refresh_panel()
+
+    def on_batch_applied(self):
+        if self.panel_stale:
+            self.panel_stale = False
+            self.refresh_panel()
+
+    def refresh_panel(self):
+        # The panel follows every change of a selection, a step that kept it only changes the values shown
+        selection = self.right_dock.selection
+        if self.scene.virtualizer is None and selection and selection[0].isSelected():
+            self.right_dock.refresh()
+        else:
+            self.on_selection_changed()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -3,7 +3,10 @@ from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from GUI.MenuBar import MenuBar
 from GUI.GridScene import *
-from Shapes.Image import Image
+from GUI.Snapping import snap_point
+from Shapes.Image import SCALE_IDLE_MS, Image
+from Shapes.ImageDecoder import image_decoder
+from Shapes.ImageWatcher import image_watcher
 import sys
 
 class MainWindow(QMainWindow):
@@ -59,6 +62,11 @@ class MainWindow(QMainWindow):
         self.scale_slider.setValue(int(self.shape.rect().width()))
         layout.addWidget(self.scale_slider)
         self.scale_slider.valueChanged.connect(self.update_image_size)
+        self.scale_slider.sliderReleased.connect(self.commit_image_size)
+        # Resamples the image once the scale slider rests
+        self.scale_timer = QTimer(self)
+        self.scale_timer.setSingleShot(True)
+        self.scale_timer.timeout.connect(self.commit_image_size)
 
         # Image file selector
         layout.addWidget(QLabel("Image File:"))
@@ -70,8 +78,10 @@ class MainWindow(QMainWindow):
         self.image_preview = QLabel()
         self.image_preview.setFixedSize(120, 120)
         self.image_preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview_request = None
         self.update_image_preview(self.shape.image_path)
         layout.addWidget(self.image_preview)
+        image_watcher().image_changed.connect(self.linked_image_changed)
 
         dock.setWidget(slider_widget)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, dock)
@@ -79,10 +89,15 @@ class MainWindow(QMainWindow):
     def update_image_size(self):
         scale = self.scale_slider.value()
         # Snap the current position to the grid
-        x, y = GridScene.snap_to_grid(self.shape.pos().x(), self.shape.pos().y())
-        self.shape.setPos(x, y)
+        self.shape.setPos(snap_point(self.shape.pos()))
+        # Stretch the current pixels while the slider moves, resample once it rests
+        self.shape.preview_scale(scale, scale)
+        self.scale_timer.start(SCALE_IDLE_MS)
+
+    def commit_image_size(self):
+        self.scale_timer.stop()
+        scale = self.scale_slider.value()
         self.shape.set_image(self.shape.image_path, scale, scale)
-        self.update_image_preview(self.shape.image_path)
 
     def select_image_file(self):
         file_dialog = QFileDialog(self)
@@ -97,13 +112,23 @@ class MainWindow(QMainWindow):
                 self.update_image_preview(image_path)
 
     def update_image_preview(self, image_path):
-        pixmap = QPixmap(image_path)
+        # Decoded on a worker, a newer preview request replaces an older pending one
+        if self.preview_request is not None:
+            self.preview_request.cancel()
+        self.preview_request = image_decoder().request(image_path, self.image_preview.width(),
+                                                       self.image_preview.height(), self.image_preview_decoded)
+
+    def image_preview_decoded(self, pixmap):
+        self.preview_request = None
         if not pixmap.isNull():
-            pixmap = pixmap.scaled(self.image_preview.width(), self.image_preview.height(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
             self.image_preview.setPixmap(pixmap)
         else:
             self.image_preview.clear()
 
+    def linked_image_changed(self, path):
+        if path == self.shape.image_path:
+            self.update_image_preview(path)
+
     def rotate_shape(self, angle):
         # Get the center of the shape item's bounding rect in item coordinates
         rect = self.shape.boundingRect()
@@ -4,6 +4,7 @@ from PyQt6.QtGui import *
 from GUI.MenuBar import *
 from GUI.GridScene import *
 from Shapes.Text import Text
+from GUI.FontCatalogue import FontPicker
 import sys
 
 class MainWindow(QMainWindow):
@@ -59,7 +60,7 @@ class MainWindow(QMainWindow):
 
         # Font family controls
         layout.addWidget(QLabel("Font:"))
-        self.font_combo = QFontComboBox()
+        self.font_combo = FontPicker()
         self.font_combo.setCurrentFont(self.shape.font())
         layout.addWidget(self.font_combo)
         self.font_combo.currentFontChanged.connect(self.update_text_font)